@@ -3,15 +3,16 @@
 from environs import Env
 from loguru import logger
 
-from sqlitedb.sqlite import SQLiteDatabase
-from telegram.replier import Telegram
-
 project_name = "project-name"
 env = Env()
 env.read_env()
-db = SQLiteDatabase()
 if __name__ == "__main__":
     if env.str("BOT_TOKEN", None):
-        Telegram(project_name, env).bot_listener()
+        # Django and Telethon make up most of the startup time, only import them when the bot runs
+        from telegram.replier import Telegram
+
+        bot = Telegram(project_name, env)
+        bot.database.log_settings()
+        bot.bot_listener()
     else:
         logger.info("No bot token provided.")
@@ -1,9 +1,86 @@
 #!/usr/bin/env python
+from importlib.util import find_spec
 from pathlib import Path
+from typing import Any
 
 import django
 import environ
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# Tuning applied to each database vendor by every DB_PROFILE, "none", the default, leaves DATABASE_URL untouched.
+# The SQLite transaction_mode and the PostgreSQL pool options need Django 5.1 or later
+DB_PROFILES: dict[str, dict[str, dict[str, Any]]] = {
+    "none": {},
+    "balanced": {
+        "sqlite": {
+            "pragmas": {
+                "journal_mode": "WAL",
+                "synchronous": "NORMAL",
+                "busy_timeout": 5000,
+                "cache_size": -20_000,
+                "mmap_size": 128 * 2**20,
+                "temp_store": "MEMORY",
+            },
+            "transaction_mode": "IMMEDIATE",
+        },
+        "postgresql": {"conn_max_age": 60},
+    },
+    "throughput": {
+        "sqlite": {
+            "pragmas": {
+                "journal_mode": "WAL",
+                "synchronous": "NORMAL",
+                "busy_timeout": 10_000,
+                "cache_size": -64_000,
+                "mmap_size": 2**30,
+                "temp_store": "MEMORY",
+            },
+            "transaction_mode": "IMMEDIATE",
+        },
+        "postgresql": {"conn_max_age": None, "pool": {"min_size": 2, "max_size": 20}},
+    },
+}
+
+
+def apply_db_profile(database: dict[str, Any], profile: str) -> dict[str, Any]:
+    """Tune a database configuration parsed from ``DATABASE_URL`` with one of the ``DB_PROFILES``.
+
+    On SQLite the profile's pragmas run on every new connection through ``init_command``, after any commands
+    already configured. On PostgreSQL connections are kept open for ``conn_max_age`` seconds (forever when
+    None) with health checks, or pooled when the profile asks for a pool and ``psycopg_pool`` is installed.
+    Options set explicitly in ``DATABASE_URL`` win over the profile.
+
+    Args:
+        database (dict): The database configuration.
+        profile (str): Name of the profile.
+
+    Returns
+    -------
+        dict: The tuned database configuration.
+    """
+    if profile not in DB_PROFILES:
+        msg = f"Unknown DB_PROFILE {profile!r}, use one of {', '.join(DB_PROFILES)}"
+        raise ImproperlyConfigured(msg)
+    vendor = next((vendor for vendor in ("sqlite", "postgresql") if vendor in database["ENGINE"]), None)
+    tuning = DB_PROFILES[profile].get(vendor or "")
+    if not tuning:
+        return database
+
+    options = database.setdefault("OPTIONS", {})
+    if vendor == "sqlite":
+        pragmas = ";".join(f"PRAGMA {name}={value}" for name, value in tuning["pragmas"].items())
+        options["init_command"] = ";".join(filter(None, [pragmas, options.get("init_command")]))
+        options.setdefault("transaction_mode", tuning["transaction_mode"])
+        # The Python driver waits this long for locks before SQLite's own busy_timeout applies
+        options.setdefault("timeout", tuning["pragmas"]["busy_timeout"] / 1000)
+    elif tuning.get("pool") and find_spec("psycopg") and find_spec("psycopg_pool"):
+        options.setdefault("pool", tuning["pool"])
+        database["CONN_MAX_AGE"] = 0
+    else:
+        database.setdefault("CONN_MAX_AGE", tuning["conn_max_age"])
+        database.setdefault("CONN_HEALTH_CHECKS", True)
+    return database
 
 
 def init_django() -> None:
@@ -11,23 +88,31 @@ def init_django() -> None:
 
     This function configures the Django settings to use an SQLite3
     database and the `sqlitedb` app. If the settings have already been
-    configured, this function does nothing.
+    configured, this function does nothing. The database is tuned
+    with the opt-in ``DB_PROFILE`` performance profile, see `apply_db_profile`.
     """
+    if settings.configured:
+        return
     env = environ.Env()
     base_dir = Path(__file__).resolve().parent
     environ.Env.read_env(Path(base_dir, ".env"))
 
-    if settings.configured:
-        return
     project_key = env.str("PROJECT_KEY")
+    database = apply_db_profile(env.db("DATABASE_URL"), env.str("DB_PROFILE", default="none"))
     default_cache_url = f"locmemcache://{project_key}?TIMEOUT=86400&KEY_PREFIX=url_bypass"
     settings.configure(
         DEFAULT_AUTO_FIELD="django.db.models.BigAutoField",
         INSTALLED_APPS=[
             "sqlitedb",
         ],
-        DATABASES={"default": env.db("DATABASE_URL")},
+        DATABASES={"default": database},
         CACHES={"default": env.cache("CACHE_URL", default=default_cache_url)},
+        # In-process tier kept in front of the shared cache for hot users
+        USER_CACHE_LOCAL_SIZE=env.int("USER_CACHE_LOCAL_SIZE", default=10_000),
+        USER_CACHE_LOCAL_TTL=env.int("USER_CACHE_LOCAL_TTL", default=60),
+        # Run the hot user queries on aiosqlite/asyncpg instead of the ORM
+        ASYNC_DB=env.bool("ASYNC_DB", default=False),
+        ASYNC_DB_POOL_SIZE=env.int("ASYNC_DB_POOL_SIZE", default=10),
     )
     django.setup()
 
@@ -0,0 +1,68 @@
+"""Compare the ORM and the native async driver on the get_user lookup/create path.
+
+Migrates and uses the database of ``DATABASE_URL``. Run from the project root::
+
+    python -m scripts.bench_async_db --users 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import time
+
+from django.core.management import call_command
+from loguru import logger
+
+from scripts.fakes import make_user
+from sqlitedb.models import User, UserSnapshot, user_cache
+from sqlitedb.sqlite import SQLiteDatabase
+
+
+async def load(ids: range, concurrency: int) -> tuple[float, list[UserSnapshot]]:
+    """Call get_user for every ID with a cold cache and return the elapsed seconds and the snapshots."""
+    user_cache.local.clear()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(telegram_id: int) -> UserSnapshot:
+        async with semaphore:
+            return await User.objects.get_user(make_user(telegram_id))
+
+    started = time.perf_counter()
+    snapshots = await asyncio.gather(*(one(telegram_id) for telegram_id in ids))
+    return time.perf_counter() - started, snapshots
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Create and then fetch users through both paths and check they return the same snapshots."""
+    everyone = range(args.first_id, args.first_id + 2 * args.users)
+    for offset, (label, native) in enumerate((("orm", False), ("native", True))):
+        database = SQLiteDatabase(native=native)
+        ids = range(args.first_id + offset * args.users, args.first_id + (offset + 1) * args.users)
+        for phase in ("create", "fetch"):
+            elapsed, _ = await load(ids, args.concurrency)
+            logger.info(f"{label:>6} {phase:>6}: {len(ids) / elapsed:8.0f} users/sec ({elapsed:.2f}s)")
+        await database.close()
+
+    # Read every user back through both paths, including the ones created by the other path
+    views = {}
+    for label, native in (("orm", False), ("native", True)):
+        database = SQLiteDatabase(native=native)
+        _, views[label] = await load(everyone, args.concurrency)
+        await database.close()
+    logger.info(f"identical snapshots on both paths: {views['orm'] == views['native']}")
+    await User.objects.filter(telegram_id__in=everyone).adelete()
+
+
+def main() -> None:
+    """Parse arguments and run the comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2_000, help="users created per path")
+    parser.add_argument("--concurrency", type=int, default=50, help="lookups in flight")
+    parser.add_argument("--first-id", type=int, default=9_000_000_000, help="first Telegram ID used")
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
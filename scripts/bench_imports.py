@@ -0,0 +1,123 @@
+"""Measure the import time of the bot's entry points and check it against a budget.
+
+Every target is imported in a fresh interpreter with ``python -X importtime``, the fastest of ``--repeat``
+runs is kept. Importing the bot must not import the command modules, they load on their first message.
+``DATABASE_URL`` and ``PROJECT_KEY`` must be set for the modules setting up Django. Run from the project root::
+
+    python -m scripts.bench_imports
+    python -m scripts.bench_imports --budget main=100 telegram.replier=600 --top 15
+
+Exits with status 1 when a target goes over its budget or imports a command module.
+"""
+
+import argparse
+import subprocess
+import sys
+from collections import defaultdict
+from typing import NamedTuple
+
+from loguru import logger
+
+from telegram.commands.base import COMMANDS_PACKAGE
+
+# Milliseconds allowed to import every target, generous enough for a slow CI machine
+DEFAULT_BUDGETS = {"main": 300.0, "telegram.replier": 1200.0}
+
+# Modules of the commands package that aren't command modules
+COMMAND_INFRASTRUCTURE = frozenset({COMMANDS_PACKAGE, f"{COMMANDS_PACKAGE}.base", f"{COMMANDS_PACKAGE}.router"})
+
+
+class Imported(NamedTuple):
+    """One line of ``-X importtime``."""
+
+    module: str
+    depth: int
+    own_us: int
+    cumulative_us: int
+
+
+def parse_budget(value: str) -> tuple[str, float]:
+    """Parse ``module=milliseconds``."""
+    module, _, budget = value.rpartition("=")
+    return module, float(budget)
+
+
+def import_once(target: str) -> list[Imported]:
+    """Import ``target`` in a fresh interpreter and return what it imported, in import order."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode:
+        msg = f"Importing {target} failed:\n{result.stderr[-2000:]}"
+        raise RuntimeError(msg)
+    imported = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line.removeprefix("import time:").split("|")
+        module = name.strip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imported.append(Imported(module, depth, int(own), int(cumulative)))
+    return imported
+
+
+def measure(target: str, repeat: int) -> list[Imported]:
+    """Return the imports of the fastest of ``repeat`` imports of ``target``."""
+    runs = [import_once(target) for _ in range(repeat)]
+    return min(runs, key=lambda imported: sum(module.own_us for module in imported))
+
+
+def report(target: str, imported: list[Imported], top: int) -> float:
+    """Log the heaviest imports of ``target`` and return its total milliseconds."""
+    total = sum(module.own_us for module in imported) / 1000
+    # Top level packages, with the time of everything they imported themselves
+    packages: dict[str, int] = defaultdict(int)
+    for module in imported:
+        packages[module.module.partition(".")[0]] += module.own_us
+    logger.info(f"{target}: {total:.1f}ms, {len(imported)} modules")
+    for package, own_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        logger.info(f"  {own_us / 1000:8.1f}ms {own_us / 1000 / total:6.1%} {package}")
+    return total
+
+
+def main() -> None:
+    """Parse arguments, measure every target and check the budgets."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--budget",
+        type=parse_budget,
+        nargs="*",
+        default=[],
+        help="module=milliseconds, added to or replacing the default budgets",
+    )
+    parser.add_argument("--repeat", type=int, default=5, help="imports per target, the fastest is kept")
+    parser.add_argument("--top", type=int, default=10, help="heaviest packages listed per target")
+    args = parser.parse_args()
+
+    budgets = DEFAULT_BUDGETS | dict(args.budget)
+    passed = True
+    for target, budget in budgets.items():
+        imported = measure(target, args.repeat)
+        total = report(target, imported, args.top)
+        eager = sorted(
+            module.module
+            for module in imported
+            if module.module.startswith(f"{COMMANDS_PACKAGE}.") and module.module not in COMMAND_INFRASTRUCTURE
+        )
+        if eager:
+            logger.error(f"{target} imports command modules at startup: {', '.join(eager)}")
+            passed = False
+        if total > budget:
+            logger.error(f"{target} takes {total:.1f}ms to import, over its budget of {budget:.0f}ms")
+            passed = False
+        else:
+            logger.info(f"{target} is within its budget of {budget:.0f}ms")
+    if not passed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""Compare the uncached markdown parser against the parse cache and MarkdownTemplate.
+
+Run from the project root::
+
+    python -m scripts.bench_markdown --iterations 20000
+"""
+
+import argparse
+import timeit
+from typing import TYPE_CHECKING, Any
+
+from environs import Env
+from loguru import logger
+
+from telegram.commands.help import HelpCommand
+from telegram.utils import CustomMarkdown, MarkdownTemplate, _parse_markdown
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+def main() -> None:
+    """Time parsing the help text and the /start greeting with each approach."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20_000, help="parses timed per case")
+    args = parser.parse_args()
+
+    uncached = _parse_markdown.__wrapped__
+    help_text = HelpCommand(Env())._get_help_message()  # noqa: SLF001
+    greeting = MarkdownTemplate("Hii👋, **{name}** `{telegram_id}`")
+    names = [f"User {i}" for i in range(args.iterations)]
+
+    cases: dict[str, Callable[[int], Any]] = {
+        "help / uncached": lambda i: uncached(help_text),  # noqa: ARG005
+        "help / cached": lambda i: CustomMarkdown.parse(help_text),  # noqa: ARG005
+        "greeting / uncached": lambda i: uncached(f"Hii👋, **{names[i]}** `{i}`"),
+        "greeting / cached": lambda i: CustomMarkdown.parse(f"Hii👋, **{names[i]}** `{i}`"),
+        "greeting / template": lambda i: greeting.render(name=names[i], telegram_id=i),
+    }
+    for label, case in cases.items():
+        counter = iter(range(args.iterations))
+        seconds = timeit.timeit(lambda: case(next(counter)), number=args.iterations)  # noqa: B023
+        logger.info(f"{label:>20}: {seconds / args.iterations * 1e6:8.3f} us/parse")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Compare routing with one regex handler per command against the CommandRouter lookup.
+
+Run from the project root::
+
+    python -m scripts.bench_router --commands 500
+"""
+
+import argparse
+import re
+import timeit
+
+from loguru import logger
+from telethon import events
+
+from telegram.commands.base import BaseCommand
+from telegram.commands.router import CommandRouter
+
+
+class SyntheticCommand(BaseCommand):
+    """Command whose name and pattern are chosen at runtime."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name  # type: ignore[misc]
+
+    def get_pattern(self) -> str:
+        return f"^/{self.name}(.*)"
+
+    async def handle(self, event: events.NewMessage.Event) -> None:
+        """Do nothing."""
+
+    def get_usage(self) -> str:
+        return f"/{self.name}"
+
+
+def main() -> None:
+    """Time how long it takes to find the handler of a message with both approaches."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--commands", type=int, default=500, help="number of registered commands")
+    parser.add_argument("--iterations", type=int, default=20_000, help="messages routed per case")
+    args = parser.parse_args()
+
+    commands = [SyntheticCommand(f"command{i}") for i in range(args.commands)]
+    patterns = [re.compile(command.get_pattern()) for command in commands]
+    router = CommandRouter()
+    for command in commands:
+        router.add(command)
+
+    def per_command_regex(text: str) -> None:
+        # Telethon evaluates the pattern of every NewMessage handler against every message
+        for pattern in patterns:
+            pattern.match(text)
+
+    messages = {
+        "first command": f"/{commands[0].name} some args",
+        "last command": f"/{commands[-1].name}@bench_bot some args",
+        "plain text": "hello there, not a command",
+    }
+    for label, text in messages.items():
+        for approach, route in (("regex", per_command_regex), ("router", router.resolve)):
+            seconds = timeit.timeit(lambda: route(text), number=args.iterations)  # noqa: B023
+            logger.info(f"{label:>13} / {approach:<6}: {seconds / args.iterations * 1e6:9.3f} us/message")
+
+
+if __name__ == "__main__":
+    main()
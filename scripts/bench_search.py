@@ -0,0 +1,94 @@
+"""Compare UserManager.search against a ranked substring scan on a large user table.
+
+Migrates the database of ``DATABASE_URL``, fills it with synthetic users up to ``--rows`` and times both
+approaches. ``DATABASE_URL`` must be a scratch database, the script refuses to run until ``--scratch``
+confirms it. Run from the project root::
+
+    DATABASE_URL=sqlite:///search.sqlite3 python -m scripts.bench_search --scratch --rows 1000000
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Case, When
+from loguru import logger
+
+from sqlitedb.models import User
+from sqlitedb.utils import UserType
+
+SYLLABLES = ("ka", "lo", "mi", "ra", "sen", "tor", "vi", "bel", "dan", "qu", "zor", "ish", "pel", "no", "gar")
+
+
+def fake_name(rng: random.Random) -> str:
+    """Return a random two-word name."""
+    return " ".join("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize() for _ in range(2))
+
+
+def fill(rows: int, batch_size: int, seed: int) -> None:
+    """Insert synthetic users until the table holds ``rows`` of them."""
+    rng = random.Random(seed)  # noqa: S311
+    existing = User.objects.count()
+    for start in range(existing, rows, batch_size):
+        users = [
+            User(telegram_id=10**12 + n, name=fake_name(rng), user_type=UserType.USER.value)
+            for n in range(start, min(start + batch_size, rows))
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=batch_size)
+        logger.debug(f"{start + len(users)} users inserted")
+
+
+async def time_queries(args: argparse.Namespace) -> None:
+    """Run every term through both approaches and report the latency."""
+    # Without the index: scan every name, prefix matches first
+    for term in args.terms:
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            found = await User.objects.search(term, limit=args.limit)
+        indexed = (time.perf_counter() - started) / args.repeat
+
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            queryset = User.objects.filter(name__icontains=term)
+            queryset = queryset.annotate(rank=Case(When(name__istartswith=term, then=0), default=1))
+            scanned = [user async for user in queryset.order_by("rank", "id")[: args.limit]]
+        scan = (time.perf_counter() - started) / args.repeat
+
+        logger.info(
+            f"{term!r:>12}: search {indexed * 1000:8.2f}ms ({len(found)} hits), "
+            f"scan {scan * 1000:8.2f}ms ({len(scanned)} hits), {scan / indexed:6.1f}x",
+        )
+
+
+def main() -> None:
+    """Parse arguments, prepare the table and run the comparison."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--scratch",
+        action="store_true",
+        help="confirm DATABASE_URL is a scratch database the synthetic users may be written to",
+    )
+    parser.add_argument("--rows", type=int, default=1_000_000, help="users in the table")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="users inserted per transaction")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each query")
+    parser.add_argument("--limit", type=int, default=20, help="users returned per query")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("terms", nargs="*", default=["zorqu", "belish gar", "Kalomi", "xyzzy", "ka"], help="searches")
+    args = parser.parse_args()
+    if not args.scratch:
+        name = connection.settings_dict["NAME"]
+        parser.error(f"up to {args.rows} users would be written to {name}, pass --scratch if it's a scratch database")
+
+    call_command("migrate", verbosity=0)
+    started = time.perf_counter()
+    fill(args.rows, args.batch_size, args.seed)
+    logger.info(f"{User.objects.count()} users ready in {time.perf_counter() - started:.1f}s")
+    asyncio.run(time_queries(args))
+
+
+if __name__ == "__main__":
+    main()
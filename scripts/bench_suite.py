@@ -0,0 +1,197 @@
+"""Benchmark the bot's hot path offline and compare the results against a saved baseline.
+
+Commands are dispatched end to end through the router to a fake client, users are loaded from a migrated
+SQLite database. The suite clears its cache and creates and deletes users, so it runs on its own scratch
+database in the temporary directory and an in-process cache, whatever ``DATABASE_URL`` and ``CACHE_URL``
+say. ``BENCH_DATABASE_URL`` and ``BENCH_CACHE_URL`` pick other scratch backends. Run from the project root::
+
+    python -m scripts.bench_suite --save bench_baseline.json
+    python -m scripts.bench_suite --compare bench_baseline.json
+
+Baselines depend on the machine and Python version, which are recorded in them: save one on the machine
+comparisons run on, from the commit they're compared against. A comparison exits with status 1 when a case
+got slower than the baseline by more than ``--tolerance``.
+"""
+
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+# Django is configured from the environment when the models are first imported
+os.environ["DATABASE_URL"] = os.environ.get(
+    "BENCH_DATABASE_URL",
+    f"sqlite:///{Path(tempfile.gettempdir(), 'tg-django-bench.sqlite3')}",
+)
+os.environ["CACHE_URL"] = os.environ.get("BENCH_CACHE_URL", "locmemcache://tg-django-bench")
+os.environ.setdefault("PROJECT_KEY", "tg-django-bench")
+
+from django.core.cache import cache
+from django.core.management import call_command
+from environs import Env
+from loguru import logger
+
+from scripts.fakes import FakeClient, FakeEvent, make_user
+from sqlitedb.models import User, user_cache
+from telegram.commands.base import BaseCommand
+from telegram.commands.help import HelpCommand
+from telegram.commands.start import StartCommand
+from telegram.utils import CustomMarkdown, _parse_markdown, get_regex
+
+# Telegram IDs of the users created by the suite, far away from real ones
+FIRST_ID = 9 * 10**14
+
+MARKDOWN = "Hey **there**, see [the docs](https://example.com) and ||spoilers||, `code` and __more__ text."
+
+
+@dataclass
+class Case:
+    """One benchmark: ``op`` is timed ``iterations`` times, after an untimed ``setup`` for every iteration."""
+
+    name: str
+    op: Callable[[int], Any]
+    setup: Callable[[int], Any] | None = None
+    iterations: int = 1000
+
+
+async def time_case(case: Case) -> float:
+    """Return the mean microseconds of one ``op`` of ``case``."""
+    total = 0.0
+    for i in range(case.iterations):
+        if case.setup is not None:
+            case.setup(i)
+        started = time.perf_counter()
+        result = case.op(i)
+        if inspect.isawaitable(result):
+            await result
+        total += time.perf_counter() - started
+    return total / case.iterations * 1e6
+
+
+def forget_users(_: int) -> None:
+    """Drop every cached user, so the next lookup reads the database."""
+    user_cache.local.clear()
+    cache.clear()
+
+
+def build_cases(client: FakeClient, scale: float) -> list[Case]:
+    """Return every case, with their iteration counts multiplied by ``scale``."""
+    hot = make_user(FIRST_ID)
+    regex = re.compile(get_regex())
+    created = iter(range(FIRST_ID + 1, FIRST_ID + 10**9))
+
+    def scaled(iterations: int) -> int:
+        return max(int(iterations * scale), 1)
+
+    async def dispatch(text: str) -> None:
+        await client.emit(FakeEvent(client, text, hot))
+
+    async def get_user(telegram_user: Any) -> None:
+        await User.objects.get_user(telegram_user)
+
+    return [
+        Case("dispatch /start", lambda _: dispatch("/start"), iterations=scaled(2000)),
+        Case("dispatch /help start", lambda _: dispatch("/help start"), iterations=scaled(2000)),
+        Case("dispatch /help", lambda _: dispatch("/help"), iterations=scaled(1000)),
+        Case("dispatch plain text", lambda _: dispatch("hello there"), iterations=scaled(5000)),
+        Case("get_user cache hit", lambda _: get_user(hot), iterations=scaled(5000)),
+        Case("get_user cache miss", lambda _: get_user(hot), setup=forget_users, iterations=scaled(500)),
+        Case("get_user create", lambda _: get_user(make_user(next(created))), iterations=scaled(500)),
+        Case("markdown parse cached", lambda _: CustomMarkdown.parse(MARKDOWN), iterations=scaled(20_000)),
+        Case(
+            "markdown parse uncached",
+            lambda _: CustomMarkdown.parse(MARKDOWN),
+            setup=lambda _: _parse_markdown.cache_clear(),
+            iterations=scaled(2000),
+        ),
+        Case(
+            "markdown unparse",
+            lambda _: CustomMarkdown.unparse(*CustomMarkdown.parse(MARKDOWN)),
+            iterations=scaled(5000),
+        ),
+        Case("get_regex match command", lambda _: regex.match("/unknown_command arg"), iterations=scaled(50_000)),
+        Case("get_regex skip supported", lambda _: regex.match("/start"), iterations=scaled(50_000)),
+    ]
+
+
+async def run(args: argparse.Namespace) -> dict[str, float]:
+    """Run the cases matching ``args.only`` and return their median microseconds per operation."""
+    await User.objects.filter(telegram_id__gte=FIRST_ID).adelete()
+    client = FakeClient()
+    for command in (StartCommand, HelpCommand):
+        command(Env()).add_handler(client)
+    # Handle inline, without the shared queues the bot sets up
+    BaseCommand.dispatcher = BaseCommand.outbox = BaseCommand.limiter = BaseCommand.activity = None
+    # The hot user exists and is cached
+    await User.objects.get_user(make_user(FIRST_ID))
+
+    results = {}
+    for case in build_cases(client, args.scale):
+        if args.only and not any(word in case.name for word in args.only):
+            continue
+        await time_case(case)
+        runs = [await time_case(case) for _ in range(args.repeat)]
+        results[case.name] = statistics.median(runs)
+        logger.info(f"{case.name:>26}: {results[case.name]:10.3f} us/op (+-{statistics.pstdev(runs):.3f})")
+    await User.objects.filter(telegram_id__gte=FIRST_ID).adelete()
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, Any], tolerance: float) -> bool:
+    """Log every case against the baseline and return whether none regressed beyond ``tolerance``."""
+    passed = True
+    for name, current in results.items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            logger.info(f"{name:>26}: new case, no baseline")
+            continue
+        ratio = current / previous
+        regressed = ratio > 1 + tolerance
+        passed &= not regressed
+        verdict = "REGRESSION" if regressed else "ok"
+        logger.info(f"{name:>26}: {previous:10.3f} -> {current:10.3f} us/op ({ratio:6.2f}x) {verdict}")
+    return passed
+
+
+def main() -> None:
+    """Parse arguments, run the suite and save or compare the results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--save", type=Path, help="write the results as a baseline to this file")
+    parser.add_argument("--compare", type=Path, help="fail if slower than the baseline in this file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="slowdown allowed when comparing, 0.25 = 25%%")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case, the median is kept")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier of the iterations per run")
+    parser.add_argument("--only", nargs="*", help="only run cases whose name contains one of these words")
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    logger.info(f"Benchmarking on {os.environ['DATABASE_URL']} and {os.environ['CACHE_URL']}")
+    results = asyncio.run(run(args))
+    if args.save:
+        baseline = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "unit": "us/op",
+            "results": results,
+        }
+        args.save.write_text(json.dumps(baseline, indent=2) + "\n")
+        logger.info(f"Baseline saved to {args.save}")
+    if args.compare and not compare(results, json.loads(args.compare.read_text()), args.tolerance):
+        logger.error(f"Slower than {args.compare} by more than {args.tolerance:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
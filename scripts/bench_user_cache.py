@@ -0,0 +1,53 @@
+"""Compare caching a pickled User model against the compact UserSnapshot record.
+
+Run from the project root::
+
+    python -m scripts.bench_user_cache --iterations 100000
+"""
+
+import argparse
+import pickle
+import timeit
+from typing import TYPE_CHECKING, Any
+
+from django.core.cache.backends.locmem import LocMemCache
+from loguru import logger
+
+from sqlitedb.models import User, UserSnapshot
+from sqlitedb.utils import UserStatus, UserType
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+
+def main() -> None:
+    """Report bytes per entry and cache hit latency for both representations."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=100_000, help="cache hits timed per representation")
+    args = parser.parse_args()
+
+    user = User(
+        id=123_456,
+        telegram_id=5_123_456_789,
+        name="Firstname Lastname",
+        status=UserStatus.ACTIVE.value,
+        user_type=UserType.USER.value,
+        settings={"page_size": 10},
+    )
+    snapshot = UserSnapshot.from_model(user)
+    backend = LocMemCache("bench-user-cache", {})
+    candidates: dict[str, tuple[Any, Callable[[Any], Any]]] = {
+        "model": (user, lambda value: value),
+        "snapshot": (snapshot.to_record(), UserSnapshot.from_record),
+    }
+
+    for label, (value, rebuild) in candidates.items():
+        key = f"user:{label}"
+        backend.set(key, value)
+        size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        seconds = timeit.timeit(lambda: rebuild(backend.get(key)), number=args.iterations)  # noqa: B023
+        logger.info(f"{label:>8}: {size:5d} bytes/entry, {seconds / args.iterations * 1e6:7.3f} us/hit")
+
+
+if __name__ == "__main__":
+    main()
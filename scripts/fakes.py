@@ -0,0 +1,135 @@
+"""Offline stand-ins for the Telethon client and message events."""
+
+import asyncio
+import itertools
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Any, Self
+
+from telethon import events
+from telethon.errors import FloodWaitError
+from telethon.tl.types import User as TelegramUser
+
+
+@dataclass
+class SentMessage:
+    """A message recorded by :class:`FakeClient`."""
+
+    id: int
+    entity: Any
+    message: Any
+    kwargs: dict[str, Any] = field(default_factory=dict)
+
+
+class FakeClient:
+    """Local replacement for ``TelegramClient`` that records sends instead of talking to Telegram.
+
+    Every send takes ``latency`` seconds. ``flood_wait`` decides, per send attempt, whether Telegram answers
+    with FloodWait and for how long.
+    """
+
+    def __init__(
+        self: Self,
+        latency: float = 0.0,
+        flood_wait: Callable[[Any], int] | None = None,
+        username: str = "fake_bot",
+    ) -> None:
+        """Create the client.
+
+        Args:
+            latency: Seconds every send takes.
+            flood_wait: Called with the target entity, returns a FloodWait in seconds or 0 to let the send through.
+            username: Username returned by :meth:`get_me`.
+        """
+        self.latency = latency
+        self.flood_wait = flood_wait
+        self.username = username
+        self.sent: list[SentMessage] = []
+        self.attempts = 0
+        self._ids = itertools.count(1)
+        self._handlers: list[tuple[Any, Any]] = []
+        self.entities: dict[int, Any] = {}
+        self.connected = True
+
+    async def send_message(self: Self, entity: Any, message: Any = "", **kwargs: Any) -> SentMessage:
+        """Record a message, or raise FloodWait if ``flood_wait`` says so."""
+        if not self.connected:
+            msg = "Cannot send requests while disconnected"
+            raise ConnectionError(msg)
+        self.attempts += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        seconds = self.flood_wait(entity) if self.flood_wait else 0
+        if seconds:
+            raise FloodWaitError(request=None, capture=seconds)
+        sent = SentMessage(next(self._ids), entity, message, kwargs)
+        self.sent.append(sent)
+        return sent
+
+    async def disconnect(self: Self) -> None:
+        """Stop sending, like a disconnected client."""
+        self.connected = False
+
+    async def get_me(self: Self) -> TelegramUser:
+        """Return the bot's own user."""
+        return TelegramUser(id=1, bot=True, username=self.username)
+
+    async def get_entity(self: Self, peer: Any) -> Any:
+        """Return an entity previously stored in :attr:`entities`."""
+        peer_id = getattr(peer, "user_id", peer)
+        try:
+            return self.entities[peer_id]
+        except KeyError:
+            msg = f"Could not find the input entity for {peer!r}"
+            raise ValueError(msg) from None
+
+    def add_event_handler(self: Self, callback: Any, event: Any = None) -> None:
+        """Remember a handler so it can be invoked with :meth:`emit`."""
+        self._handlers.append((callback, event))
+
+    async def emit(self: Self, event: "FakeEvent") -> None:
+        """Pass ``event`` to every new message handler, like Telethon does for a new update."""
+        for callback, builder in self._handlers:
+            if builder is None or isinstance(builder, events.NewMessage):
+                await callback(event)
+
+
+class FakeEvent:
+    """Minimal ``events.NewMessage.Event`` with the attributes the bot's handlers use."""
+
+    def __init__(self: Self, client: FakeClient, text: str, sender: TelegramUser, chat_id: int | None = None) -> None:
+        """Create the event.
+
+        Args:
+            client: Client the event arrived on.
+            text: Message text.
+            sender: User who sent the message.
+            chat_id: Chat of the message, defaults to the private chat with ``sender``.
+        """
+        self.client = client
+        self.raw_text = text
+        self.text = text
+        self.sender = self.chat = sender
+        self.sender_id = sender.id
+        self.chat_id = sender.id if chat_id is None else chat_id
+        self.peer_id = self.chat_id
+        self.input_chat = None
+        self.id = next(_message_ids)
+        self.pattern_match: Any = None
+
+    async def get_sender(self: Self) -> TelegramUser:
+        return self.sender
+
+    async def get_chat(self: Self) -> TelegramUser:
+        return self.chat
+
+    async def reply(self: Self, message: Any, **kwargs: Any) -> SentMessage:
+        return await self.client.send_message(self.chat_id, message, reply_to=self.id, **kwargs)
+
+
+_message_ids = itertools.count(1)
+
+
+def make_user(user_id: int, first_name: str = "Bench", last_name: str = "User") -> TelegramUser:
+    """Return a Telegram user entity with the given ID."""
+    return TelegramUser(id=user_id, first_name=first_name, last_name=last_name)
@@ -0,0 +1,301 @@
+"""Replay a stream of updates into the bot's handler stack at a controlled rate and report how it copes.
+
+The stream is synthetic, mixing commands and plain messages from many chats with a share of users the
+database has never seen, or replayed from a file written by ``--record``. Updates go through the same
+router, gate, rate limiter, dispatcher, handlers and outbox as in production, on a local client that
+simulates reply latency and FloodWait errors. Every rate in ``--rates`` is one run, reporting throughput,
+latency percentiles and database and cache operation counts. ``DATABASE_URL`` should be a scratch file and
+the ``DISPATCH_*``, ``OUTBOX_*`` and ``RATE_LIMITS`` settings apply as usual. Run from the project root::
+
+    DATABASE_URL=sqlite:///load.sqlite3 python -m scripts.loadgen --rates 100 200 400 --duration 10
+"""
+
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import random
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from pathlib import Path
+from typing import Any, NamedTuple, Self
+
+from django.core.management import call_command
+from django.db import transaction
+from environs import Env
+from loguru import logger
+
+from scripts.fakes import FakeClient, FakeEvent, make_user
+from sqlitedb.models import User, user_cache
+from sqlitedb.utils import UserType
+from telegram.commands.base import BaseCommand
+from telegram.metrics import process_queries
+from telegram.replier import Telegram
+from telegram.utils import entity_stats
+
+# Telegram IDs of the users created by the load generator, far away from real ones
+FIRST_ID = 8 * 10**14
+
+DEFAULT_MIX = {"/start": 5, "/help": 1, "/help start": 2, "hello there": 2}
+
+
+class Update(NamedTuple):
+    """One message of the stream."""
+
+    sender_id: int
+    text: str
+
+
+class TimedClient(FakeClient):
+    """Fake client recording when the reply to every message was sent."""
+
+    def __init__(self: Self, latency: float, flood_ratio: float, flood_seconds: int, rng: random.Random) -> None:
+        """Create the client.
+
+        Args:
+            latency: Seconds every send takes.
+            flood_ratio: Share of the sends answered with FloodWait.
+            flood_seconds: Seconds of every FloodWait.
+            rng: Source of randomness for the FloodWait errors.
+        """
+        super().__init__(latency, lambda _: flood_seconds if rng.random() < flood_ratio else 0)
+        self.replied_at: dict[int, float] = {}
+
+    async def send_message(self: Self, entity: Any, message: Any = "", **kwargs: Any) -> Any:
+        """Send and record the time the reply went out."""
+        sent = await super().send_message(entity, message, **kwargs)
+        if kwargs.get("reply_to") is not None:
+            self.replied_at[kwargs["reply_to"]] = time.perf_counter()
+        return sent
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    """Parse ``text=weight,...``, e.g. ``/start=5,/help start=1,hello=2``."""
+    mix = {}
+    for item in value.split(","):
+        text, _, weight = item.rpartition("=")
+        mix[text] = float(weight)
+    return mix
+
+
+def synthesize(args: argparse.Namespace, rng: random.Random) -> Iterator[Update]:
+    """Yield an endless stream of updates from the existing users, with a share of new ones."""
+    texts, weights = list(args.mix), list(args.mix.values())
+    new_ids = iter(range(FIRST_ID + args.users, FIRST_ID + 10**12))
+    while True:
+        sender_id = next(new_ids) if rng.random() < args.new_users else FIRST_ID + rng.randrange(args.users)
+        yield Update(sender_id, rng.choices(texts, weights)[0])
+
+
+def replay(path: Path) -> Iterator[Update]:
+    """Yield the updates recorded in ``path`` over and over."""
+    updates = [Update(**json.loads(line)) for line in path.read_text().splitlines() if line.strip()]
+    while True:
+        yield from updates
+
+
+def create_users(count: int, batch_size: int = 10_000) -> None:
+    """Make sure the ``count`` existing users of the stream are in the database."""
+    existing = User.objects.filter(telegram_id__gte=FIRST_ID, telegram_id__lt=FIRST_ID + count).count()
+    if existing == count:
+        return
+    for start in range(0, count, batch_size):
+        users = [
+            User(telegram_id=FIRST_ID + n, name=f"Load User{n}", user_type=UserType.USER.value)
+            for n in range(start, min(start + batch_size, count))
+        ]
+        with transaction.atomic():
+            User.objects.bulk_create(users, ignore_conflicts=True)
+    logger.info(f"{count} existing users ready")
+
+
+def percentiles(values: list[float]) -> str:
+    """Format the p50, p95 and p99 of ``values`` in milliseconds."""
+    if not values:
+        return "n/a"
+    values = sorted(values)
+    picks = [values[min(int(len(values) * q), len(values) - 1)] * 1000 for q in (0.5, 0.95, 0.99)]
+    return "p50 {:.1f}ms, p95 {:.1f}ms, p99 {:.1f}ms".format(*picks)
+
+
+def snapshot() -> dict[str, dict[str, Any]]:
+    """Return a copy of the counters reported for every run."""
+    components: dict[str, Any] = {
+        "db": process_queries,
+        "user cache": user_cache.stats,
+        "user loads": User.objects.user_flight.stats,
+        "entities": entity_stats,
+        "dispatcher": BaseCommand.dispatcher.stats if BaseCommand.dispatcher is not None else None,
+        "outbox": BaseCommand.outbox.stats if BaseCommand.outbox is not None else None,
+        "rate limiter": BaseCommand.limiter.stats if BaseCommand.limiter is not None else None,
+    }
+    return {name: dataclasses.asdict(stats) for name, stats in components.items() if stats is not None}
+
+
+def report_counters(before: dict[str, dict[str, Any]], after: dict[str, dict[str, Any]]) -> None:
+    """Log how much every counter moved during the run."""
+    for name, counters in after.items():
+        moved = []
+        for field, value in counters.items():
+            if isinstance(value, int | float) and not field.startswith("max"):
+                delta = value - before[name][field]
+                moved.append(f"{field}={delta:.3f}" if isinstance(delta, float) else f"{field}={delta}")
+        logger.info(f"  {name:>12}: {', '.join(moved)}")
+
+
+class Load:
+    """Emits the stream and records when every update arrived and was handled."""
+
+    def __init__(self: Self, client: TimedClient, stream: Iterator[Update], rng: random.Random) -> None:
+        """Create the load.
+
+        Args:
+            client: Client the updates are emitted on.
+            stream: Updates to emit.
+            rng: Source of randomness for entity cache misses.
+        """
+        self.client = client
+        self.stream = stream
+        self.rng = rng
+        self.arrived: dict[int, float] = {}
+        self.handled_at: dict[int, float] = {}
+        self.lag = 0.0
+
+    def reset(self: Self) -> None:
+        """Forget the timings of the previous run."""
+        self.arrived.clear()
+        self.handled_at.clear()
+        self.client.replied_at.clear()
+        self.lag = 0.0
+
+    def track(self: Self, handle: Callable[[Any], Awaitable[None]]) -> Callable[[Any], Awaitable[None]]:
+        """Wrap a command handler to record when it finished with every update."""
+
+        async def tracked(event: Any) -> None:
+            try:
+                await handle(event)
+            finally:
+                self.handled_at[event.id] = time.perf_counter()
+
+        return tracked
+
+    def make_event(self: Self, update: Update, entity_misses: float) -> FakeEvent:
+        """Build the event of ``update``, without its entity for a share ``entity_misses`` of them."""
+        sender = make_user(update.sender_id)
+        event = FakeEvent(self.client, update.text, sender)
+        if self.rng.random() < entity_misses:
+            event.chat = None
+            self.client.entities[update.sender_id] = sender
+        return event
+
+    async def emit(self: Self, rate: float, duration: float, entity_misses: float) -> int:
+        """Emit updates at ``rate`` per second for ``duration`` seconds, each handled in its own task.
+
+        Returns
+        -------
+            The number of commands emitted
+        """
+        tasks = set()
+        commands = 0
+        count = int(rate * duration)
+        started = time.perf_counter()
+        for i in range(count):
+            delay = started + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.lag = max(self.lag, -delay)
+            event = self.make_event(next(self.stream), entity_misses)
+            commands += event.raw_text.startswith("/")
+            self.arrived[event.id] = time.perf_counter()
+            # Telethon hands every update to its own task when sequential_updates is off
+            task = asyncio.create_task(self.client.emit(event))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        return commands
+
+
+async def drain() -> None:
+    """Wait for the queued updates to be handled and their replies sent."""
+    if BaseCommand.dispatcher is not None:
+        await BaseCommand.dispatcher.close()
+    if BaseCommand.outbox is not None:
+        await BaseCommand.outbox.close()
+
+
+async def run(args: argparse.Namespace) -> None:
+    """Start the handler stack on the fake client and run the stream at every rate."""
+    rng = random.Random(args.seed)  # noqa: S311
+    client = TimedClient(args.latency, args.flood_ratio, args.flood_seconds, rng)
+    bot = Telegram("loadgen", Env(), client=client)
+    bot.register_handlers()
+    await bot.start()
+    stream = replay(args.replay) if args.replay else synthesize(args, rng)
+    if args.record:
+        recorded = [next(stream) for _ in range(int(sum(args.rates) * args.duration))]
+        args.record.write_text("".join(json.dumps(update._asdict()) + "\n" for update in recorded))
+        logger.info(f"Recorded {len(recorded)} updates to {args.record}")
+        stream = iter(recorded)
+
+    load = Load(client, stream, rng)
+    # Commands are created on their first message, create them all before timing their handlers
+    BaseCommand.router.load_all()
+    for command in BaseCommand.router.get_routes().values():
+        command.handle = load.track(command.handle)  # type: ignore[assignment]
+    try:
+        for rate in args.rates:
+            load.reset()
+            before = snapshot()
+            started = time.perf_counter()
+            commands = await load.emit(rate, args.duration, args.entity_misses)
+            await drain()
+            # Throughput of the handlers, the replies may keep draining longer because of flood limits
+            busy = max(load.handled_at.values(), default=started) - started
+
+            handled = [load.handled_at[i] - arrived for i, arrived in load.arrived.items() if i in load.handled_at]
+            replied = [client.replied_at[i] - arrived for i, arrived in load.arrived.items() if i in client.replied_at]
+            logger.info(
+                f"{rate:.0f} updates/s offered for {args.duration:.0f}s: {len(load.arrived)} emitted, {commands} "
+                f"commands, {len(handled)} handled in {busy:.1f}s ({len(handled) / max(busy, 1e-9):.1f}/s), "
+                f"{len(replied)} replied, intake lag up to {load.lag * 1000:.0f}ms",
+            )
+            logger.info(f"  handler latency {percentiles(handled)}")
+            logger.info(f"  reply latency   {percentiles(replied)}")
+            report_counters(before, snapshot())
+    finally:
+        await bot.stop()
+
+
+def main() -> None:
+    """Parse arguments, prepare the users and run the load."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rates", type=float, nargs="+", default=[50, 100, 200], help="updates per second, per run")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    parser.add_argument("--users", type=int, default=10_000, help="existing users, one private chat each")
+    parser.add_argument("--new-users", type=float, default=0.05, help="share of updates from first-time users")
+    parser.add_argument("--entity-misses", type=float, default=0.0, help="share of updates without their entity")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="texts and weights, e.g. /start=5,hi=1")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds every reply takes to send")
+    parser.add_argument("--flood-ratio", type=float, default=0.0, help="share of sends answered with FloodWait")
+    parser.add_argument("--flood-seconds", type=int, default=3, help="seconds of every FloodWait")
+    parser.add_argument("--outbox-rate", type=float, help="replies per second across chats, OUTBOX_GLOBAL_RATE")
+    parser.add_argument("--record", type=Path, help="write the synthetic stream to this file")
+    parser.add_argument("--replay", type=Path, help="replay the stream recorded in this file")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.outbox_rate:
+        os.environ["OUTBOX_GLOBAL_RATE"] = os.environ["OUTBOX_GLOBAL_BURST"] = str(args.outbox_rate)
+    call_command("migrate", verbosity=0)
+    create_users(args.users)
+    try:
+        asyncio.run(run(args))
+    finally:
+        deleted, _ = User.objects.filter(telegram_id__gte=FIRST_ID + args.users).delete()
+        logger.info(f"Deleted {deleted} users created by the run")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Summarize the slowest handlers and stages recorded by the profiling mode.
+
+Reads the stage breakdowns and cProfile dumps written under ``PROFILE_DIR`` when the bot runs with
+``PROFILE_SAMPLE_RATE`` set. Run from the project root::
+
+    python -m scripts.profile_report --dir profiles --top 10
+"""
+
+import argparse
+import json
+import pstats
+import statistics
+from collections import defaultdict
+from pathlib import Path
+from typing import Any
+
+from loguru import logger
+
+from telegram.profiling import STAGES_FILE
+
+
+def load(directory: Path) -> list[dict[str, Any]]:
+    """Return the breakdowns of the sampled updates, oldest rotated file first."""
+    records: list[dict[str, Any]] = []
+    for path in (directory / f"{STAGES_FILE}.1", directory / STAGES_FILE):
+        if path.exists():
+            with path.open() as file:
+                records.extend(json.loads(line) for line in file if line.strip())
+    return records
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Return the value below which ``fraction`` of the sorted ``values`` fall."""
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def report_commands(records: list[dict[str, Any]]) -> None:
+    """Log the latency of every command, slowest p95 first."""
+    by_command: dict[str, list[float]] = defaultdict(list)
+    for record in records:
+        by_command[record["command"]].append(record["seconds"])
+    logger.info(f"{'command':>16} {'updates':>8} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9}")
+    latencies = {command: sorted(seconds) for command, seconds in by_command.items()}
+    for command, seconds in sorted(latencies.items(), key=lambda item: -percentile(item[1], 0.95)):
+        logger.info(
+            f"{command:>16} {len(seconds):8} {statistics.median(seconds) * 1000:9.2f} "
+            f"{percentile(seconds, 0.95) * 1000:9.2f} {seconds[-1] * 1000:9.2f}",
+        )
+
+
+def report_stages(records: list[dict[str, Any]]) -> None:
+    """Log where the handlers spent their time, by stage, largest share first."""
+    totals: dict[str, float] = defaultdict(float)
+    calls: dict[str, int] = defaultdict(int)
+    for record in records:
+        for name, seconds in record["stages"].items():
+            totals[name] += seconds
+            calls[name] += record["calls"][name]
+        if record.get("query_seconds") is not None:
+            totals["db queries"] += record["query_seconds"]
+            calls["db queries"] += record["queries"]
+    handled = sum(record["seconds"] for record in records)
+    logger.info(f"{'stage':>16} {'calls':>8} {'total ms':>10} {'mean ms':>9} {'share':>7}")
+    for name, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+        logger.info(
+            f"{name:>16} {calls[name]:8} {seconds * 1000:10.2f} {seconds / max(calls[name], 1) * 1000:9.3f} "
+            f"{seconds / handled:7.1%}",
+        )
+
+
+def report_slowest(records: list[dict[str, Any]], directory: Path, top: int, functions: int) -> None:
+    """Log the slowest updates with their stages, and the hottest functions of their dumps."""
+    for record in sorted(records, key=lambda record: -record["seconds"])[:top]:
+        stages = ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in record["stages"].items())
+        logger.info(f"/{record['command']} took {record['seconds'] * 1000:.1f}ms: {stages or 'no stages'}")
+        dump = record.get("dump")
+        if dump and functions and (directory / dump).exists():
+            # Function -> (primitive calls, calls, own time, cumulative time, callers)
+            entries = pstats.Stats(str(directory / dump)).stats  # type: ignore[attr-defined]
+            logger.info(f"  {dump}, by cumulative time:")
+            hottest = sorted(entries.items(), key=lambda entry: -entry[1][3])[:functions]
+            for (path, line, name), (_, calls, own, cumulative, _) in hottest:
+                logger.info(f"    {cumulative * 1000:9.2f}ms {own * 1000:9.2f}ms own {calls:7} {name} {path}:{line}")
+
+
+def main() -> None:
+    """Parse arguments and summarize the profiles."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", type=Path, default=Path("profiles"), help="PROFILE_DIR of the bot")
+    parser.add_argument("--command", help="only report updates of this command")
+    parser.add_argument("--top", type=int, default=10, help="slowest updates listed")
+    parser.add_argument("--functions", type=int, default=15, help="functions listed per dump, 0 to skip dumps")
+    args = parser.parse_args()
+
+    records = load(args.dir)
+    if args.command:
+        records = [record for record in records if record["command"] == args.command]
+    if not records:
+        logger.info(f"No profiled updates in {args.dir}")
+        return
+    logger.info(f"{len(records)} profiled updates")
+    report_commands(records)
+    report_stages(records)
+    report_slowest(records, args.dir, args.top, args.functions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""Caching helpers for hot user lookups."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+from typing import Any, Generic, NamedTuple, Self, TypeVar
+
+from django.core.cache import cache as default_cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+T = TypeVar("T")
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+@dataclass
+class SingleFlightStats:
+    """Counters describing how many calls a :class:`SingleFlight` saved.
+
+    Attributes
+    ----------
+        calls (int): Total number of calls made through the group.
+        executions (int): Number of calls that actually ran the wrapped function.
+        coalesced (int): Number of calls that piggybacked on an execution already in flight.
+    """
+
+    calls: int = 0
+    executions: int = 0
+    coalesced: int = 0
+
+
+class SingleFlight(Generic[T]):
+    """Coalesce concurrent calls for the same key into a single execution.
+
+    The first caller for a key becomes the leader and runs the function. Every caller that arrives while
+    the leader is still running awaits the leader's result instead of starting its own execution. Exceptions
+    of the leader are raised to every caller, but if the leader is cancelled one of the followers runs the
+    function again.
+    """
+
+    def __init__(self: Self) -> None:
+        self._in_flight: dict[Hashable, asyncio.Future[T]] = {}
+        self.stats = SingleFlightStats()
+
+    async def do(self: Self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """Run ``func`` for ``key`` unless a call for the same key is already running.
+
+        Args:
+            key: Key identifying the work, e.g. a Telegram ID.
+            func: Zero-argument coroutine function producing the result.
+
+        Returns
+        -------
+            The result of the (possibly shared) execution.
+        """
+        self.stats.calls += 1
+        while (future := self._in_flight.get(key)) is not None:
+            self.stats.coalesced += 1
+            try:
+                # Shield so a cancelled follower doesn't cancel the result shared with everyone else
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                task = asyncio.current_task()
+                if not future.cancelled() or (task is not None and task.cancelling()):
+                    raise
+                # The leader was cancelled, the first follower to resume runs the function in its place
+                self.stats.coalesced -= 1
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        self.stats.executions += 1
+        try:
+            result = await func()
+        except Exception as exc:
+            future.set_exception(exc)
+            # Mark the exception as retrieved in case nobody else was waiting for it
+            future.exception()
+            raise
+        except BaseException:
+            # Cancelled, the followers retry rather than fail with it
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    def __len__(self: Self) -> int:
+        """Return the number of keys currently in flight."""
+        return len(self._in_flight)
+
+
+@dataclass
+class LRUCacheStats:
+    """Counters describing the behaviour of an :class:`LRUCache`.
+
+    Attributes
+    ----------
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups for keys that were absent or expired.
+        evictions (int): Entries dropped because the cache was full.
+        expirations (int): Entries dropped because their TTL elapsed.
+    """
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_ratio(self: Self) -> float:
+        """Return the fraction of lookups that were hits."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LRUCache(Generic[K, V]):
+    """Size-bounded, TTL-aware in-process least-recently-used cache.
+
+    Expired entries are dropped lazily when they are looked up or when they reach the cold end of the LRU
+    order, so no background sweeping is needed.
+    """
+
+    def __init__(self: Self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic) -> None:
+        """Create an empty cache.
+
+        Args:
+            maxsize: Maximum number of entries kept; the least recently used entry is evicted beyond it.
+            ttl: Default time to live of an entry, in seconds.
+            clock: Monotonic clock used for expiry, replaceable for benchmarks.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self.stats = LRUCacheStats()
+
+    def get(self: Self, key: K) -> V | None:
+        """Return the cached value for ``key`` or None on a miss."""
+        entry = self._data.get(key)
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._data[key]
+            self.stats.expirations += 1
+            self.stats.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self: Self, key: K, value: V, ttl: float | None = None) -> None:
+        """Store ``value`` under ``key``, evicting the least recently used entry if the cache is full."""
+        self._data[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            _, (expires_at, _) = self._data.popitem(last=False)
+            if expires_at <= self._clock():
+                self.stats.expirations += 1
+            else:
+                self.stats.evictions += 1
+
+    def delete(self: Self, key: K) -> None:
+        """Drop ``key`` from the cache if present."""
+        self._data.pop(key, None)
+
+    def clear(self: Self) -> None:
+        """Drop every entry."""
+        self._data.clear()
+
+    def __len__(self: Self) -> int:
+        """Return the number of entries, including ones that expired but were not dropped yet."""
+        return len(self._data)
+
+
+def _identity(value: Any) -> Any:
+    return value
+
+
+@dataclass
+class TieredCacheStats:
+    """Counters describing which tier answered the lookups of a :class:`TieredCache`.
+
+    Attributes
+    ----------
+        local_hits (int): Lookups answered from process memory.
+        backend_hits (int): Lookups answered from the shared backend.
+        misses (int): Lookups neither tier could answer.
+    """
+
+    local_hits: int = 0
+    backend_hits: int = 0
+    misses: int = 0
+
+
+class CacheStamp(NamedTuple):
+    """Versions observed by a :meth:`TieredCache.lookup`, used to refuse stale fills.
+
+    Attributes
+    ----------
+        version (int): Version of the key in the shared backend at lookup time.
+        epoch (int): In-process invalidation counter at lookup time.
+    """
+
+    version: int
+    epoch: int
+
+
+class TieredCache:
+    """Two-tier cache: an in-process :class:`LRUCache` in front of a shared Django cache backend.
+
+    Hot entries are served from process memory without any network I/O, while the backend (Redis,
+    memcached, ...) is still shared by every worker. Keys are namespaced so different kinds of records
+    never collide in the backend.
+
+    Every key has a version counter in the backend and records are stamped with the version that was current
+    when the value was read from the source of truth. :meth:`invalidate` bumps the counter, so a record
+    filled from data read before a write is never served afterwards, even if the fill lands after the
+    invalidation. Other processes may keep serving their in-process copy for at most the local TTL.
+    """
+
+    def __init__(
+        self: Self,
+        namespace: str,
+        local: LRUCache[Hashable, Any],
+        backend: BaseCache | None = None,
+        dumps: Callable[[Any], Any] | None = None,
+        loads: Callable[[Any], Any] | None = None,
+    ) -> None:
+        """Create the cache.
+
+        Args:
+            namespace: Prefix for keys in the shared backend, e.g. ``"user"``.
+            local: The in-process first tier.
+            backend: The shared second tier, defaults to ``CACHES["default"]``.
+            dumps: Converts a value into the compact record stored in the backend.
+            loads: Rebuilds a value from a backend record, returning None for records it can't read.
+        """
+        self.namespace = namespace
+        self.local = local
+        self.backend = backend if backend is not None else default_cache
+        self.dumps = dumps or _identity
+        self.loads = loads or _identity
+        self._epoch = 0
+        self.stats = TieredCacheStats()
+
+    def make_key(self: Self, ident: Hashable) -> str:
+        """Return the namespaced backend key for ``ident``."""
+        return f"{self.namespace}:{ident}"
+
+    def make_version_key(self: Self, ident: Hashable) -> str:
+        """Return the namespaced backend key holding the version counter of ``ident``."""
+        return f"{self.namespace}:ver:{ident}"
+
+    def lookup(self: Self, ident: Hashable) -> tuple[Any, CacheStamp | None]:
+        """Return the value for ``ident`` from the first tier that has it, or None.
+
+        Returns
+        -------
+            A ``(value, stamp)`` pair. On a miss, pass ``stamp`` to :meth:`set` along with the freshly loaded
+            value so the fill is discarded if the key was invalidated in the meantime.
+        """
+        value = self.local.get(ident)
+        if value is not None:
+            self.stats.local_hits += 1
+            return value, None
+
+        epoch = self._epoch
+        key, version_key = self.make_key(ident), self.make_version_key(ident)
+        found = self.backend.get_many([key, version_key])
+        version = found.get(version_key, 0)
+        stamped = found.get(key)
+        if stamped is not None and stamped[0] == version:
+            value = self.loads(stamped[1])
+            if value is not None:
+                self.local.set(ident, value)
+                self.stats.backend_hits += 1
+                return value, None
+        self.stats.misses += 1
+        return None, CacheStamp(version, epoch)
+
+    def get(self: Self, ident: Hashable) -> Any:
+        """Return the value for ``ident`` from the first tier that has it, or None."""
+        return self.lookup(ident)[0]
+
+    def set(
+        self: Self,
+        ident: Hashable,
+        value: Any,
+        stamp: CacheStamp | None = None,
+        timeout: float | object | None = DEFAULT_TIMEOUT,
+    ) -> None:
+        """Store ``value`` for ``ident`` in both tiers.
+
+        Args:
+            ident: Identifier of the value.
+            value: The value to store.
+            stamp: Stamp returned by the :meth:`lookup` that missed; the current version is used when omitted.
+            timeout: Backend timeout, defaults to the backend's own.
+        """
+        if stamp is None:
+            stamp = CacheStamp(self.backend.get(self.make_version_key(ident), 0), self._epoch)
+        # Something was invalidated in this process since the lookup, the value might predate it
+        if stamp.epoch == self._epoch:
+            self.local.set(ident, value)
+        self.backend.set(self.make_key(ident), (stamp.version, self.dumps(value)), timeout)
+
+    def invalidate(self: Self, ident: Hashable) -> int:
+        """Retire every cached copy of ``ident`` by bumping its version.
+
+        Returns
+        -------
+            The new version of ``ident``.
+        """
+        self._epoch += 1
+        self.local.delete(ident)
+        version_key = self.make_version_key(ident)
+        try:
+            version = self.backend.incr(version_key)
+        except ValueError:
+            # First invalidation of this key, unless another process beat us to creating the counter
+            version = 1 if self.backend.add(version_key, 1, timeout=None) else self.backend.incr(version_key)
+        self.backend.delete(self.make_key(ident))
+        return int(version)
+
+    def write_through(
+        self: Self,
+        ident: Hashable,
+        value: Any,
+        timeout: float | object | None = DEFAULT_TIMEOUT,
+    ) -> None:
+        """Replace every cached copy of ``ident`` with the freshly written ``value``."""
+        version = self.invalidate(ident)
+        self.set(ident, value, CacheStamp(version, self._epoch), timeout)
+
+    def delete(self: Self, ident: Hashable) -> None:
+        """Drop ``ident`` from both tiers."""
+        self.invalidate(ident)
@@ -6,9 +6,27 @@ from django.db.models import Lookup
 
 
 class Like(Lookup):  # type: ignore[misc]
+    r"""Case-insensitive LIKE, with ``\`` escaping the wildcards of the pattern.
+
+    ``ILIKE`` only exists on PostgreSQL. SQLite's ``LIKE`` is already case-insensitive, other databases
+    compare both sides upper-cased.
+    """
+
     lookup_name = "ilike"
 
     def as_sql(self, compiler: Any, connection: Any) -> Any:
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        params = lhs_params + rhs_params
+        return f"UPPER({lhs}) LIKE UPPER({rhs})", params
+
+    def as_sqlite(self, compiler: Any, connection: Any) -> Any:
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        params = lhs_params + rhs_params
+        return f"{lhs} LIKE {rhs} ESCAPE '\\'", params
+
+    def as_postgresql(self, compiler: Any, connection: Any) -> Any:
         lhs, lhs_params = self.process_lhs(compiler, connection)
         rhs, rhs_params = self.process_rhs(compiler, connection)
         params = lhs_params + rhs_params
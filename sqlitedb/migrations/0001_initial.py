@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name="User",
+            fields=[
+                ("id", models.AutoField(primary_key=True, serialize=False)),
+                ("name", models.CharField(blank=True, max_length=255)),
+                ("telegram_id", models.BigIntegerField(unique=True)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("active", "ACTIVE"),
+                            ("suspended", "SUSPENDED"),
+                            ("temporarily banned", "TEMP_BANNED"),
+                        ],
+                        default="active",
+                        max_length=20,
+                    ),
+                ),
+                ("joining_date", models.DateTimeField(auto_now_add=True)),
+                ("last_updated", models.DateTimeField(auto_now=True)),
+                ("settings", models.JSONField(default=dict)),
+                (
+                    "user_type",
+                    models.CharField(
+                        choices=[("user", "USER"), ("channel", "CHANNEL"), ("group", "GROUP")],
+                        max_length=20,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "user",
+            },
+        ),
+    ]
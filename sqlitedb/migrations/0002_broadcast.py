@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sqlitedb", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Broadcast",
+            fields=[
+                ("id", models.AutoField(primary_key=True, serialize=False)),
+                ("message", models.TextField()),
+                ("statuses", models.JSONField(default=list)),
+                ("user_types", models.JSONField(default=list)),
+                ("last_user_id", models.IntegerField(default=0)),
+                ("sent", models.IntegerField(default=0)),
+                ("failed", models.IntegerField(default=0)),
+                ("blocked", models.IntegerField(default=0)),
+                (
+                    "state",
+                    models.CharField(
+                        choices=[("running", "RUNNING"), ("done", "DONE")],
+                        default="running",
+                        max_length=20,
+                    ),
+                ),
+                ("elapsed", models.FloatField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("last_updated", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "db_table": "broadcast",
+            },
+        ),
+        migrations.AlterField(
+            model_name="user",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("active", "ACTIVE"),
+                    ("suspended", "SUSPENDED"),
+                    ("temporarily banned", "TEMP_BANNED"),
+                    ("blocked", "BLOCKED"),
+                ],
+                default="active",
+                max_length=20,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["status", "user_type", "id"], name="user_status_type_id_idx"),
+        ),
+    ]
@@ -0,0 +1,13 @@
+from django.db import migrations
+
+from sqlitedb.search import create_search_index, drop_search_index
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sqlitedb", "0002_broadcast"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:09
+
+from django.db import migrations, models
+
+from sqlitedb.search import create_search_index
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("sqlitedb", "0004_user_banned_until"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="command_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="last_seen",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # Adding a column with a default rebuilds the user table on SQLite, which drops the search triggers
+        migrations.RunPython(create_search_index, migrations.RunPython.noop),
+    ]
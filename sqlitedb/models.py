@@ -1,26 +1,131 @@
 """Models."""
 
-from typing import Self
+from collections.abc import AsyncIterator
+from datetime import timedelta
+from typing import TYPE_CHECKING, Any, ClassVar, NamedTuple, Self
 
-from django.core.cache import cache
-from django.db import models
-from django.db.models import Field
+from django.conf import settings
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Case, F, Field, Q, Value, When
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
 from telethon.tl.types import Channel
 from telethon.tl.types import User as TelegramUser
 
 from manage import init_django
+from sqlitedb.cache import CacheStamp, LRUCache, SingleFlight, TieredCache
 from sqlitedb.lookups import Like
-from sqlitedb.utils import UserStatus, UserType
+from sqlitedb.search import MIN_TRIGRAM_TERM, SQLITE_SEARCH, Similarity, escape_like, match_phrase
+from sqlitedb.utils import BroadcastState, JobState, UserStatus, UserType
+
+if TYPE_CHECKING:
+    from sqlitedb.sqlite import NativeUserStore
 
 init_django()
 
 Field.register_lookup(Like)
 
+# User fields written behind by the activity tracker
+ACTIVITY_FIELDS = frozenset({"last_seen", "command_count"})
+
+# Error of the jobs whose last attempt never finished
+LAPSED_JOB_ERROR = "The visibility timeout of the last attempt lapsed, its worker died or hung"
+
+# Bump whenever the fields of UserSnapshot change so old cache records are ignored
+USER_SNAPSHOT_VERSION = 1
+
+
+class UserSnapshot(NamedTuple):
+    """Read-only view of the hot fields of a User, cheap to cache.
+
+    Only a plain, versioned tuple of these fields is stored in the shared cache instead of a pickled model
+    instance, so entries carry no ``_state`` and unpickling doesn't need to rebuild a model. Use the
+    ``User`` model itself for writes.
+    """
+
+    id: int
+    telegram_id: int
+    name: str
+    status: str
+    user_type: str
+    settings: dict[str, Any]
+
+    @classmethod
+    def from_model(cls, user: "User") -> "UserSnapshot":
+        """Build a snapshot from a User model instance."""
+        return cls(user.id, user.telegram_id, user.name, user.status, user.user_type, user.settings)
+
+    @classmethod
+    def from_record(cls, record: tuple[Any, ...]) -> "UserSnapshot | None":
+        """Rebuild a snapshot from a cache record, or None if the record was written by another version."""
+        if record[0] != USER_SNAPSHOT_VERSION:
+            return None
+        return cls._make(record[1:])
+
+    def to_record(self: Self) -> tuple[Any, ...]:
+        """Return the compact tuple stored in the shared cache."""
+        return (USER_SNAPSHOT_VERSION, *self)
+
+    def __str__(self: Self) -> str:
+        """Return a string representation of the user snapshot."""
+        return f"User(id={self.id}, name={self.name}, telegram_id={self.telegram_id}, status={self.status})"
+
+
+# User fields a snapshot is built from
+SNAPSHOT_FIELDS = frozenset(UserSnapshot._fields)
+
 
-class UserManager(models.Manager):  # type: ignore[misc]
+# Users seen recently are served from process memory, everyone else from the shared CACHE_URL backend
+user_cache = TieredCache(
+    "user",
+    LRUCache(
+        maxsize=getattr(settings, "USER_CACHE_LOCAL_SIZE", 10_000),
+        ttl=getattr(settings, "USER_CACHE_LOCAL_TTL", 60),
+    ),
+    dumps=UserSnapshot.to_record,
+    loads=UserSnapshot.from_record,
+)
+
+
+class UserQuerySet(models.QuerySet):  # type: ignore[misc]
+    """QuerySet for the User model that keeps the user cache coherent."""
+
+    def update(self: Self, **kwargs: Any) -> int:
+        """Update the matching users and invalidate their cached snapshots once the change is committed.
+
+        ``QuerySet.update`` doesn't send ``post_save``, so bulk changes such as suspending many users go
+        through here to retire their cache entries. ``aupdate`` and ``bulk_update`` use this as well.
+
+        Args:
+            **kwargs: Field values to set.
+
+        Returns
+        -------
+            int: The number of rows matched.
+        """
+        if kwargs.keys() <= ACTIVITY_FIELDS:
+            # Activity counters are neither cached nor watched by the status gate
+            activity_rows: int = super().update(**kwargs)
+            return activity_rows
+        # Bulk updates don't touch auto_now fields, but the status gate reads changes since a last_updated watermark
+        kwargs.setdefault("last_updated", timezone.now())
+        with transaction.atomic(using=self.db):
+            telegram_ids = list(self.values_list("telegram_id", flat=True))
+            rows: int = super().update(**kwargs)
+            transaction.on_commit(lambda: invalidate_users(telegram_ids), using=self.db)
+        return rows
+
+
+class UserManager(models.Manager.from_queryset(UserQuerySet)):  # type: ignore[misc]
     """Manager for the User model."""
 
-    async def get_user(self: Self, telegram_user: TelegramUser | Channel) -> "User":
+    # Concurrent cache misses for the same Telegram ID share a single lookup/create
+    user_flight: SingleFlight[UserSnapshot] = SingleFlight()
+
+    # Native async driver for the lookup/create of get_user, set by SQLiteDatabase when ASYNC_DB is enabled
+    native_store: ClassVar["NativeUserStore | None"] = None
+
+    async def get_user(self: Self, telegram_user: TelegramUser | Channel) -> UserSnapshot:
         """Retrieve a User object from the database for a given user_id. If the user does not exist, create a new user.
 
         Args:
@@ -28,32 +133,168 @@ class UserManager(models.Manager):  # type: ignore[misc]
 
         Returns
         -------
-            User: The User object corresponding to the specified user ID
+            UserSnapshot: Snapshot of the User corresponding to the specified user ID
         """
-        try:
-            user: User = cache.get(telegram_user.id)
+        user: UserSnapshot | None
+        user, stamp = user_cache.lookup(telegram_user.id)
+        if not user:
+            user = await self.user_flight.do(telegram_user.id, lambda: self._load_user(telegram_user, stamp))
+        if user.status == UserStatus.BLOCKED.value:
+            user = await self._unblock(user)
+        return user
 
-            if not user:
-                # https://github.com/typeddjango/django-stubs/issues/1493
-                user = await self.filter(telegram_id=telegram_user.id).aget()
-                cache.set(telegram_user.id, user)
+    async def _unblock(self: Self, user: UserSnapshot) -> UserSnapshot:
+        """Set a user a broadcast marked as blocked back to active, they reached the bot so it can reach them.
+
+        Args:
+            user (UserSnapshot): Snapshot of the blocked user.
 
+        Returns
+        -------
+            UserSnapshot: Snapshot of the now active user
+        """
+        await self.filter(telegram_id=user.telegram_id, status=UserStatus.BLOCKED.value).aupdate(
+            status=UserStatus.ACTIVE.value,
+        )
+        return user._replace(status=UserStatus.ACTIVE.value)
+
+    async def _load_user(self: Self, telegram_user: TelegramUser | Channel, stamp: CacheStamp | None) -> UserSnapshot:
+        """Fetch the user from the database, creating it on first contact, and populate the cache.
+
+        Args:
+            telegram_user (TelegramUser): The Telegram entity to retrieve or create.
+            stamp (CacheStamp): Stamp of the cache lookup that missed.
+
+        Returns
+        -------
+            UserSnapshot: Snapshot of the User corresponding to the specified user ID
+        """
+        store = self.native_store
+        if store is not None:
+            return await self._load_user_native(store, telegram_user, stamp)
+        try:
+            # https://github.com/typeddjango/django-stubs/issues/1493
+            user: User = await self.filter(telegram_id=telegram_user.id).aget()
         except self.model.DoesNotExist:
-            if isinstance(telegram_user, Channel):
-                user_type = UserType.GROUP.value if telegram_user.megagroup else UserType.CHANNEL.value
-                name = telegram_user.title
+            try:
+                user = await self.acreate(**self._new_user_fields(telegram_user))
+            except IntegrityError:
+                # Another process created the row between our lookup and insert
+                user = await self.filter(telegram_id=telegram_user.id).aget()
             else:
-                name = f"{telegram_user.first_name} {telegram_user.last_name}"
-                user_type = UserType.USER.value
-            user_dict = {
-                "telegram_id": telegram_user.id,
-                "name": name,
-                "user_type": user_type,
-            }
-            user = await User.objects.acreate(**user_dict)
-            cache.set(telegram_user.id, user)
+                # The post_save hook already wrote the new user through to the cache
+                return UserSnapshot.from_model(user)
 
-        return user
+        snapshot = UserSnapshot.from_model(user)
+        user_cache.set(telegram_user.id, snapshot, stamp)
+        return snapshot
+
+    async def _load_user_native(
+        self: Self,
+        store: "NativeUserStore",
+        telegram_user: TelegramUser | Channel,
+        stamp: CacheStamp | None,
+    ) -> UserSnapshot:
+        """Fetch or create the user like :meth:`_load_user`, through the native async store.
+
+        Args:
+            store (NativeUserStore): The native store to query.
+            telegram_user (TelegramUser): The Telegram entity to retrieve or create.
+            stamp (CacheStamp): Stamp of the cache lookup that missed.
+
+        Returns
+        -------
+            UserSnapshot: Snapshot of the User corresponding to the specified user ID
+        """
+        snapshot = await store.fetch_user(telegram_user.id)
+        if snapshot is None:
+            fields = self._new_user_fields(telegram_user)
+            snapshot = await store.create_user(**fields)
+        if snapshot is None:
+            # Another process created the row between our lookup and insert
+            snapshot = await store.fetch_user(telegram_user.id)
+        if snapshot is None:
+            raise self.model.DoesNotExist
+        user_cache.set(telegram_user.id, snapshot, stamp)
+        return snapshot
+
+    @staticmethod
+    def _new_user_fields(telegram_user: TelegramUser | Channel) -> dict[str, Any]:
+        """Return the fields of a new user created on first contact with ``telegram_user``."""
+        if isinstance(telegram_user, Channel):
+            user_type = UserType.GROUP.value if telegram_user.megagroup else UserType.CHANNEL.value
+            name = telegram_user.title
+        else:
+            name = f"{telegram_user.first_name} {telegram_user.last_name}"
+            user_type = UserType.USER.value
+        return {
+            "telegram_id": telegram_user.id,
+            "name": name,
+            "user_type": user_type,
+        }
+
+    async def search(self: Self, term: str, limit: int = 20) -> list[UserSnapshot]:
+        """Find users whose name contains ``term``, case-insensitively, best matches first.
+
+        Terms of at least ``MIN_TRIGRAM_TERM`` characters are served by the trigram index created by the
+        migrations: the FTS5 ``user_search`` table ranked by bm25 on SQLite, the ``pg_trgm`` GIN index ranked by
+        similarity on PostgreSQL. Shorter terms, and other databases, fall back to a LIKE scan ranking names
+        that start with the term first.
+
+        Args:
+            term (str): Text to look for in user names.
+            limit (int): Maximum number of users returned.
+
+        Returns
+        -------
+            list[UserSnapshot]: Snapshots of the matching users
+        """
+        term = term.strip()
+        if not term:
+            return []
+        vendor = connections[self.db].vendor
+        if vendor == "sqlite" and len(term) >= MIN_TRIGRAM_TERM:
+            rows = self.raw(SQLITE_SEARCH, [match_phrase(term), limit])
+            return [UserSnapshot.from_model(user) async for user in rows]
+
+        pattern = escape_like(term)
+        queryset = self.filter(name__ilike=f"%{pattern}%")
+        if vendor == "postgresql" and len(term) >= MIN_TRIGRAM_TERM:
+            queryset = queryset.annotate(rank=-Similarity("name", Value(term)))
+        else:
+            queryset = queryset.annotate(rank=Case(When(name__ilike=f"{pattern}%", then=0), default=1))
+        return [UserSnapshot.from_model(user) async for user in queryset.order_by("rank", "id")[:limit]]
+
+    async def iter_recipients(
+        self: Self,
+        statuses: list[str],
+        user_types: list[str],
+        after_id: int = 0,
+        chunk_size: int = 500,
+    ) -> AsyncIterator[list[tuple[int, int, str]]]:
+        """Stream matching users in chunks, ordered by primary key.
+
+        Each chunk is fetched with a keyset query (``id > last id seen``), so the whole table is never loaded
+        and late chunks cost the same as early ones.
+
+        Args:
+            statuses (list[str]): Statuses to include.
+            user_types (list[str]): User types to include.
+            after_id (int): Only users with a larger primary key are returned, used to resume.
+            chunk_size (int): Maximum number of users per chunk.
+
+        Yields
+        ------
+            list[tuple[int, int, str]]: ``(id, telegram_id, user_type)`` of the users in the chunk
+        """
+        queryset = self.filter(status__in=statuses, user_type__in=user_types).order_by("id")
+        while True:
+            rows = queryset.filter(id__gt=after_id).values_list("id", "telegram_id", "user_type")[:chunk_size]
+            chunk = [row async for row in rows]
+            if not chunk:
+                return
+            yield chunk
+            after_id = chunk[-1][0]
 
 
 class User(models.Model):  # type: ignore[misc]
@@ -67,6 +308,9 @@ class User(models.Model):  # type: ignore[misc]
         status (str): The current status of the user's account (active, suspended, or temporarily banned).
         joining_date (datetime): The date and time when the user was added to the database.
         last_updated (datetime): The date and time when the user's details were last updated.
+        banned_until (datetime or None): When a temporary ban ends, None if it doesn't end on its own.
+        last_seen (datetime or None): When the user last ran a command, None if they never did.
+        command_count (int): Number of commands the user ran.
 
     Managers:
         objects (UserManager): The custom manager for this model.
@@ -109,6 +353,13 @@ class User(models.Model):  # type: ignore[misc]
         choices=[(user_type.value, user_type.name) for user_type in UserType],
     )
 
+    # End of a TEMP_BANNED status
+    banned_until = models.DateTimeField(null=True, blank=True)
+
+    # Activity, written in batches by the activity tracker
+    last_seen = models.DateTimeField(null=True, blank=True)
+    command_count = models.PositiveIntegerField(default=0)
+
     # Use custom manager for this model
     objects = UserManager()
 
@@ -116,7 +367,205 @@ class User(models.Model):  # type: ignore[misc]
         """Database table name."""
 
         db_table = "user"
+        indexes = (
+            # Keyset scans over users of a given status and type, e.g. broadcasts
+            models.Index(fields=["status", "user_type", "id"], name="user_status_type_id_idx"),
+            # Incremental refreshes of the status gate
+            models.Index(fields=["last_updated"], name="user_last_updated_idx"),
+        )
 
     def __str__(self: Self) -> str:
         """Return a string representation of the user object."""
         return f"User(id={self.id}, name={self.name}, telegram_id={self.telegram_id}, status={self.status})"
+
+
+class Broadcast(models.Model):  # type: ignore[misc]
+    """Model for checkpointing a broadcast to many users.
+
+    Attributes
+    ----------
+        id (int): The unique ID of the broadcast.
+        message (str): The text sent to every recipient.
+        statuses (list[str]): User statuses the broadcast is sent to.
+        user_types (list[str]): User types the broadcast is sent to.
+        last_user_id (int): Primary key of the last User handled, the broadcast resumes after it.
+        sent (int): Number of messages delivered.
+        failed (int): Number of messages that could not be delivered.
+        blocked (int): Number of recipients marked as blocked because they blocked the bot or were deleted.
+        state (str): Whether the broadcast is still running or done.
+        elapsed (float): Seconds spent sending, across all runs.
+        created_at (datetime): The date and time when the broadcast was started.
+        last_updated (datetime): The date and time of the last checkpoint.
+    """
+
+    id = models.AutoField(primary_key=True)
+    message = models.TextField()
+    statuses = models.JSONField(default=list)
+    user_types = models.JSONField(default=list)
+    last_user_id = models.IntegerField(default=0)
+    sent = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+    blocked = models.IntegerField(default=0)
+    state = models.CharField(
+        max_length=20,
+        choices=[(state.value, state.name) for state in BroadcastState],
+        default=BroadcastState.RUNNING.value,
+    )
+    elapsed = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        """Database table name."""
+
+        db_table = "broadcast"
+
+    def __str__(self: Self) -> str:
+        """Return a string representation of the broadcast object."""
+        return f"Broadcast(id={self.id}, state={self.state}, sent={self.sent}, failed={self.failed})"
+
+
+class JobManager(models.Manager):  # type: ignore[misc]
+    """Manager for the Job model."""
+
+    def claim(self: Self, worker: str, limit: int, visibility_timeout: float) -> list["Job"]:
+        """Claim up to ``limit`` due jobs for ``worker``, oldest first.
+
+        Due jobs are the queued ones whose ``run_at`` passed and the running ones whose worker let the visibility
+        timeout lapse. A lapsed job that used its last attempt, because its worker died or hung on it every time,
+        is failed instead. Claimed jobs are running, locked until the timeout and have their attempt counted. Where
+        the database supports it (PostgreSQL) candidates are locked with ``SELECT ... FOR UPDATE SKIP LOCKED``, so
+        concurrent workers never wait on each other. Elsewhere (SQLite) each candidate is claimed with an update
+        conditioned on the attempt count read, which fails if another worker claimed it first.
+
+        Args:
+            worker (str): Unique name of the claiming worker.
+            limit (int): Maximum number of jobs claimed.
+            visibility_timeout (float): Seconds the jobs stay locked to ``worker``.
+
+        Returns
+        -------
+            list[Job]: The claimed jobs
+        """
+        now = timezone.now()
+        lapsed = Q(state=JobState.RUNNING.value, locked_until__lte=now)
+        due = self.filter(
+            Q(state=JobState.QUEUED.value, run_at__lte=now) | (lapsed & Q(attempts__lt=F("max_attempts"))),
+        ).order_by("run_at", "id")
+        claim = {
+            "state": JobState.RUNNING.value,
+            "locked_by": worker,
+            "locked_until": now + timedelta(seconds=visibility_timeout),
+            "attempts": F("attempts") + 1,
+            "last_updated": now,
+        }
+        with transaction.atomic(using=self.db):
+            self.filter(lapsed, attempts__gte=F("max_attempts")).update(
+                state=JobState.FAILED.value,
+                locked_until=None,
+                error=LAPSED_JOB_ERROR,
+                last_updated=now,
+            )
+            if connections[self.db].features.has_select_for_update_skip_locked:
+                ids = list(due.select_for_update(skip_locked=True).values_list("id", flat=True)[:limit])
+                self.filter(id__in=ids).update(**claim)
+            else:
+                ids = [
+                    job_id
+                    for job_id, state, attempts in due.values_list("id", "state", "attempts")[:limit]
+                    if self.filter(id=job_id, state=state, attempts=attempts).update(**claim)
+                ]
+        return list(self.filter(id__in=ids, locked_by=worker).order_by("run_at", "id"))
+
+
+class Job(models.Model):  # type: ignore[misc]
+    """Model for a durable background job.
+
+    Attributes
+    ----------
+        id (int): The unique ID of the job.
+        name (str): Name the job function was registered under.
+        payload (dict): Arguments of the job function.
+        chat_id (int or None): Chat the result is delivered to, None to discard it.
+        reply_to (int or None): Message the result replies to.
+        state (str): Whether the job is queued, running, done or failed.
+        attempts (int): Number of times the job was claimed.
+        max_attempts (int): Number of attempts after which a failing job is given up.
+        run_at (datetime): When the job is due, pushed back by the backoff after a failure.
+        locked_by (str): Worker running the job.
+        locked_until (datetime or None): End of the visibility timeout of the running attempt.
+        result (Any): Value returned by the job function.
+        error (str): Error of the last failed attempt.
+        created_at (datetime): The date and time when the job was enqueued.
+        last_updated (datetime): The date and time when the job last changed.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    chat_id = models.BigIntegerField(null=True, blank=True)
+    reply_to = models.IntegerField(null=True, blank=True)
+    state = models.CharField(
+        max_length=20,
+        choices=[(state.value, state.name) for state in JobState],
+        default=JobState.QUEUED.value,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_updated = models.DateTimeField(auto_now=True)
+
+    objects = JobManager()
+
+    class Meta:
+        """Database table name."""
+
+        db_table = "job"
+        indexes = (
+            # Claims look for due jobs, oldest first
+            models.Index(fields=["state", "run_at"], name="job_state_run_at_idx"),
+        )
+
+    def __str__(self: Self) -> str:
+        """Return a string representation of the job object."""
+        return f"Job(id={self.id}, name={self.name}, state={self.state}, attempts={self.attempts})"
+
+
+def invalidate_users(telegram_ids: list[int]) -> None:
+    """Retire the cached snapshots of the given users.
+
+    Args:
+        telegram_ids (list[int]): Telegram IDs of the users whose rows changed.
+    """
+    for telegram_id in telegram_ids:
+        user_cache.invalidate(telegram_id)
+
+
+def write_through_user(instance: User, update_fields: frozenset[str] | None = None, **kwargs: Any) -> None:
+    """Replace the cached snapshot of a saved user once the change is committed.
+
+    Saves of some fields only retire the snapshot if they touch one of its fields: the other fields of the
+    instance may be stale, or deferred and not loaded.
+    """
+    if update_fields is None:
+        snapshot = UserSnapshot.from_model(instance)
+        transaction.on_commit(lambda: user_cache.write_through(snapshot.telegram_id, snapshot), using=kwargs["using"])
+    elif not SNAPSHOT_FIELDS.isdisjoint(update_fields):
+        telegram_id = instance.telegram_id
+        transaction.on_commit(lambda: user_cache.invalidate(telegram_id), using=kwargs["using"])
+
+
+def invalidate_deleted_user(instance: User, **kwargs: Any) -> None:
+    """Retire the cached snapshot of a deleted user once the change is committed."""
+    telegram_id = instance.telegram_id
+    transaction.on_commit(lambda: user_cache.invalidate(telegram_id), using=kwargs["using"])
+
+
+# Connected explicitly, the receiver decorator is untyped
+post_save.connect(write_through_user, sender=User)
+post_delete.connect(invalidate_deleted_user, sender=User)
@@ -0,0 +1,109 @@
+"""Trigram indexes behind the user name search."""
+
+from typing import Any
+
+from django.db.models import FloatField, Func
+
+# Shorter terms have no trigram to look up, they fall back to a LIKE scan
+MIN_TRIGRAM_TERM = 3
+
+# SQLite: FTS5 table of user names with the trigram tokenizer, kept in sync with the user table by triggers
+SQLITE_CREATE_SEARCH_INDEX = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS "user_search"
+    USING fts5("name", content='user', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS "user_search_insert" AFTER INSERT ON "user" BEGIN
+        INSERT INTO "user_search" ("rowid", "name") VALUES (new."id", new."name");
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "user_search_delete" AFTER DELETE ON "user" BEGIN
+        INSERT INTO "user_search" ("user_search", "rowid", "name") VALUES ('delete', old."id", old."name");
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS "user_search_update" AFTER UPDATE OF "name" ON "user" BEGIN
+        INSERT INTO "user_search" ("user_search", "rowid", "name") VALUES ('delete', old."id", old."name");
+        INSERT INTO "user_search" ("rowid", "name") VALUES (new."id", new."name");
+    END""",
+    """INSERT INTO "user_search" ("user_search") VALUES ('rebuild')""",
+)
+SQLITE_DROP_SEARCH_INDEX = (
+    'DROP TRIGGER IF EXISTS "user_search_insert"',
+    'DROP TRIGGER IF EXISTS "user_search_delete"',
+    'DROP TRIGGER IF EXISTS "user_search_update"',
+    'DROP TABLE IF EXISTS "user_search"',
+)
+
+# SQLite: matching users, best ranked first
+SQLITE_SEARCH = """
+    SELECT "user".* FROM "user_search" JOIN "user" ON "user"."id" = "user_search"."rowid"
+    WHERE "user_search" MATCH %s ORDER BY "user_search"."rank", "user"."id" LIMIT %s
+"""
+
+# PostgreSQL: GIN trigram index serving ILIKE '%term%' on user names
+POSTGRESQL_CREATE_SEARCH_INDEX = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    'CREATE INDEX IF NOT EXISTS "user_name_trgm_idx" ON "user" USING gin ("name" gin_trgm_ops)',
+)
+POSTGRESQL_DROP_SEARCH_INDEX = ('DROP INDEX IF EXISTS "user_name_trgm_idx"',)
+
+
+class Similarity(Func):  # type: ignore[misc]
+    """Trigram similarity of two strings on PostgreSQL, between 0 and 1."""
+
+    function = "similarity"
+    output_field = FloatField()
+
+
+def match_phrase(term: str) -> str:
+    """Quote ``term`` as a single FTS5 phrase, which the trigram tokenizer matches as a substring.
+
+    Args:
+        term: The searched text.
+
+    Returns
+    -------
+        The FTS5 query
+    """
+    return '"{}"'.format(term.replace('"', '""'))
+
+
+def escape_like(term: str) -> str:
+    r"""Escape the wildcards of ``term`` for a LIKE pattern using ``\`` as escape character.
+
+    Args:
+        term: The searched text.
+
+    Returns
+    -------
+        The escaped text
+    """
+    return term.replace("\\", "\\\\").replace("%", r"\%").replace("_", r"\_")
+
+
+def create_search_index(apps: Any, schema_editor: Any) -> None:  # noqa: ARG001
+    """Create the search index of the database vendor, safe to run again.
+
+    On SQLite, migrations that rebuild the user table drop its triggers, so they run this again afterwards.
+
+    Args:
+        apps: The app registry of the migration.
+        schema_editor: The schema editor of the migration.
+    """
+    statements = {
+        "sqlite": SQLITE_CREATE_SEARCH_INDEX,
+        "postgresql": POSTGRESQL_CREATE_SEARCH_INDEX,
+    }.get(schema_editor.connection.vendor, ())
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps: Any, schema_editor: Any) -> None:  # noqa: ARG001
+    """Drop the search index of the database vendor.
+
+    Args:
+        apps: The app registry of the migration.
+        schema_editor: The schema editor of the migration.
+    """
+    statements = {
+        "sqlite": SQLITE_DROP_SEARCH_INDEX,
+        "postgresql": POSTGRESQL_DROP_SEARCH_INDEX,
+    }.get(schema_editor.connection.vendor, ())
+    for statement in statements:
+        schema_editor.execute(statement)
@@ -1,11 +1,324 @@
 """SQLite database to store messages."""
 
-from typing import TypeVar
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from typing import Any, ClassVar, Self, TypeVar
 
-from django.db.models import Model
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.db.models import JSONField, Model
+from django.utils import timezone
+from loguru import logger
+
+from sqlitedb.models import User, UserManager, UserSnapshot, invalidate_users
+from sqlitedb.utils import UserStatus
 
 T = TypeVar("T", bound=Model)
 
+# Columns of a UserSnapshot, in order
+SNAPSHOT_COLUMNS = ", ".join(f'"{field}"' for field in UserSnapshot._fields)
+
+# Pragmas reported by the startup check of SQLite databases
+SQLITE_PRAGMAS = ("journal_mode", "synchronous", "busy_timeout", "cache_size", "mmap_size", "temp_store")
+
+# Fields of the User model by name
+USER_FIELDS = {field.name: field for field in User._meta.concrete_fields}  # noqa: SLF001
+
+
+class NativeUserStore(ABC):
+    """Hot user queries run on a native async driver, without the ``sync_to_async`` thread hop of the ORM.
+
+    Subclasses hold the connection of one database vendor and write the SQL in its dialect. Rows are
+    returned as :class:`~sqlitedb.models.UserSnapshot`, exactly as the ORM path builds them.
+    """
+
+    vendor: ClassVar[str]
+
+    def __init__(self: Self, alias: str = "default") -> None:
+        """Create the store, the connection is opened on first use.
+
+        Args:
+            alias: Django database alias whose settings are used to connect.
+        """
+        self.alias = alias
+        self.settings_dict: dict[str, Any] = settings.DATABASES[alias]
+        self._lock = asyncio.Lock()
+        self._connected = False
+
+    @abstractmethod
+    async def connect(self: Self) -> None:
+        """Open the connection."""
+
+    @abstractmethod
+    async def close(self: Self) -> None:
+        """Close the connection."""
+
+    @abstractmethod
+    async def _fetchrow(self: Self, sql: str, *params: Any) -> tuple[Any, ...] | None:
+        """Run ``sql`` and return its first row."""
+
+    @abstractmethod
+    async def _execute(self: Self, sql: str, *params: Any) -> int:
+        """Run ``sql`` and return the number of rows changed."""
+
+    @abstractmethod
+    def _placeholder(self: Self, position: int) -> str:
+        """Return the parameter placeholder of the 1-based ``position``."""
+
+    def _adapt(self: Self, field_name: str, value: Any) -> Any:
+        """Convert a field value into a query parameter, stored exactly as the ORM stores it."""
+        field = USER_FIELDS[field_name]
+        if isinstance(field, JSONField):
+            # Django adapts JSON for its own drivers, the native drivers take the encoded text
+            return json.dumps(value)
+        return field.get_db_prep_value(value, connections[self.alias])
+
+    async def _ensure_connected(self: Self) -> None:
+        """Connect once, even when the first queries arrive concurrently."""
+        if self._connected:
+            return
+        async with self._lock:
+            if not self._connected:
+                await self.connect()
+                self._connected = True
+                logger.info(f"Native async {self.vendor} connection opened for hot user queries")
+
+    @staticmethod
+    def _snapshot(row: tuple[Any, ...] | None) -> UserSnapshot | None:
+        """Build a snapshot from a row of ``SNAPSHOT_COLUMNS``."""
+        if row is None:
+            return None
+        user_settings = row[-1]
+        if isinstance(user_settings, str | bytes):
+            user_settings = json.loads(user_settings)
+        return UserSnapshot._make((*row[:-1], user_settings))
+
+    async def fetch_user(self: Self, telegram_id: int) -> UserSnapshot | None:
+        """Fetch the user with ``telegram_id``.
+
+        Args:
+            telegram_id: Telegram ID of the user.
+
+        Returns
+        -------
+            Snapshot of the user, or None if they don't exist
+        """
+        await self._ensure_connected()
+        sql = f'SELECT {SNAPSHOT_COLUMNS} FROM "user" WHERE "telegram_id" = {self._placeholder(1)}'  # noqa: S608
+        return self._snapshot(await self._fetchrow(sql, telegram_id))
+
+    async def create_user(self: Self, telegram_id: int, name: str, user_type: str) -> UserSnapshot | None:
+        """Insert a new active user with default settings.
+
+        Args:
+            telegram_id: Telegram ID of the user.
+            name: Name of the user.
+            user_type: Type of the user.
+
+        Returns
+        -------
+            Snapshot of the new user, or None if a user with ``telegram_id`` already exists
+        """
+        await self._ensure_connected()
+        now = self._adapt("last_updated", timezone.now())
+        values = (telegram_id, name, UserStatus.ACTIVE.value, user_type, self._adapt("settings", {}), now, now, 0)
+        placeholders = ", ".join(self._placeholder(position) for position in range(1, len(values) + 1))
+        sql = (
+            'INSERT INTO "user" ("telegram_id", "name", "status", "user_type", "settings", "joining_date", '  # noqa: S608
+            f'"last_updated", "command_count") VALUES ({placeholders}) ON CONFLICT ("telegram_id") DO NOTHING '
+            f"RETURNING {SNAPSHOT_COLUMNS}"
+        )
+        return self._snapshot(await self._fetchrow(sql, *values))
+
+    async def update_user(self: Self, telegram_id: int, **fields: Any) -> int:
+        """Update the user with ``telegram_id`` and retire their cached snapshot.
+
+        Args:
+            telegram_id: Telegram ID of the user.
+            **fields: Field values to set.
+
+        Returns
+        -------
+            The number of rows matched
+        """
+        await self._ensure_connected()
+        fields["last_updated"] = timezone.now()
+        assignments = [
+            f'"{USER_FIELDS[name].column}" = {self._placeholder(position)}'
+            for position, name in enumerate(fields, start=1)
+        ]
+        params = [self._adapt(name, value) for name, value in fields.items()]
+        condition = f'"telegram_id" = {self._placeholder(len(fields) + 1)}'
+        sql = f'UPDATE "user" SET {", ".join(assignments)} WHERE {condition}'  # noqa: S608
+        rows = await self._execute(sql, *params, telegram_id)
+        invalidate_users([telegram_id])
+        return rows
+
+
+class AioSQLiteUserStore(NativeUserStore):
+    """Hot user queries on SQLite through ``aiosqlite``."""
+
+    vendor = "sqlite"
+
+    async def connect(self: Self) -> None:
+        """Open the connection in autocommit mode."""
+        try:
+            import aiosqlite  # noqa: PLC0415
+        except ImportError as e:
+            msg = "ASYNC_DB on SQLite requires the aiosqlite package"
+            raise ImproperlyConfigured(msg) from e
+        options = self.settings_dict.get("OPTIONS", {})
+        self.connection = await aiosqlite.connect(
+            self.settings_dict["NAME"],
+            timeout=options.get("timeout", 5),
+            isolation_level=None,
+        )
+        # Same pragmas as the ORM connections of the DB_PROFILE
+        for command in options.get("init_command", "").split(";"):
+            if command := command.strip():
+                await self.connection.execute(command)
+
+    async def close(self: Self) -> None:
+        """Close the connection."""
+        if self._connected:
+            await self.connection.close()
+            self._connected = False
+
+    async def _fetchrow(self: Self, sql: str, *params: Any) -> tuple[Any, ...] | None:
+        """Run ``sql`` and return its first row."""
+        async with self.connection.execute(sql, params) as cursor:
+            row = await cursor.fetchone()
+        return tuple(row) if row is not None else None
+
+    async def _execute(self: Self, sql: str, *params: Any) -> int:
+        """Run ``sql`` and return the number of rows changed."""
+        async with self.connection.execute(sql, params) as cursor:
+            return cursor.rowcount
+
+    def _placeholder(self: Self, position: int) -> str:
+        """Return the parameter placeholder of the 1-based ``position``."""
+        return "?"
+
+
+class AsyncPGUserStore(NativeUserStore):
+    """Hot user queries on PostgreSQL through an ``asyncpg`` connection pool."""
+
+    vendor = "postgresql"
+
+    async def connect(self: Self) -> None:
+        """Open the connection pool."""
+        try:
+            import asyncpg  # noqa: PLC0415
+        except ImportError as e:
+            msg = "ASYNC_DB on PostgreSQL requires the asyncpg package"
+            raise ImproperlyConfigured(msg) from e
+        self.pool = await asyncpg.create_pool(
+            host=self.settings_dict.get("HOST") or None,
+            port=int(self.settings_dict["PORT"]) if self.settings_dict.get("PORT") else None,
+            user=self.settings_dict.get("USER") or None,
+            password=self.settings_dict.get("PASSWORD") or None,
+            database=self.settings_dict["NAME"],
+            max_size=getattr(settings, "ASYNC_DB_POOL_SIZE", 10),
+        )
+
+    async def close(self: Self) -> None:
+        """Close the connection pool."""
+        if self._connected:
+            await self.pool.close()
+            self._connected = False
+
+    async def _fetchrow(self: Self, sql: str, *params: Any) -> tuple[Any, ...] | None:
+        """Run ``sql`` and return its first row."""
+        row = await self.pool.fetchrow(sql, *params)
+        return tuple(row) if row is not None else None
+
+    async def _execute(self: Self, sql: str, *params: Any) -> int:
+        """Run ``sql`` and return the number of rows changed."""
+        status: str = await self.pool.execute(sql, *params)
+        # The status of an UPDATE is "UPDATE <rows>"
+        return int(status.rsplit(" ", 1)[-1])
+
+    def _placeholder(self: Self, position: int) -> str:
+        """Return the parameter placeholder of the 1-based ``position``."""
+        return f"${position}"
+
+
+# Native store of each supported Django database vendor
+NATIVE_STORES: dict[str, type[NativeUserStore]] = {
+    AioSQLiteUserStore.vendor: AioSQLiteUserStore,
+    AsyncPGUserStore.vendor: AsyncPGUserStore,
+}
+
 
 class SQLiteDatabase(object):
-    """SQLite database Object."""
+    """SQLite database Object.
+
+    Entry point of the data access layer. With ``ASYNC_DB`` enabled, the hot user queries of
+    :class:`~sqlitedb.models.UserManager` run on a native async driver (``aiosqlite`` or ``asyncpg``, matching
+    ``DATABASE_URL``) instead of the ORM, everything else keeps using the ORM.
+    """
+
+    def __init__(self: Self, alias: str = "default", *, native: bool | None = None) -> None:
+        """Create the database object.
+
+        Args:
+            alias: Django database alias to use.
+            native: Whether to use the native async driver, ``settings.ASYNC_DB`` by default.
+        """
+        self.alias = alias
+        self.native_store: NativeUserStore | None = None
+        if settings.ASYNC_DB if native is None else native:
+            vendor = connections[alias].vendor
+            if vendor not in NATIVE_STORES:
+                msg = f"ASYNC_DB isn't supported on {vendor}, use SQLite or PostgreSQL"
+                raise ImproperlyConfigured(msg)
+            self.native_store = NATIVE_STORES[vendor](alias)
+        UserManager.native_store = self.native_store
+
+    def log_settings(self: Self) -> dict[str, Any]:
+        """Log the database settings actually in effect, as reported by the database itself.
+
+        Returns
+        -------
+            The effective settings
+        """
+        connection = connections[self.alias]
+        effective: dict[str, Any] = {"vendor": connection.vendor, "native_async": self.native_store is not None}
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                for pragma in SQLITE_PRAGMAS:
+                    cursor.execute(f"PRAGMA {pragma}")
+                    effective[pragma] = cursor.fetchone()[0]
+                effective["transaction_mode"] = connection.transaction_mode
+            elif connection.vendor == "postgresql":
+                cursor.execute("SHOW max_connections")
+                effective["max_connections"] = cursor.fetchone()[0]
+        if connection.vendor == "postgresql":
+            effective["conn_max_age"] = connection.settings_dict["CONN_MAX_AGE"]
+            effective["conn_health_checks"] = connection.settings_dict["CONN_HEALTH_CHECKS"]
+            effective["pool"] = connection.settings_dict["OPTIONS"].get("pool", False)
+        logger.info(f"Database settings in effect: {effective}")
+        return effective
+
+    async def update_user(self: Self, telegram_id: int, **fields: Any) -> int:
+        """Update the user with ``telegram_id``, keeping the user cache coherent.
+
+        Args:
+            telegram_id: Telegram ID of the user.
+            **fields: Field values to set.
+
+        Returns
+        -------
+            The number of rows matched
+        """
+        if self.native_store is not None:
+            return await self.native_store.update_user(telegram_id, **fields)
+        rows: int = await User.objects.using(self.alias).filter(telegram_id=telegram_id).aupdate(**fields)
+        return rows
+
+    async def close(self: Self) -> None:
+        """Close the native connection, if any."""
+        if self.native_store is not None:
+            await self.native_store.close()
@@ -1 +1,108 @@
 """Fixtures."""
+
+import importlib
+import os
+import sys
+import tempfile
+import textwrap
+import uuid
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+import pytest
+from django.conf import settings
+from django.core.cache import cache
+
+from manage import init_django
+
+# SQLite test database, a file because the shared in-memory one locks whole tables without waiting, which breaks
+# the tests running queries from several threads
+SQLITE_TEST_DATABASE = Path(tempfile.gettempdir(), f"tg-django-test-{os.getpid()}.sqlite3")
+
+
+def pytest_configure() -> None:
+    """Configure Django before pytest-django sets up the test database, on SQLite unless DATABASE_URL is set."""
+    os.environ.setdefault("PROJECT_KEY", "tg-django-test")
+    os.environ.setdefault("DATABASE_URL", "sqlite://:memory:")
+    # Jobs are claimed from several threads, which needs the busy timeout and IMMEDIATE transactions of the profile
+    os.environ.setdefault("DB_PROFILE", "balanced")
+    init_django()
+    database = settings.DATABASES["default"]
+    if "sqlite" in database["ENGINE"]:
+        database.setdefault("TEST", {}).setdefault("NAME", str(SQLITE_TEST_DATABASE))
+
+
+def pytest_unconfigure() -> None:
+    """Remove the journal files SQLite leaves next to the test database once it's dropped."""
+    for suffix in ("-wal", "-shm"):
+        SQLITE_TEST_DATABASE.with_name(SQLITE_TEST_DATABASE.name + suffix).unlink(missing_ok=True)
+
+
+@pytest.fixture(autouse=True)
+def clear_caches() -> Iterator[None]:
+    """Start every test with empty user caches."""
+    # Importing the models needs the settings pytest_configure sets up
+    from sqlitedb.models import user_cache  # noqa: PLC0415
+
+    user_cache.local.clear()
+    cache.clear()
+    yield
+    user_cache.local.clear()
+    cache.clear()
+
+
+# Source of a command module written by the command_package fixture, {version} is part of the replies
+COMMAND_MODULE = """
+from telegram.commands.base import BaseCommand, CommandRegistry
+
+
+@CommandRegistry.register("{name}")
+class EchoCommand(BaseCommand):
+    \"\"\"Repeat the message.\"\"\"
+
+    def get_pattern(self):
+        return r"^/{name}(?: (.+))?$"
+
+    def get_usage(self):
+        return "Repeat the message."
+
+    async def handle(self, event):
+        await self.reply(event, f"{version} {{event.pattern_match.group(1)}}")
+"""
+
+
+@pytest.fixture
+def command_package(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> Iterator[tuple[str, Callable[[str, str, str], Path]]]:
+    """Return the name of an empty command package and a function writing command modules into it.
+
+    The command registry and the router are emptied for the test and restored afterwards, the shared
+    components are left out so commands handle their messages inline.
+    """
+    from telegram.commands.base import BaseCommand, CommandRegistry  # noqa: PLC0415
+    from telegram.commands.router import CommandRouter  # noqa: PLC0415
+
+    package = f"commands_{uuid.uuid4().hex}"
+    directory = tmp_path / package
+    directory.mkdir()
+    (directory / "__init__.py").touch()
+    monkeypatch.syspath_prepend(str(tmp_path))
+    # Rewrites within the same second would otherwise be served from the stale bytecode of the first version
+    monkeypatch.setattr(sys, "dont_write_bytecode", True)
+    for registry in ("_commands", "_specs", "_instances"):
+        monkeypatch.setattr(CommandRegistry, registry, {})
+    monkeypatch.setattr(BaseCommand, "router", CommandRouter())
+    for component in ("dispatcher", "outbox", "limiter", "activity", "jobs", "profiler"):
+        monkeypatch.setattr(BaseCommand, component, None)
+
+    def write(module: str, name: str, version: str) -> Path:
+        path = directory / f"{module}.py"
+        path.write_text(textwrap.dedent(COMMAND_MODULE.format(name=name, version=version)))
+        importlib.invalidate_caches()
+        return path
+
+    yield package, write
+    for module in [module for module in sys.modules if module.split(".")[0] == package]:
+        del sys.modules[module]
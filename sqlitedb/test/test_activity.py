@@ -0,0 +1,98 @@
+"""Tests of the write-behind activity tracker."""
+
+import asyncio
+from typing import Any
+
+import pytest
+from django.utils import timezone
+
+from sqlitedb.models import User
+from sqlitedb.utils import UserType
+from telegram.activity import ActivityTracker
+
+
+def create_users(*telegram_ids: int) -> None:
+    """Create a user for every Telegram ID."""
+    for telegram_id in telegram_ids:
+        User.objects.create(telegram_id=telegram_id, name=f"User {telegram_id}", user_type=UserType.USER.value)
+
+
+def counts() -> dict[int, int]:
+    """Return the command count of every user."""
+    return dict(User.objects.values_list("telegram_id", "command_count"))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_flush_writes_coalesced_activity() -> None:
+    create_users(1, 2, 3)
+    tracker = ActivityTracker()
+    before = timezone.now()
+    for telegram_id in (1, 1, 2, 1, 4):
+        tracker.record(telegram_id)
+    assert tracker.pending == 3
+
+    # The unknown user 4 matches no row
+    assert asyncio.run(tracker.flush()) == 2
+    assert counts() == {1: 3, 2: 1, 3: 0}
+    assert User.objects.get(telegram_id=1).last_seen >= before
+    assert User.objects.get(telegram_id=3).last_seen is None
+    assert tracker.pending == 0
+
+    tracker.record(2)
+    asyncio.run(tracker.flush())
+    assert counts() == {1: 3, 2: 2, 3: 0}
+    assert (tracker.stats.recorded, tracker.stats.flushes, tracker.stats.rows_written) == (6, 2, 3)
+
+
+def test_new_users_are_dropped_once_full() -> None:
+    tracker = ActivityTracker(max_pending=2)
+    for telegram_id in (1, 2, 3, 1):
+        tracker.record(telegram_id)
+    assert tracker.pending == 2
+    assert (tracker.stats.recorded, tracker.stats.dropped) == (3, 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_failed_flushes_keep_the_activity(monkeypatch: pytest.MonkeyPatch) -> None:
+    create_users(1)
+    tracker = ActivityTracker()
+    tracker.record(1)
+
+    def fail(_: Any) -> int:
+        raise ConnectionError
+
+    with monkeypatch.context() as patch:
+        patch.setattr(tracker, "_write", fail)
+        with pytest.raises(ConnectionError):
+            asyncio.run(tracker.flush())
+    tracker.record(1)
+    asyncio.run(tracker.flush())
+    assert counts() == {1: 2}
+    assert tracker.stats.failed_flushes == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_flushes_as_soon_as_the_buffer_is_full() -> None:
+    create_users(1, 2)
+    tracker = ActivityTracker(flush_interval=60, max_pending=1)
+
+    async def run() -> None:
+        flushed, flush = asyncio.Event(), tracker.flush
+
+        async def flush_once() -> int:
+            rows = await flush()
+            flushed.set()
+            return rows
+
+        tracker.flush = flush_once  # type: ignore[method-assign]
+        task = asyncio.create_task(tracker.run())
+        tracker.record(1)
+        tracker.record(2)
+        async with asyncio.timeout(5):
+            await flushed.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert counts() == {1: 1, 2: 0}
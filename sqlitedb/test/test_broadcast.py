@@ -0,0 +1,95 @@
+"""Tests of the broadcast engine."""
+
+import asyncio
+from typing import Any, Self
+
+import pytest
+from telethon.errors import UserIsBlockedError
+
+from scripts.fakes import FakeClient, make_user
+from sqlitedb.models import Broadcast, User
+from sqlitedb.utils import BroadcastState, UserStatus, UserType
+from telegram.broadcast import BroadcastEngine
+from telegram.outbound import Outbox
+
+
+class BlockingClient(FakeClient):
+    """Client whose sends to the ``blocked_by`` users fail like Telegram's do."""
+
+    def __init__(self: Self, blocked_by: set[int]) -> None:
+        super().__init__()
+        self.blocked_by = blocked_by
+
+    async def send_message(self: Self, entity: Any, message: Any = "", **kwargs: Any) -> Any:
+        if entity.user_id in self.blocked_by:
+            raise UserIsBlockedError(request=None)
+        return await super().send_message(entity, message, **kwargs)
+
+
+def create_users(*telegram_ids: int) -> None:
+    """Create an active user for every Telegram ID."""
+    User.objects.bulk_create(
+        User(telegram_id=telegram_id, name=f"User {telegram_id}", user_type=UserType.USER.value)
+        for telegram_id in telegram_ids
+    )
+
+
+def run(client: FakeClient, broadcast: Broadcast, chunk_size: int = 2) -> Any:
+    """Run ``broadcast`` on ``client`` and return its report."""
+
+    async def send() -> Any:
+        engine = BroadcastEngine(client, Outbox(global_rate=1000, global_burst=1000), chunk_size=chunk_size)
+        return await engine.run(broadcast)
+
+    return asyncio.run(send())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_broadcast_reaches_every_active_user() -> None:
+    create_users(1, 2, 3, 4, 5)
+    User.objects.filter(telegram_id=3).update(status=UserStatus.SUSPENDED.value)
+    client = BlockingClient(blocked_by={4})
+    broadcast = asyncio.run(BroadcastEngine.create("Hello"))
+
+    report = run(client, broadcast)
+    assert sorted(sent.entity.user_id for sent in client.sent) == [1, 2, 5]
+    assert (report.sent, report.failed, report.blocked) == (3, 0, 1)
+    assert User.objects.get(telegram_id=4).status == UserStatus.BLOCKED.value
+    broadcast.refresh_from_db()
+    assert (broadcast.state, broadcast.sent, broadcast.blocked) == (BroadcastState.DONE.value, 3, 1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_broadcast_resumes_after_its_checkpoint() -> None:
+    create_users(1, 2, 3)
+    broadcast = asyncio.run(BroadcastEngine.create("Hello"))
+    broadcast.last_user_id = User.objects.get(telegram_id=2).id
+    client = FakeClient()
+
+    run(client, broadcast)
+    assert [sent.entity.user_id for sent in client.sent] == [3]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_broadcast_filters_user_types() -> None:
+    create_users(1)
+    User.objects.create(telegram_id=2, name="Group", user_type=UserType.GROUP.value)
+    client = FakeClient()
+
+    run(client, asyncio.run(BroadcastEngine.create("Hello", user_types=[UserType.GROUP.value])))
+    assert [sent.entity.channel_id for sent in client.sent] == [2]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_blocked_users_are_reached_again_once_they_message_the_bot() -> None:
+    create_users(1)
+    run(BlockingClient(blocked_by={1}), asyncio.run(BroadcastEngine.create("First")))
+    assert User.objects.get(telegram_id=1).status == UserStatus.BLOCKED.value
+
+    snapshot = asyncio.run(User.objects.get_user(make_user(1)))
+    assert snapshot.status == UserStatus.ACTIVE.value
+    assert User.objects.get(telegram_id=1).status == UserStatus.ACTIVE.value
+
+    client = FakeClient()
+    run(client, asyncio.run(BroadcastEngine.create("Second")))
+    assert [sent.message for sent in client.sent] == ["Second"]
@@ -0,0 +1,212 @@
+"""Tests of the tiered user cache and its invalidation."""
+
+import asyncio
+
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+
+from scripts.fakes import make_user
+from sqlitedb.cache import LRUCache, SingleFlight, TieredCache
+from sqlitedb.models import User, UserSnapshot, user_cache
+from sqlitedb.utils import UserStatus, UserType
+
+
+def make_cache() -> TieredCache:
+    """Return a tiered cache on a private backend."""
+    return TieredCache("test", LRUCache(100, 60), LocMemCache("test-tiered-cache", {}))
+
+
+def test_lookup_falls_back_to_the_backend() -> None:
+    cache = make_cache()
+    cache.set(1, "value")
+    cache.local.clear()
+    assert cache.get(1) == "value"
+    assert cache.get(1) == "value"
+    assert (cache.stats.backend_hits, cache.stats.local_hits) == (1, 1)
+
+
+def test_invalidate_drops_both_tiers() -> None:
+    cache = make_cache()
+    cache.set(1, "value")
+    assert cache.invalidate(1) == 1
+    assert cache.get(1) is None
+    assert cache.invalidate(1) == 2
+
+
+def test_stale_fill_is_refused() -> None:
+    cache = make_cache()
+    value, stamp = cache.lookup(1)
+    assert value is None
+    # A write lands between the read from the database and the fill
+    cache.invalidate(1)
+    cache.set(1, "stale", stamp)
+    assert cache.get(1) is None
+
+
+def test_other_processes_ignore_retired_records() -> None:
+    backend = LocMemCache("test-shared-cache", {})
+    writer = TieredCache("test", LRUCache(100, 60), backend)
+    reader = TieredCache("test", LRUCache(100, 60), backend)
+    _, stamp = reader.lookup(1)
+    writer.invalidate(1)
+    reader.set(1, "stale", stamp)
+    reader.local.clear()
+    assert reader.get(1) is None
+
+
+class Load:
+    """Load counting its calls, finishing once released."""
+
+    def __init__(self) -> None:
+        """Start unreleased."""
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> str:
+        """Return the loaded value, or raise the error it's set up with."""
+        self.calls += 1
+        await self.release.wait()
+        return f"value {self.calls}"
+
+
+def test_single_flight_shares_results_and_errors() -> None:
+    flight: SingleFlight[str] = SingleFlight()
+
+    async def fail() -> str:
+        await asyncio.sleep(0.01)
+        raise LookupError
+
+    async def run() -> tuple[list[str], list[BaseException | str]]:
+        load = Load()
+        calls = [asyncio.create_task(flight.do(1, load)) for _ in range(3)]
+        await asyncio.sleep(0)
+        load.release.set()
+        failed = await asyncio.gather(*(flight.do(2, fail) for _ in range(3)), return_exceptions=True)
+        return await asyncio.gather(*calls), failed
+
+    results, failed = asyncio.run(run())
+    assert results == ["value 1"] * 3
+    assert all(isinstance(result, LookupError) for result in failed)
+    assert (flight.stats.calls, flight.stats.executions, flight.stats.coalesced) == (6, 2, 4)
+    assert len(flight) == 0
+
+
+def test_single_flight_follower_retries_when_the_leader_is_cancelled() -> None:
+    flight: SingleFlight[str] = SingleFlight()
+    load = Load()
+
+    async def run() -> list[str]:
+        leader = asyncio.create_task(flight.do(1, load))
+        await asyncio.sleep(0)
+        followers = [asyncio.create_task(flight.do(1, load)) for _ in range(2)]
+        await asyncio.sleep(0)
+        leader.cancel()
+        # The leader stops, then the followers resume and one of them loads again
+        for _ in range(3):
+            await asyncio.sleep(0)
+        assert load.calls == 2
+        load.release.set()
+        return await asyncio.gather(*followers)
+
+    assert asyncio.run(run()) == ["value 2"] * 2
+    assert (flight.stats.executions, flight.stats.coalesced) == (2, 1)
+
+
+def test_single_flight_cancelled_follower_leaves_the_others() -> None:
+    flight: SingleFlight[str] = SingleFlight()
+    load = Load()
+
+    async def run() -> tuple[str, bool]:
+        leader = asyncio.create_task(flight.do(1, load))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do(1, load))
+        await asyncio.sleep(0)
+        follower.cancel()
+        await asyncio.sleep(0)
+        load.release.set()
+        return await leader, follower.cancelled()
+
+    assert asyncio.run(run()) == ("value 1", True)
+    assert load.calls == 1
+
+
+def create_user(telegram_id: int, name: str = "Before") -> User:
+    """Create a user, which writes its snapshot through to the cache."""
+    user: User = User.objects.create(telegram_id=telegram_id, name=name, user_type=UserType.USER.value)
+    return user
+
+
+@pytest.mark.django_db(transaction=True)
+def test_save_writes_through() -> None:
+    user = create_user(1001)
+    assert user_cache.get(1001) == UserSnapshot.from_model(user)
+
+    user.name = "After"
+    user.save()
+    assert user_cache.get(1001).name == "After"
+    # Other processes read the new record from the backend
+    user_cache.local.clear()
+    assert user_cache.get(1001).name == "After"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_partial_saves_write_through_only_what_they_saved() -> None:
+    user = create_user(1007)
+    # Changed on the instance but not saved
+    user.name = "Unsaved"
+    user.command_count = 3
+    user.save(update_fields=["command_count"])
+    assert user_cache.get(1007).name == "Before"
+
+    user.name = "After"
+    user.save(update_fields=["name"])
+    assert user_cache.get(1007) is None
+    assert asyncio.run(User.objects.get_user(make_user(1007))).name == "After"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_saving_deferred_users_invalidates() -> None:
+    create_user(1008)
+    user = User.objects.only("id", "telegram_id", "name").get(telegram_id=1008)
+    user.name = "After"
+    user.save()
+    assert user_cache.get(1008) is None
+    assert asyncio.run(User.objects.get_user(make_user(1008))).name == "After"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_update_invalidates() -> None:
+    create_user(1002)
+    assert user_cache.get(1002) is not None
+
+    User.objects.filter(telegram_id=1002).update(status=UserStatus.SUSPENDED.value)
+    assert user_cache.get(1002) is None
+    snapshot = asyncio.run(User.objects.get_user(make_user(1002)))
+    assert snapshot.status == UserStatus.SUSPENDED.value
+
+
+@pytest.mark.django_db(transaction=True)
+def test_bulk_update_invalidates() -> None:
+    user = create_user(1003)
+    user.name = "After"
+    User.objects.bulk_update([user], ["name"])
+    assert user_cache.get(1003) is None
+    assert asyncio.run(User.objects.get_user(make_user(1003))).name == "After"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_activity_update_keeps_the_cache() -> None:
+    create_user(1004)
+    User.objects.filter(telegram_id=1004).update(command_count=5)
+    assert user_cache.get(1004) is not None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_delete_invalidates() -> None:
+    user = create_user(1005)
+    user.delete()
+    assert user_cache.get(1005) is None
+
+    create_user(1006)
+    User.objects.filter(telegram_id=1006).delete()
+    assert user_cache.get(1006) is None
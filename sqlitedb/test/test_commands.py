@@ -0,0 +1,63 @@
+"""Tests of the lazy discovery and loading of command modules."""
+
+import asyncio
+import functools
+import subprocess
+import sys
+from collections.abc import Callable
+from pathlib import Path
+
+from environs import Env
+
+from scripts.fakes import FakeClient, FakeEvent, make_user
+from telegram.commands.base import BaseCommand, CommandRegistry
+
+CommandPackage = tuple[str, Callable[[str, str, str], Path]]
+
+
+def send(client: FakeClient, text: str) -> list[str]:
+    """Send ``text`` to the handlers of ``client`` and return the replies."""
+    client.sent.clear()
+    asyncio.run(client.emit(FakeEvent(client, text, make_user(1))))
+    return [sent.message for sent in client.sent]
+
+
+def test_discovery_reads_commands_without_importing_them(command_package: CommandPackage) -> None:
+    package, write = command_package
+    write("echo", "echo", "v1")
+    write("shout", "shout", "v1")
+
+    assert CommandRegistry.discover(package) == ["echo", "shout"]
+    spec = CommandRegistry.get_spec("echo")
+    assert spec is not None
+    assert (spec.module, spec.summary, spec.usage) == (f"{package}.echo", "Repeat the message.", "Repeat the message.")
+    assert CommandRegistry.get_names() == ["echo", "shout"]
+    assert f"{package}.echo" not in sys.modules
+
+    command = CommandRegistry.get_command("echo")
+    assert command is not None
+    assert command.name == "echo"
+    assert f"{package}.echo" in sys.modules
+    assert f"{package}.shout" not in sys.modules
+
+
+def test_commands_load_on_their_first_message(command_package: CommandPackage) -> None:
+    package, write = command_package
+    write("echo", "echo", "v1")
+    write("shout", "shout", "v1")
+    client = FakeClient()
+    CommandRegistry.discover(package)
+    for name in CommandRegistry.get_names():
+        BaseCommand.router.add_lazy(name, functools.partial(CommandRegistry.load, name, Env(), client))
+    BaseCommand.router.attach(client)
+
+    assert send(client, "/echo hi") == ["v1 hi"]
+    assert send(client, "/echo again") == ["v1 again"]
+    assert f"{package}.shout" not in sys.modules
+    assert send(client, "/unknown") == []
+
+
+def test_starting_the_bot_imports_no_command_module() -> None:
+    check = "import sys, telegram.replier; print(sorted(m for m in sys.modules if m.startswith('telegram.commands.')))"
+    result = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "['telegram.commands.base', 'telegram.commands.router']"
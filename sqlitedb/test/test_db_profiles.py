@@ -0,0 +1,71 @@
+"""Tests of the DB_PROFILE database tuning."""
+
+from typing import Any
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+
+from manage import DB_PROFILES, apply_db_profile
+
+SQLITE = "django.db.backends.sqlite3"
+POSTGRESQL = "django.db.backends.postgresql"
+
+
+def database(engine: str, **settings: Any) -> dict[str, Any]:
+    """Return a database configuration like the one parsed from DATABASE_URL."""
+    return {"ENGINE": engine, "NAME": "bot", **settings}
+
+
+@pytest.mark.parametrize("engine", [SQLITE, POSTGRESQL])
+def test_none_leaves_the_database_untouched(engine: str) -> None:
+    assert apply_db_profile(database(engine), "none") == database(engine)
+
+
+def test_sqlite_pragmas_run_on_every_connection() -> None:
+    options = apply_db_profile(database(SQLITE), "balanced")["OPTIONS"]
+    assert options["init_command"].split(";") == [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA busy_timeout=5000",
+        "PRAGMA cache_size=-20000",
+        f"PRAGMA mmap_size={128 * 2**20}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    assert (options["transaction_mode"], options["timeout"]) == ("IMMEDIATE", 5)
+
+
+def test_explicit_options_win() -> None:
+    tuned = apply_db_profile(
+        database(SQLITE, OPTIONS={"init_command": "PRAGMA foreign_keys=ON", "transaction_mode": "DEFERRED"}),
+        "throughput",
+    )
+    assert tuned["OPTIONS"]["init_command"].endswith(";PRAGMA foreign_keys=ON")
+    assert tuned["OPTIONS"]["transaction_mode"] == "DEFERRED"
+
+    assert apply_db_profile(database(POSTGRESQL, CONN_MAX_AGE=5), "balanced")["CONN_MAX_AGE"] == 5
+
+
+def test_postgresql_connections_persist() -> None:
+    tuned = apply_db_profile(database(POSTGRESQL), "balanced")
+    assert (tuned["CONN_MAX_AGE"], tuned["CONN_HEALTH_CHECKS"]) == (60, True)
+
+
+def test_postgresql_pool_needs_psycopg_pool(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("manage.find_spec", lambda _: object())
+    tuned = apply_db_profile(database(POSTGRESQL), "throughput")
+    assert (tuned["OPTIONS"]["pool"], tuned["CONN_MAX_AGE"]) == (DB_PROFILES["throughput"]["postgresql"]["pool"], 0)
+
+    monkeypatch.setattr("manage.find_spec", lambda _: None)
+    tuned = apply_db_profile(database(POSTGRESQL), "throughput")
+    assert "pool" not in tuned.get("OPTIONS", {})
+    assert tuned["CONN_MAX_AGE"] is None
+
+
+def test_other_vendors_are_left_alone() -> None:
+    mysql = database("django.db.backends.mysql")
+    assert apply_db_profile(dict(mysql), "throughput") == mysql
+
+
+def test_unknown_profiles_are_rejected() -> None:
+    with pytest.raises(ImproperlyConfigured, match="Unknown DB_PROFILE 'fast'"):
+        apply_db_profile(database(SQLITE), "fast")
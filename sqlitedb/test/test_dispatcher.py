@@ -0,0 +1,110 @@
+"""Tests of the per-chat ordered update dispatcher."""
+
+import asyncio
+
+import pytest
+
+from telegram.dispatcher import UpdateDispatcher
+
+
+def test_updates_of_a_chat_keep_their_order() -> None:
+    dispatcher = UpdateDispatcher(workers=4)
+    handled: dict[int, list[int]] = {}
+
+    async def handle(update: tuple[int, int]) -> None:
+        chat_id, number = update
+        # Later updates finish faster, they would overtake earlier ones without the ordering
+        await asyncio.sleep(0.001 * (10 - number))
+        handled.setdefault(chat_id, []).append(number)
+
+    async def run() -> None:
+        for number in range(10):
+            for chat_id in (1, 2, 3):
+                await dispatcher.submit(chat_id, handle, (chat_id, number))
+        await dispatcher.close()
+
+    asyncio.run(run())
+    assert handled == {chat_id: list(range(10)) for chat_id in (1, 2, 3)}
+    assert (dispatcher.stats.submitted, dispatcher.stats.completed) == (30, 30)
+
+
+def test_chats_are_handled_concurrently() -> None:
+    dispatcher = UpdateDispatcher(workers=2)
+    started: list[int] = []
+    release = asyncio.Event()
+
+    async def handle(chat_id: int) -> None:
+        started.append(chat_id)
+        await release.wait()
+
+    async def run() -> list[int]:
+        await dispatcher.submit(0, handle, 0)
+        await dispatcher.submit(1, handle, 1)
+        await asyncio.sleep(0.01)
+        running = list(started)
+        release.set()
+        await dispatcher.close()
+        return running
+
+    assert sorted(asyncio.run(run())) == [0, 1]
+
+
+def test_close_handles_the_queued_updates() -> None:
+    dispatcher = UpdateDispatcher(workers=1, queue_size=10)
+    handled: list[int] = []
+
+    async def handle(number: int) -> None:
+        await asyncio.sleep(0)
+        handled.append(number)
+
+    async def run() -> int:
+        for number in range(5):
+            await dispatcher.submit(1, handle, number)
+        depth = dispatcher.depth
+        await dispatcher.close()
+        return depth
+
+    assert asyncio.run(run()) > 0
+    assert handled == list(range(5))
+    assert dispatcher.depth == 0
+
+
+def test_failures_dont_stop_the_shard() -> None:
+    dispatcher = UpdateDispatcher(workers=1)
+    handled: list[int] = []
+
+    async def handle(number: int) -> None:
+        if number == 1:
+            msg = "broken handler"
+            raise RuntimeError(msg)
+        handled.append(number)
+
+    async def run() -> None:
+        for number in range(3):
+            await dispatcher.submit(1, handle, number)
+        await dispatcher.close()
+
+    asyncio.run(run())
+    assert handled == [0, 2]
+    assert (dispatcher.stats.completed, dispatcher.stats.failed) == (2, 1)
+
+
+def test_full_shards_apply_backpressure() -> None:
+    dispatcher = UpdateDispatcher(workers=1, queue_size=1)
+
+    async def handle(_: int) -> None:
+        await asyncio.sleep(0.001)
+
+    async def run() -> None:
+        for number in range(4):
+            await dispatcher.submit(1, handle, number)
+        await dispatcher.close()
+
+    asyncio.run(run())
+    assert dispatcher.stats.backpressure_waits > 0
+    assert dispatcher.stats.max_depth == 1
+
+
+def test_needs_a_worker() -> None:
+    with pytest.raises(ValueError, match="at least one worker"):
+        UpdateDispatcher(workers=0)
@@ -0,0 +1,51 @@
+"""Tests of the entity resolution of get_telegram_user."""
+
+import asyncio
+import dataclasses
+from collections.abc import Iterator
+
+import pytest
+
+from scripts.fakes import FakeClient, FakeEvent, make_user
+from telegram.utils import entity_cache, entity_stats, get_telegram_user
+
+
+@pytest.fixture(autouse=True)
+def clear_entities() -> Iterator[None]:
+    """Start with an empty entity cache."""
+    entity_cache.clear()
+    yield
+    entity_cache.clear()
+
+
+def resolve(event: FakeEvent) -> tuple[int, tuple[int, int, int]]:
+    """Return the ID of the user resolved for ``event`` and how ``entity_stats`` changed meanwhile."""
+    before = dataclasses.astuple(entity_stats)
+    user = asyncio.run(get_telegram_user(event))
+    after = dataclasses.astuple(entity_stats)
+    return user.id, (after[0] - before[0], after[1] - before[1], after[2] - before[2])
+
+
+def without_entity(client: FakeClient, user_id: int) -> FakeEvent:
+    """Return a message of ``user_id`` whose update didn't carry their entity."""
+    event = FakeEvent(client, "/start", make_user(user_id))
+    event.chat = None
+    return event
+
+
+def test_entities_of_updates_are_cached() -> None:
+    client = FakeClient()
+    assert resolve(FakeEvent(client, "/start", make_user(1))) == (1, (1, 0, 0))
+    assert resolve(without_entity(client, 1)) == (1, (0, 1, 0))
+
+
+def test_misses_request_the_entity_once() -> None:
+    client = FakeClient()
+    client.entities[2] = make_user(2)
+    assert resolve(without_entity(client, 2)) == (2, (0, 0, 1))
+    assert resolve(without_entity(client, 2)) == (2, (0, 1, 0))
+
+
+def test_unknown_peers_fall_back_to_the_sender() -> None:
+    assert resolve(without_entity(FakeClient(), 3)) == (3, (0, 0, 1))
+    assert entity_cache.get(3) is not None
@@ -0,0 +1,78 @@
+"""Tests of the status gate dropping updates of suspended and banned users."""
+
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from django.utils import timezone
+
+from sqlitedb.models import User
+from sqlitedb.utils import UserStatus, UserType
+from telegram.gate import StatusGate
+
+
+def event(sender_id: int, chat_id: int | None = None) -> SimpleNamespace:
+    """Return an update of ``sender_id`` in ``chat_id``, their private chat by default."""
+    return SimpleNamespace(sender_id=sender_id, chat_id=sender_id if chat_id is None else chat_id)
+
+
+def create_user(telegram_id: int, status: UserStatus = UserStatus.ACTIVE, **fields: object) -> None:
+    """Create a user with ``status``."""
+    User.objects.create(
+        telegram_id=telegram_id,
+        name=f"User {telegram_id}",
+        user_type=UserType.USER.value,
+        status=status.value,
+        **fields,
+    )
+
+
+def test_gate_drops_senders_and_chats() -> None:
+    gate = StatusGate()
+    assert gate.allows(event(1))
+    gate.gate(1)
+    gate.gate(2)
+    assert not gate.allows(event(1))
+    # Groups are gated by their ID without the -100 prefix of their chat ID
+    assert not gate.allows(event(3, chat_id=-1000000000002))
+    assert gate.allows(event(3, chat_id=-1000000000004))
+    assert gate.stats.dropped == 2
+
+
+def test_temporary_gates_open_on_time() -> None:
+    now = timezone.now()
+    gate = StatusGate(clock=now.timestamp)
+    gate.gate(1, now + timedelta(seconds=1))
+    assert gate.is_gated(1)
+    gate.clock = (now + timedelta(seconds=1)).timestamp
+    assert not gate.is_gated(1)
+    assert len(gate) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_gates_suspended_and_banned_users() -> None:
+    create_user(1, UserStatus.SUSPENDED)
+    create_user(2, UserStatus.TEMP_BANNED, banned_until=timezone.now() + timedelta(hours=1))
+    create_user(3)
+    gate = StatusGate()
+    asyncio.run(gate.load())
+    assert [gate.is_gated(telegram_id) for telegram_id in (1, 2, 3)] == [True, True, False]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_refresh_applies_changes_and_ends_bans() -> None:
+    create_user(1)
+    create_user(2, UserStatus.SUSPENDED)
+    create_user(3, UserStatus.TEMP_BANNED, banned_until=timezone.now() + timedelta(hours=1))
+    gate = StatusGate()
+    asyncio.run(gate.load())
+
+    User.objects.filter(telegram_id=1).update(status=UserStatus.SUSPENDED.value)
+    User.objects.filter(telegram_id=2).update(status=UserStatus.ACTIVE.value)
+    # Over while the gate still held it, the refresh ends the ban in the database too
+    User.objects.filter(telegram_id=3).update(banned_until=timezone.now() - timedelta(seconds=1))
+    asyncio.run(gate.refresh())
+    assert [gate.is_gated(telegram_id) for telegram_id in (1, 2, 3)] == [True, False, False]
+    assert User.objects.get(telegram_id=3).status == UserStatus.ACTIVE.value
+    assert (gate.stats.refreshes, gate.stats.expired) == (1, 1)
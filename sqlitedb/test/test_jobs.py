@@ -0,0 +1,179 @@
+"""Tests of the durable job queue."""
+
+import asyncio
+import threading
+from typing import Any
+
+import pytest
+from django.db import connection
+
+from scripts.fakes import FakeClient
+from sqlitedb.models import LAPSED_JOB_ERROR, Job
+from sqlitedb.utils import JobState
+from telegram.jobs import JobRegistry, JobWorker
+from telegram.strings import job_failed
+
+# Attempts made by the flaky job, by job ID
+flaky_attempts: dict[int, int] = {}
+
+
+@JobRegistry.register("test_echo")
+async def echo(payload: dict[str, Any]) -> Any:
+    """Return the payload's value."""
+    return payload.get("value")
+
+
+@JobRegistry.register("test_flaky")
+async def flaky(payload: dict[str, Any]) -> Any:
+    """Fail the first ``failures`` attempts."""
+    attempts = flaky_attempts[payload["id"]] = flaky_attempts.get(payload["id"], 0) + 1
+    if attempts <= payload["failures"]:
+        msg = f"Attempt {attempts} failed"
+        raise RuntimeError(msg)
+    return "recovered"
+
+
+@JobRegistry.register("test_unserializable")
+async def unserializable(_: dict[str, Any]) -> Any:
+    """Return a result that can't be stored as JSON."""
+    return object()
+
+
+def enqueue(name: str = "test_echo", **kwargs: Any) -> Job:
+    """Add a job to the queue from synchronous code."""
+    return asyncio.run(JobWorker.enqueue(name, **kwargs))
+
+
+def test_enqueue_rejects_unknown_jobs() -> None:
+    with pytest.raises(ValueError, match="No job registered"):
+        enqueue("test_missing")
+
+
+@pytest.mark.django_db(transaction=True)
+def test_claim_locks_due_jobs_oldest_first() -> None:
+    first, second = enqueue(), enqueue()
+    enqueue(delay=3600)
+
+    claimed = Job.objects.claim("worker", 10, 60)
+    assert [job.id for job in claimed] == [first.id, second.id]
+    assert all(job.state == JobState.RUNNING.value and job.attempts == 1 for job in claimed)
+    assert Job.objects.claim("other", 10, 60) == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_claim_respects_the_limit() -> None:
+    for _ in range(3):
+        enqueue()
+    assert len(Job.objects.claim("worker", 2, 60)) == 2
+    assert len(Job.objects.claim("worker", 2, 60)) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_claim_takes_over_lapsed_locks() -> None:
+    job = enqueue()
+    Job.objects.claim("crashed", 1, 0)
+
+    [claimed] = Job.objects.claim("worker", 1, 60)
+    assert (claimed.id, claimed.locked_by, claimed.attempts) == (job.id, "worker", 2)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_claim_fails_lapsed_jobs_out_of_attempts() -> None:
+    job = enqueue(max_attempts=2)
+    Job.objects.claim("crashed", 1, 0)
+    Job.objects.claim("crashed again", 1, 0)
+
+    assert Job.objects.claim("worker", 1, 60) == []
+    job.refresh_from_db()
+    assert (job.state, job.attempts, job.error) == (JobState.FAILED.value, 2, LAPSED_JOB_ERROR)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_claims_never_share_a_job() -> None:
+    jobs = {enqueue().id for _ in range(30)}
+    claims: dict[str, list[int]] = {}
+    start = threading.Barrier(4)
+
+    def claim_all(worker: str) -> None:
+        try:
+            start.wait()
+            claims[worker] = []
+            while claimed := Job.objects.claim(worker, 3, 60):
+                claims[worker].extend(job.id for job in claimed)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=claim_all, args=(f"worker-{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    claimed_ids = [job_id for ids in claims.values() for job_id in ids]
+    assert sorted(claimed_ids) == sorted(jobs)
+    for worker, ids in claims.items():
+        assert set(Job.objects.filter(locked_by=worker).values_list("id", flat=True)) == set(ids)
+    assert set(Job.objects.values_list("attempts", flat=True)) == {1}
+
+
+async def run_until_settled(worker: JobWorker, job: Job, seconds: float = 10) -> Job:
+    """Run ``worker`` until ``job`` is done or failed, for at most ``seconds``, and return it."""
+    task = asyncio.create_task(worker.run())
+    try:
+        async with asyncio.timeout(seconds):
+            while True:
+                job = await Job.objects.aget(id=job.id)
+                if job.state in {JobState.DONE.value, JobState.FAILED.value}:
+                    return job
+                await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+        await worker.close()
+        await asyncio.gather(task, return_exceptions=True)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_failed_attempts_are_retried() -> None:
+    client = FakeClient()
+    worker = JobWorker(client, poll_interval=0.01, backoff=0)
+
+    async def run() -> Job:
+        job = await JobWorker.enqueue("test_flaky", {"id": 1, "failures": 2}, chat_id=42, reply_to=7)
+        return await run_until_settled(worker, job)
+
+    job = asyncio.run(run())
+    assert (job.state, job.attempts, job.result) == (JobState.DONE.value, 3, "recovered")
+    assert (worker.stats.retried, worker.stats.succeeded) == (2, 1)
+    assert [(sent.entity, sent.message, sent.kwargs) for sent in client.sent] == [(42, "recovered", {"reply_to": 7})]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_jobs_are_given_up_after_their_last_attempt() -> None:
+    client = FakeClient()
+    worker = JobWorker(client, poll_interval=0.01, backoff=0)
+
+    async def run() -> Job:
+        job = await JobWorker.enqueue("test_flaky", {"id": 2, "failures": 5}, chat_id=42, max_attempts=2)
+        return await run_until_settled(worker, job)
+
+    job = asyncio.run(run())
+    assert (job.state, job.attempts) == (JobState.FAILED.value, 2)
+    assert "Attempt 2 failed" in job.error
+    assert (worker.stats.retried, worker.stats.failed) == (1, 1)
+    assert [sent.message for sent in client.sent] == [job_failed]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unserializable_results_fail_the_attempt() -> None:
+    client = FakeClient()
+    worker = JobWorker(client, poll_interval=0.01, backoff=0)
+
+    async def run() -> Job:
+        job = await JobWorker.enqueue("test_unserializable", chat_id=42, max_attempts=2)
+        return await run_until_settled(worker, job)
+
+    job = asyncio.run(run())
+    assert (job.state, job.attempts, job.result) == (JobState.FAILED.value, 2, None)
+    assert "not JSON serializable" in job.error
+    assert (worker.stats.retried, worker.stats.failed, worker.stats.succeeded) == (1, 1, 0)
+    assert [sent.message for sent in client.sent] == [job_failed]
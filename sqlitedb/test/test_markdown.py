@@ -0,0 +1,52 @@
+"""Tests of the markdown parse cache and MarkdownTemplate."""
+
+from typing import Any
+
+import pytest
+
+from telegram.utils import CustomMarkdown, MarkdownTemplate, escape_markdown
+
+
+@pytest.mark.parametrize(
+    ("template", "values"),
+    [
+        ("Hii👋, **{name}** `{telegram_id}`", {"name": "Zoë 🦄", "telegram_id": 5_123_456_789}),
+        ("**{a}{b}** and __{c}__", {"a": "x", "b": "", "c": "🦄🚀"}),
+        ("{a} **{b}** {a}", {"a": "😀😀", "b": "b"}),
+        ("[{label}](https://example.com) after", {"label": "link 🔗"}),
+        ("plain {value}", {"value": "text"}),
+        ("no fields, **bold**", {}),
+        ("  {a} **c**  ", {"a": " x "}),
+        ("{a} **{b}**", {"a": "", "b": "🦄 "}),
+        ("**{a}**", {"a": " \n"}),
+    ],
+)
+def test_render_matches_parse(template: str, values: dict[str, Any]) -> None:
+    text, entities = MarkdownTemplate(template).render(**values)
+    parsed_text, parsed_entities = CustomMarkdown.parse(template.format(**values))
+    assert text == parsed_text
+    assert entities == parsed_entities
+
+
+def test_values_are_not_markdown() -> None:
+    text, entities = MarkdownTemplate("Hi {name}").render(name="**not bold**")
+    assert (text, entities) == ("Hi **not bold**", [])
+
+
+def test_entities_around_empty_values_are_dropped() -> None:
+    assert MarkdownTemplate("x **{name}**").render(name="") == ("x", [])
+
+
+def test_parse_returns_copies() -> None:
+    _, entities = CustomMarkdown.parse("**cached**")
+    entities[0].offset = 3
+    _, fresh = CustomMarkdown.parse("**cached**")
+    assert fresh[0].offset == 0
+
+
+@pytest.mark.parametrize("name", ["**bold**", "__x__ ~~y~~", "a`b", "[x](tg://user?id=1)", "***"])
+def test_escaped_text_is_not_markdown(name: str) -> None:
+    text, entities = CustomMarkdown.parse(f"`1` {escape_markdown(name)} `2`")
+    shown = name.replace("`", "\u02cb")
+    assert text.replace("\u200b", "") == f"1 {shown} 2"
+    assert [(e.offset, e.length) for e in entities] == [(0, 1), (len(text) - 1, 1)]
@@ -0,0 +1,131 @@
+"""Tests of the metrics registry, the handler instrumentation and the metrics server."""
+
+import asyncio
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+
+import pytest
+
+from sqlitedb.models import User
+from telegram.metrics import (
+    CallbackGauge,
+    Counter,
+    Histogram,
+    MetricsRegistry,
+    MetricsServer,
+    instrument,
+    registry,
+)
+
+
+@dataclass
+class SampleStats:
+    """Stats with a counter, a gauge and a labelled field."""
+
+    sent: int = 3
+    max_depth: int = 7
+    by_kind: dict[str, int] = field(default_factory=lambda: {"a": 1})
+    label: str = "ignored"
+
+
+def samples(rendered: str) -> list[str]:
+    """Return the sample lines of a rendered registry."""
+    return [line for line in rendered.splitlines() if not line.startswith("#")]
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    histogram = Histogram("latency", "Latency.", ("command",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, "start")
+    assert samples(histogram.render()) == [
+        'latency_bucket{command="start",le="0.1"} 1',
+        'latency_bucket{command="start",le="1"} 3',
+        'latency_bucket{command="start",le="+Inf"} 4',
+        'latency_sum{command="start"} 6.05',
+        'latency_count{command="start"} 4',
+    ]
+
+
+def test_label_values_are_escaped() -> None:
+    counter = Counter("errors_total", "Errors.", ("command",))
+    counter.inc('say "hi"\\\n')
+    assert samples(counter.render()) == ['errors_total{command="say \\"hi\\"\\\\\\n"} 1']
+
+
+def test_stats_become_counters_and_gauges() -> None:
+    metrics = MetricsRegistry()
+    metrics.add_stats("sample", SampleStats())
+    metrics.add_gauge("answer", "The answer.", lambda: 42)
+    rendered = metrics.render()
+    assert "# TYPE tg_sample_sent_total counter" in rendered
+    assert "# TYPE tg_sample_max_depth gauge" in rendered
+    assert samples(rendered) == [
+        "tg_sample_sent_total 3",
+        "tg_sample_max_depth 7",
+        'tg_sample_by_kind_total{key="a"} 1',
+        "tg_answer 42",
+    ]
+
+
+def test_failing_metrics_dont_break_the_others() -> None:
+    metrics = MetricsRegistry()
+    metrics.register(CallbackGauge("tg_broken", "Broken.", lambda: 1 / 0))
+    metrics.add_gauge("fine", "Fine.", lambda: 1)
+    assert samples(metrics.render()) == ["tg_fine 1"]
+
+
+def value(metric_name: str, command: str) -> float:
+    """Return the value of one sample of the global registry."""
+    for line in samples(registry.render()):
+        if line.startswith(f'{metric_name}{{command="{command}"}} '):
+            return float(line.rsplit(" ", 1)[1])
+    return 0.0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_instrument_records_latency_errors_and_queries() -> None:
+    async def handle(_: object) -> None:
+        await User.objects.acount()
+        await User.objects.acount()
+
+    async def fail(_: object) -> None:
+        raise LookupError
+
+    async def run(handler: Callable[[object], Awaitable[None]]) -> None:
+        await instrument("test_instrumented", handler)(None)
+
+    asyncio.run(run(handle))
+    with pytest.raises(LookupError):
+        asyncio.run(run(fail))
+    assert value("tg_command_duration_seconds_count", "test_instrumented") == 2
+    assert value("tg_command_errors_total", "test_instrumented") == 1
+    assert value("tg_command_db_queries_sum", "test_instrumented") == 2
+    assert value("tg_commands_in_flight", "test_instrumented") == 0
+
+
+def test_server_answers_metrics_requests() -> None:
+    metrics = MetricsRegistry()
+    metrics.add_gauge("served", "Served.", lambda: 1)
+    server = MetricsServer(metrics, port=0)
+
+    async def get(path: str) -> bytes:
+        assert server._server is not None  # noqa: SLF001
+        port = server._server.sockets[0].getsockname()[1]  # noqa: SLF001
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        response = await reader.read()
+        writer.close()
+        await writer.wait_closed()
+        return response
+
+    async def run() -> tuple[bytes, bytes]:
+        await server.start()
+        try:
+            return await get("/metrics"), await get("/other")
+        finally:
+            await server.close()
+
+    found, missing = asyncio.run(run())
+    assert found.startswith(b"HTTP/1.1 200 OK")
+    assert found.endswith(b"tg_served 1\n")
+    assert missing.startswith(b"HTTP/1.1 404 Not Found")
@@ -0,0 +1,85 @@
+"""Tests of the native async user store."""
+
+import asyncio
+from collections.abc import Awaitable, Callable, Iterator
+from typing import Any, TypeVar
+
+import pytest
+
+from scripts.fakes import make_user
+from sqlitedb.models import User, UserManager, UserSnapshot, user_cache
+from sqlitedb.sqlite import AioSQLiteUserStore, SQLiteDatabase
+from sqlitedb.utils import UserStatus, UserType
+
+T = TypeVar("T")
+
+
+@pytest.fixture
+def database() -> Iterator[SQLiteDatabase]:
+    """Return a database object using the native store, switching it off afterwards."""
+    database = SQLiteDatabase(native=True)
+    yield database
+    UserManager.native_store = None
+
+
+def run(database: SQLiteDatabase, action: Callable[[], Awaitable[T]]) -> T:
+    """Run ``action`` and close the native connection opened on this event loop."""
+
+    async def main() -> T:
+        try:
+            return await action()
+        finally:
+            await database.close()
+
+    return asyncio.run(main())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_get_user_creates_users_like_the_orm(database: SQLiteDatabase) -> None:
+    assert isinstance(database.native_store, AioSQLiteUserStore)
+    snapshot = run(database, lambda: User.objects.get_user(make_user(2001, "Zoë", "🦄")))
+
+    user = User.objects.get(telegram_id=2001)
+    assert snapshot == UserSnapshot.from_model(user)
+    assert (user.name, user.status, user.user_type, user.command_count) == ("Zoë 🦄", "active", "user", 0)
+    # Dates are stored like the ORM stores them, so the ORM reads them back
+    assert user.joining_date == user.last_updated
+    assert user_cache.get(2001) == snapshot
+
+
+@pytest.mark.django_db(transaction=True)
+def test_get_user_fetches_existing_users(database: SQLiteDatabase) -> None:
+    user = User.objects.create(telegram_id=2002, name="Existing", user_type=UserType.GROUP.value, settings={"a": 1})
+    user_cache.invalidate(2002)
+
+    snapshot = run(database, lambda: User.objects.get_user(make_user(2002)))
+    assert snapshot == UserSnapshot.from_model(user)
+    assert User.objects.count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_user_skips_existing_users(database: SQLiteDatabase) -> None:
+    store = database.native_store
+    assert store is not None
+
+    async def create_twice() -> list[Any]:
+        return [await store.create_user(2003, "First", UserType.USER.value) for _ in range(2)]
+
+    first, second = run(database, create_twice)
+    assert first is not None
+    assert second is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_update_user_retires_the_cached_snapshot(database: SQLiteDatabase) -> None:
+    User.objects.create(telegram_id=2004, name="Before", user_type=UserType.USER.value)
+    assert user_cache.get(2004) is not None
+
+    rows = run(database, lambda: database.update_user(2004, status=UserStatus.SUSPENDED.value))
+    assert rows == 1
+    assert user_cache.get(2004) is None
+    assert User.objects.get(telegram_id=2004).status == UserStatus.SUSPENDED.value
+
+
+def test_close_is_safe_before_connecting(database: SQLiteDatabase) -> None:
+    asyncio.run(database.close())
@@ -0,0 +1,100 @@
+"""Tests of the rate limited outbox."""
+
+import asyncio
+from typing import Any, Self
+
+import pytest
+
+from scripts.fakes import FakeClient
+from telegram.outbound import Outbox, TokenBucket
+
+
+class VirtualTime:
+    """Clock and sleep for the outbox that skip ahead instead of waiting."""
+
+    def __init__(self: Self) -> None:
+        """Start at 0."""
+        self.now = 0.0
+
+    def clock(self: Self) -> float:
+        """Return the current virtual time."""
+        return self.now
+
+    async def sleep(self: Self, seconds: float) -> None:
+        """Let the other tasks run, then skip ``seconds`` ahead."""
+        await asyncio.sleep(0)
+        self.now += seconds
+
+
+def test_token_bucket_allows_a_burst_then_paces() -> None:
+    time = VirtualTime()
+    bucket = TokenBucket(rate=2, capacity=3, clock=time.clock)
+    assert [bucket.reserve() for _ in range(5)] == [0, 0, 0, 0.5, 1.0]
+    assert not bucket.is_full()
+
+    time.now = 1.0
+    # The two tokens added meanwhile went to the reservations already handed out
+    assert bucket.reserve() == 0.5
+    time.now = 10.0
+    assert bucket.is_full()
+    assert bucket.reserve() == 0
+
+
+def test_outbox_paces_a_chat() -> None:
+    time = VirtualTime()
+    client = FakeClient()
+    outbox = Outbox(chat_rate=1, chat_burst=2, clock=time.clock, sleep=time.sleep)
+    sent_at: list[float] = []
+
+    async def run() -> None:
+        futures = [outbox.send(client, 1, f"message {n}") for n in range(4)]
+        for future in futures:
+            future.add_done_callback(lambda _: sent_at.append(time.now))
+        await outbox.close()
+
+    asyncio.run(run())
+    assert [sent.message for sent in client.sent] == [f"message {n}" for n in range(4)]
+    assert sent_at == [0, 0, 1, 2]
+    assert (outbox.stats.sent, outbox.pending) == (4, 0)
+
+
+def test_flood_wait_parks_only_its_chat() -> None:
+    time = VirtualTime()
+    attempts: list[tuple[Any, float]] = []
+    floods = iter([7])
+
+    def flood_wait(entity: Any) -> int:
+        attempts.append((entity, time.now))
+        return next(floods, 0) if entity == 1 else 0
+
+    client = FakeClient(flood_wait=flood_wait)
+    outbox = Outbox(clock=time.clock, sleep=time.sleep)
+
+    async def run() -> list[Any]:
+        futures = [outbox.send(client, chat_id, f"{chat_id}:{n}") for n in range(2) for chat_id in (1, 2)]
+        return await asyncio.gather(*futures)
+
+    results = asyncio.run(run())
+    assert attempts == [(1, 0), (2, 0), (2, 0), (1, 7), (1, 7)]
+    # Both chats keep their order, the parked one resumes with the message that hit the FloodWait
+    assert [sent.message for sent in client.sent] == ["2:0", "2:1", "1:0", "1:1"]
+    assert [result.message for result in results] == ["1:0", "2:0", "1:1", "2:1"]
+    assert (outbox.stats.flood_waits, outbox.stats.flood_wait_seconds) == (1, 7)
+
+
+def test_failed_sends_resolve_their_future() -> None:
+    class BrokenClient(FakeClient):
+        async def send_message(self: Self, entity: Any, message: Any = "", **kwargs: Any) -> Any:
+            msg = "chat not found"
+            raise ValueError(msg)
+
+    outbox = Outbox()
+
+    async def run() -> None:
+        future = outbox.send(BrokenClient(), 1, "message")
+        await outbox.close()
+        with pytest.raises(ValueError, match="chat not found"):
+            await future
+
+    asyncio.run(run())
+    assert outbox.stats.failed == 1
@@ -0,0 +1,126 @@
+"""Tests of keyset pagination and its button cursors."""
+
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+
+import pytest
+
+from scripts.fakes import make_user
+from sqlitedb.models import User
+from sqlitedb.utils import UserType
+from telegram.pagination import (
+    BACKWARD,
+    FORWARD,
+    MAX_CALLBACK_DATA,
+    Page,
+    Paginator,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+@pytest.mark.parametrize("direction", [FORWARD, BACKWARD])
+@pytest.mark.parametrize("key", [0, 1, 35, 36, 1_000_000, 2**63 - 1, -42])
+def test_cursor_round_trip(direction: str, key: int) -> None:
+    data = encode_cursor("users", direction, key)
+    assert len(data) <= MAX_CALLBACK_DATA
+    assert decode_cursor(data) == ("users", direction, key)
+
+
+def test_cursor_is_compact() -> None:
+    assert encode_cursor("users", FORWARD, 2**63 - 1) == b"pg:users:>1y2p0ij32e8e7"
+
+
+@pytest.mark.parametrize("data", [b"pg:users:x1", b"pa:users:>1", b"pg:users", b"pg:users:>", b"pg:users:>1:2"])
+def test_decode_rejects_foreign_data(data: bytes) -> None:
+    with pytest.raises(ValueError):  # noqa: PT011
+        decode_cursor(data)
+
+
+def test_encode_rejects_oversized_data() -> None:
+    with pytest.raises(ValueError, match="exceeds"):
+        encode_cursor("x" * MAX_CALLBACK_DATA, FORWARD, 1)
+
+
+def button_cursors(buttons: list[list[Any]] | None) -> dict[str, tuple[str, str, int]]:
+    """Return the decoded cursor of every navigation button, by label."""
+    return {button.text: decode_cursor(button.type.data) for row in buttons or [] for button in row}
+
+
+def names(page: Page) -> list[str]:
+    """Return the names of the users on a page."""
+    return [user.name for user in page.items]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_buttons_walk_every_page_and_back() -> None:
+    User.objects.bulk_create(
+        User(telegram_id=5000 + i, name=f"User {i}", user_type=UserType.USER.value) for i in range(8)
+    )
+    paginator = Paginator(
+        "test_users",
+        User.objects.all,
+        lambda user: user.name,
+        key="telegram_id",
+        title="Users",
+    )
+
+    async def walk() -> tuple[list[list[str]], list[list[str]]]:
+        pages: list[Page] = [await paginator.fetch(3)]
+        while cursor := button_cursors(paginator.render(pages[-1])[1]).get("Next »"):
+            name, direction, key = cursor
+            assert (name, direction) == ("test_users", FORWARD)
+            pages.append(await paginator.fetch(3, after=key))
+        back = [pages[-1]]
+        while cursor := button_cursors(paginator.render(back[-1])[1]).get("« Previous"):
+            back.append(await paginator.fetch(3, before=cursor[2]))
+        return [names(page) for page in pages], [names(page) for page in back]
+
+    forward, backward = asyncio.run(walk())
+    assert forward == [["User 0", "User 1", "User 2"], ["User 3", "User 4", "User 5"], ["User 6", "User 7"]]
+    assert backward == forward[::-1]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_empty_list_has_no_buttons() -> None:
+    paginator = Paginator("test_empty", User.objects.none, str, title="Users")
+    text, buttons = paginator.render(asyncio.run(paginator.fetch(3)))
+    assert text == "Users\n\nNothing here yet."
+    assert buttons is None
+
+
+class FakeCallback(SimpleNamespace):
+    """A click on a page button, recording whether the message was edited."""
+
+    edited: list[str]
+
+    async def answer(self) -> None:
+        pass
+
+    async def edit(self, text: str, **_: Any) -> None:
+        self.edited.append(text)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_buttons_are_authorized_for_the_clicking_user() -> None:
+    User.objects.create(telegram_id=5100, name="Listed", user_type=UserType.USER.value)
+    Paginator(
+        "test_admins",
+        lambda: User.objects.filter(telegram_id__gte=5000),
+        lambda user: user.name,
+        key="telegram_id",
+        is_allowed={1}.__contains__,
+    )
+    data = encode_cursor("test_admins", FORWARD, 0)
+
+    def click(sender_id: int | None, chat_id: int) -> list[str]:
+        chat = make_user(chat_id)
+        event = FakeCallback(data=data, sender_id=sender_id, chat_id=chat_id, chat=chat, edited=[])
+        asyncio.run(Paginator.on_callback(event))
+        return event.edited
+
+    # The group chat the list was posted in doesn't make everyone in it an admin
+    assert click(2, 1) == []
+    assert click(None, 1) == []
+    assert click(1, 2) == ["Listed"]
@@ -0,0 +1,82 @@
+"""Tests of the sampling profiler and its report."""
+
+import asyncio
+import json
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from scripts.profile_report import load
+from telegram.profiling import STAGES_FILE, Profiler, current_profile, stage
+
+
+async def handle(_: object) -> None:
+    """Handler going through two stages, one of them twice."""
+    for name in ("get_user", "reply", "reply"):
+        with stage(name):
+            await asyncio.sleep(0)
+
+
+def run(profiler: Profiler, handler: Callable[[Any], Awaitable[None]] = handle, command: str = "start") -> None:
+    """Handle one update with ``handler`` wrapped by ``profiler``."""
+
+    async def profiled() -> None:
+        await profiler.wrap(command, handler)(None)
+
+    asyncio.run(profiled())
+
+
+def records(directory: Path) -> list[dict[str, Any]]:
+    """Return the breakdowns written to ``directory``."""
+    return [json.loads(line) for line in (directory / STAGES_FILE).read_text().splitlines()]
+
+
+def test_stages_outside_sampled_updates_record_nothing() -> None:
+    with stage("get_user"):
+        pass
+    assert current_profile.get() is None
+
+
+def test_unsampled_updates_write_nothing(tmp_path: Path) -> None:
+    run(Profiler(tmp_path / "profiles", sample_rate=0))
+    assert not (tmp_path / "profiles").exists()
+
+
+def test_sampled_updates_record_their_stages(tmp_path: Path) -> None:
+    run(Profiler(tmp_path, sample_rate=1, slow_seconds=60))
+    (record,) = records(tmp_path)
+    assert record["command"] == "start"
+    assert record["calls"] == {"get_user": 1, "reply": 2}
+    assert record["seconds"] >= sum(record["stages"].values())
+    assert record["dump"] is None
+    assert not list(tmp_path.glob("*.prof"))
+
+
+def test_slow_updates_are_dumped_and_old_dumps_deleted(tmp_path: Path) -> None:
+    profiler = Profiler(tmp_path, sample_rate=1, slow_seconds=0, max_dumps=2)
+    for _ in range(3):
+        run(profiler)
+    dumps = sorted(path.name for path in tmp_path.glob("*.prof"))
+    assert len(dumps) == 2
+    assert [record["dump"] for record in records(tmp_path)][1:] == dumps
+
+
+def test_failing_handlers_are_recorded(tmp_path: Path) -> None:
+    async def fail(_: object) -> None:
+        with stage("get_user"):
+            raise LookupError
+
+    with pytest.raises(LookupError):
+        run(Profiler(tmp_path, sample_rate=1, slow_seconds=60), fail, "broken")
+    assert [record["command"] for record in records(tmp_path)] == ["broken"]
+
+
+def test_breakdowns_are_rotated_and_read_back_in_order(tmp_path: Path) -> None:
+    profiler = Profiler(tmp_path, sample_rate=1, slow_seconds=60, max_bytes=1)
+    for command in ("first", "second", "third"):
+        run(profiler, command=command)
+    assert [record["command"] for record in records(tmp_path)] == ["third"]
+    # Only one rotated file is kept
+    assert [record["command"] for record in load(tmp_path)] == ["second", "third"]
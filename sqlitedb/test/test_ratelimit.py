@@ -0,0 +1,118 @@
+"""Tests of the per-user command rate limiter."""
+
+import asyncio
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pytest
+from django.utils import timezone
+
+from sqlitedb.models import User
+from sqlitedb.utils import UserStatus, UserType
+from telegram.gate import StatusGate
+from telegram.metrics import MetricsRegistry
+from telegram.ratelimit import DEFAULT, RateLimit, RateLimiter
+
+
+class Clock:
+    """Monotonic clock moved by hand."""
+
+    def __init__(self) -> None:
+        """Start at 0."""
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        """Return the current time."""
+        return self.now
+
+
+def allow_many(limiter: RateLimiter, sender_id: int | None, command: str, count: int) -> list[bool]:
+    """Send ``count`` commands at once and return which were allowed."""
+
+    async def run() -> list[bool]:
+        return [await limiter.allow(sender_id, command) for _ in range(count)]
+
+    return asyncio.run(run())
+
+
+def test_parse() -> None:
+    assert RateLimit.parse("20/60") == RateLimit(20, 60)
+    assert RateLimit.parse("5") == RateLimit(5, 60)
+
+
+def test_limits_each_user_and_command() -> None:
+    limiter = RateLimiter({DEFAULT: RateLimit(3, 60), "help": RateLimit(1, 60)}, ban_factor=100, clock=Clock())
+    assert allow_many(limiter, 1, "start", 4) == [True, True, True, False]
+    assert allow_many(limiter, 2, "start", 1) == [True]
+    assert allow_many(limiter, 1, "help", 2) == [True, False]
+    assert limiter.stats.limited_by_command == {"start": 1, "help": 1}
+
+
+def test_window_slides() -> None:
+    clock = Clock()
+    limiter = RateLimiter({DEFAULT: RateLimit(4, 60)}, ban_factor=100, clock=clock)
+    assert allow_many(limiter, 1, "start", 4) == [True] * 4
+    # Half of the previous window still counts
+    clock.now = 90
+    assert allow_many(limiter, 1, "start", 3) == [True, True, False]
+    # Only the window right before the current one counts
+    clock.now = 300
+    assert allow_many(limiter, 1, "start", 4) == [True] * 4
+
+
+def test_idle_windows_are_evicted() -> None:
+    clock = Clock()
+    limiter = RateLimiter({DEFAULT: RateLimit(3, 60)}, max_keys=2, clock=clock)
+    for sender_id in range(3):
+        allow_many(limiter, sender_id, "start", 1)
+    assert len(limiter) == 2
+    clock.now = 1000
+    allow_many(limiter, 10, "start", 1)
+    assert len(limiter) == 1
+    assert limiter.stats.evicted == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_flooding_users_are_banned() -> None:
+    User.objects.create(telegram_id=7, name="Flooder", user_type=UserType.USER.value)
+    gate = StatusGate()
+    limiter = RateLimiter({DEFAULT: RateLimit(3, 60)}, ban_factor=2, ban_duration=timedelta(minutes=5), gate=gate)
+
+    before = timezone.now()
+    assert allow_many(limiter, 7, "start", 6) == [True, True, True, False, False, False]
+    assert limiter.stats.banned == 1
+    assert not gate.allows(SimpleNamespace(sender_id=7, chat_id=None))
+
+    user = User.objects.get(telegram_id=7)
+    assert user.status == UserStatus.TEMP_BANNED.value
+    assert before + timedelta(minutes=5) <= user.banned_until <= timezone.now() + timedelta(minutes=5)
+    # The count starts over, commands after the ban is lifted aren't held against the user
+    assert len(limiter) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_limited_users_below_the_ban_factor_stay_active() -> None:
+    User.objects.create(telegram_id=8, name="Eager", user_type=UserType.USER.value)
+    limiter = RateLimiter({DEFAULT: RateLimit(3, 60)}, ban_factor=2)
+    assert allow_many(limiter, 8, "start", 5) == [True, True, True, False, False]
+    assert User.objects.get(telegram_id=8).status == UserStatus.ACTIVE.value
+    assert limiter.stats.banned == 0
+
+
+def test_commands_without_a_sender_are_not_limited() -> None:
+    limiter = RateLimiter({DEFAULT: RateLimit(1, 60)}, ban_factor=1, clock=Clock())
+    assert allow_many(limiter, None, "start", 3) == [True] * 3
+    assert len(limiter) == 0
+    assert limiter.stats.banned == 0
+
+
+def test_thresholds_are_exported() -> None:
+    limiter = RateLimiter({"help": RateLimit.parse("5/30")}, ban_factor=3, ban_duration=timedelta(minutes=10))
+    metrics = MetricsRegistry()
+    limiter.export(metrics)
+    rendered = metrics.render()
+    assert 'tg_rate_limiter_threshold{command="default"} 20' in rendered
+    assert 'tg_rate_limiter_threshold{command="help"} 5' in rendered
+    assert 'tg_rate_limiter_window_seconds{command="help"} 30.0' in rendered
+    assert "tg_rate_limiter_ban_factor 3" in rendered
+    assert "tg_rate_limiter_ban_seconds 600.0" in rendered
@@ -0,0 +1,123 @@
+"""Tests of the hot reload of command modules and of the watcher batching changes."""
+
+import asyncio
+import functools
+import threading
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+import pytest
+from environs import Env
+
+import watcher
+from scripts.fakes import FakeClient, FakeEvent, make_user
+from telegram.commands.base import BaseCommand, CommandRegistry
+
+CommandPackage = tuple[str, Callable[[str, str, str], Path]]
+
+
+def send(client: FakeClient, text: str) -> list[str]:
+    """Send ``text`` to the handlers of ``client`` and return the replies."""
+    client.sent.clear()
+    asyncio.run(client.emit(FakeEvent(client, text, make_user(1))))
+    return [sent.message for sent in client.sent]
+
+
+def route(package: str, client: FakeClient) -> None:
+    """Route the commands of ``package`` on ``client``, loading them on their first message."""
+    for name in CommandRegistry.discover(package):
+        BaseCommand.router.add_lazy(name, functools.partial(CommandRegistry.load, name, Env(), client))
+    BaseCommand.router.attach(client)
+
+
+def test_reload_runs_the_new_code(command_package: CommandPackage) -> None:
+    package, write = command_package
+    write("echo", "echo", "v1")
+    client = FakeClient()
+    route(package, client)
+    assert send(client, "/echo hi") == ["v1 hi"]
+
+    write("echo", "echo", "v2")
+    assert CommandRegistry.reload(f"{package}.echo", Env(), client) == ["echo"]
+    assert send(client, "/echo hi") == ["v2 hi"]
+
+
+def test_failed_reloads_keep_the_previous_commands(command_package: CommandPackage) -> None:
+    package, write = command_package
+    path = write("echo", "echo", "v1")
+    client = FakeClient()
+    route(package, client)
+    assert send(client, "/echo hi") == ["v1 hi"]
+
+    path.write_text("this isn't python")
+    with pytest.raises(SyntaxError):
+        CommandRegistry.reload(f"{package}.echo", Env(), client)
+    assert send(client, "/echo hi") == ["v1 hi"]
+
+
+def test_renamed_and_deleted_commands_are_unrouted(command_package: CommandPackage) -> None:
+    package, write = command_package
+    path = write("echo", "echo", "v1")
+    client = FakeClient()
+    route(package, client)
+    assert send(client, "/echo hi") == ["v1 hi"]
+
+    write("echo", "repeat", "v2")
+    assert CommandRegistry.reload(f"{package}.echo", Env(), client) == ["repeat"]
+    assert send(client, "/echo hi") == []
+    assert send(client, "/repeat hi") == ["v2 hi"]
+
+    path.unlink()
+    assert CommandRegistry.reload(f"{package}.echo", Env(), client) == []
+    assert send(client, "/repeat hi") == []
+    assert CommandRegistry.get_names() == []
+
+
+def test_command_module() -> None:
+    commands = Path.cwd() / "telegram" / "commands"
+    assert watcher.command_module(commands / "start.py") == "telegram.commands.start"
+    assert watcher.command_module(commands / "base.py") is None
+    assert watcher.command_module(Path.cwd() / "telegram" / "replier.py") is None
+
+
+class RunningBot:
+    """Stand-in for the bot process the watcher started."""
+
+    def poll(self) -> None:
+        return None
+
+
+@pytest.fixture
+def handler(monkeypatch: pytest.MonkeyPatch) -> tuple[watcher.MyHandler, list[Any], threading.Event]:
+    """Return a watcher that records what it would do instead of starting and restarting the bot."""
+    monkeypatch.setattr(watcher.MyHandler, "start_process", lambda _: None)
+    actions: list[Any] = []
+    acted = threading.Event()
+
+    def record(action: Any) -> None:
+        actions.append(action)
+        acted.set()
+
+    monkeypatch.setattr(watcher.MyHandler, "reload_modules", lambda _, modules: record(modules))
+    monkeypatch.setattr(watcher.MyHandler, "restart_process", lambda _: record("restart"))
+    watching = watcher.MyHandler(["migrations"], debounce=0.05)
+    watching.process = RunningBot()  # type: ignore[assignment]
+    return watching, actions, acted
+
+
+def test_changes_are_batched_into_one_reload(handler: tuple[watcher.MyHandler, list[Any], threading.Event]) -> None:
+    watching, actions, acted = handler
+    for name in ("start.py", "help.py", "start.py", "notes.txt"):
+        watching.collect(str(Path.cwd() / "telegram" / "commands" / name))
+    assert acted.wait(5)
+    assert actions == [["telegram.commands.help", "telegram.commands.start"]]
+
+
+def test_other_changes_restart_the_bot(handler: tuple[watcher.MyHandler, list[Any], threading.Event]) -> None:
+    watching, actions, acted = handler
+    watching.collect(str(Path.cwd() / "telegram" / "commands" / "start.py"))
+    watching.collect(str(Path.cwd() / "telegram" / "replier.py"))
+    watching.collect(str(Path.cwd() / "sqlitedb" / "migrations" / "0007_new.py"))
+    assert acted.wait(5)
+    assert actions == ["restart"]
@@ -0,0 +1,87 @@
+"""Tests of the bot's startup and shutdown."""
+
+import asyncio
+from collections.abc import Iterator
+
+import pytest
+from environs import Env
+
+from scripts.fakes import FakeClient
+from telegram.commands.base import BaseCommand
+from telegram.replier import Telegram
+
+# Shared components the bot sets up on BaseCommand
+COMPONENTS = ("dispatcher", "outbox", "limiter", "activity", "jobs", "profiler")
+
+
+@pytest.fixture
+def bot() -> Iterator[Telegram]:
+    """Return a bot on a fake client, restoring the shared components it replaces afterwards."""
+    previous = {name: getattr(BaseCommand, name) for name in COMPONENTS}
+    yield Telegram("test", Env(), client=FakeClient())
+    for name, component in previous.items():
+        setattr(BaseCommand, name, component)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_stop_handles_the_queued_updates(bot: Telegram) -> None:
+    dispatcher = BaseCommand.dispatcher
+    assert dispatcher is not None
+    handled: list[int] = []
+
+    async def handle(number: int) -> None:
+        await asyncio.sleep(0)
+        handled.append(number)
+
+    async def run() -> None:
+        for number in range(5):
+            await dispatcher.submit(1, handle, number)
+        await bot.stop()
+
+    asyncio.run(run())
+    assert handled == list(range(5))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_shutdown_sends_the_queued_messages_before_disconnecting(bot: Telegram) -> None:
+    client, dispatcher, outbox = bot.client, BaseCommand.dispatcher, BaseCommand.outbox
+    assert dispatcher is not None
+    assert outbox is not None
+
+    async def handle(number: int) -> None:
+        outbox.send(client, 1, f"reply {number}")
+
+    async def run() -> None:
+        # Within the burst of the chat, so nothing waits for the rate limit
+        for number in range(3):
+            await dispatcher.submit(1, handle, number)
+        await bot.shutdown()
+        await bot.stop()
+
+    asyncio.run(run())
+    assert [sent.message for sent in client.sent] == [f"reply {number}" for number in range(3)]
+    assert not client.connected
+    assert outbox.stats.failed == 0
+
+
+@pytest.mark.django_db(transaction=True)
+def test_shutdown_cancels_background_work(bot: Telegram) -> None:
+    cancelled = asyncio.Event()
+
+    async def broadcast() -> None:
+        try:
+            await asyncio.sleep(3600)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def run() -> None:
+        task = asyncio.create_task(broadcast())
+        BaseCommand.background.add(task)
+        task.add_done_callback(BaseCommand.background.discard)
+        await asyncio.sleep(0)
+        await bot.shutdown()
+
+    asyncio.run(run())
+    assert cancelled.is_set()
+    assert not BaseCommand.background
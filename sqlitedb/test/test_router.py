@@ -0,0 +1,111 @@
+"""Tests of the command router."""
+
+import asyncio
+from datetime import timedelta
+from typing import Any, Self
+
+import pytest
+from django.utils import timezone
+
+from scripts.fakes import FakeClient, FakeEvent, make_user
+from telegram.commands.router import CommandRouter, ParsedCommand
+from telegram.gate import StatusGate
+
+
+class RecordingCommand:
+    """Stand-in for a command, recording the arguments of the messages dispatched to it."""
+
+    def __init__(self: Self, name: str, pattern: str) -> None:
+        self.name = name
+        self.pattern = pattern
+        self.dispatched: list[tuple[str, ...]] = []
+
+    def get_pattern(self: Self) -> str:
+        return self.pattern
+
+    async def dispatch(self: Self, event: Any) -> None:
+        self.dispatched.append(event.pattern_match.groups())
+
+
+def make_router() -> tuple[CommandRouter, RecordingCommand, RecordingCommand]:
+    """Return a router of a /start and a /help command."""
+    router = CommandRouter()
+    start, help_ = RecordingCommand("start", r"^/start$"), RecordingCommand("help", r"^/help(?: (\w+))?$")
+    router.add(start)  # type: ignore[arg-type]
+    router.add(help_)  # type: ignore[arg-type]
+    return router, start, help_
+
+
+def send(router: CommandRouter, *texts: str, client: FakeClient | None = None) -> None:
+    """Pass a message of user 1 with every text to the router."""
+    client = client or FakeClient()
+
+    async def run() -> None:
+        for text in texts:
+            await router.on_message(FakeEvent(client, text, make_user(1)))
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    ("text", "parsed"),
+    [
+        ("/start", ParsedCommand("start", "", "/start")),
+        ("/help start now", ParsedCommand("help", "", "/help start now")),
+        ("/help@Fake_Bot start", ParsedCommand("help", "Fake_Bot", "/help start")),
+        ("hello /start", None),
+        ("/", None),
+        ("/@fake_bot", None),
+    ],
+)
+def test_parse(text: str, parsed: ParsedCommand | None) -> None:
+    assert CommandRouter.parse(text) == parsed
+
+
+def test_messages_reach_their_command() -> None:
+    router, start, help_ = make_router()
+    send(router, "/start", "/help", "/help start", "/help two words", "/unknown", "start", "/start now")
+    assert start.dispatched == [()]
+    assert help_.dispatched == [(None,), ("start",)]
+
+
+def test_commands_for_other_bots_are_ignored() -> None:
+    router, start, _ = make_router()
+    send(router, "/start@other_bot", "/start@FAKE_BOT", client=FakeClient(username="fake_bot"))
+    assert start.dispatched == [()]
+
+
+def test_lazy_commands_are_created_on_their_first_message() -> None:
+    router, _, _ = make_router()
+    lazy = RecordingCommand("lazy", r"^/lazy$")
+    loads = []
+
+    def load() -> None:
+        loads.append("lazy")
+        router.add(lazy)  # type: ignore[arg-type]
+
+    router.add_lazy("lazy", load)
+    assert "lazy" not in router.get_routes()
+    send(router, "/lazy", "/lazy")
+    assert loads == ["lazy"]
+    assert lazy.dispatched == [(), ()]
+
+    router.remove("lazy")
+    send(router, "/lazy")
+    assert lazy.dispatched == [(), ()]
+
+
+def test_gated_users_are_dropped() -> None:
+    router, start, _ = make_router()
+    router.gate = StatusGate()
+    router.gate.gate(1, timezone.now() + timedelta(minutes=1))
+    send(router, "/start")
+    assert start.dispatched == []
+
+
+def test_attach_registers_one_handler() -> None:
+    router, _, _ = make_router()
+    client = FakeClient()
+    router.attach(client)
+    router.attach(client)
+    assert len(client._handlers) == 1  # noqa: SLF001
@@ -0,0 +1,70 @@
+"""Tests of the user name search and the triggers keeping its index in sync."""
+
+import asyncio
+
+import pytest
+
+from sqlitedb.models import User
+from sqlitedb.search import escape_like, match_phrase
+from sqlitedb.utils import UserType
+
+
+def search(term: str, limit: int = 20) -> list[str]:
+    """Return the names of the users found for ``term``."""
+    return [user.name for user in asyncio.run(User.objects.search(term, limit=limit))]
+
+
+def create_users(*names: str) -> None:
+    """Create a user with each name."""
+    for telegram_id, name in enumerate(names, start=6000):
+        User.objects.create(telegram_id=telegram_id, name=name, user_type=UserType.USER.value)
+
+
+def test_match_phrase_quotes_the_term() -> None:
+    assert match_phrase('say "hi"') == '"say ""hi"""'
+
+
+def test_escape_like() -> None:
+    assert escape_like(r"50%_a\b") == r"50\%\_a\\b"
+
+
+@pytest.mark.django_db(transaction=True)
+def test_search_finds_substrings_case_insensitively() -> None:
+    create_users("Alice Walker", "Malice", "Bob", 'The "Quoted" One')
+    assert sorted(search("alic")) == ["Alice Walker", "Malice"]
+    assert search("walk") == ["Alice Walker"]
+    assert search('"quoted"') == ['The "Quoted" One']
+    assert search("  ") == []
+    assert len(search("lic", limit=1)) == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_short_terms_rank_prefixes_first() -> None:
+    create_users("Maxwell", "Max", "Ax_e", "Axle")
+    assert search("ax") == ["Ax_e", "Axle", "Maxwell", "Max"]
+    # Wildcards in the term match themselves
+    assert search("x_") == ["Ax_e"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_index_follows_renames_and_deletes() -> None:
+    create_users("Original Name")
+    user = User.objects.get(name="Original Name")
+    user.name = "Renamed"
+    user.save()
+    assert search("original") == []
+    assert search("renamed") == ["Renamed"]
+
+    User.objects.filter(telegram_id=user.telegram_id).update(name="Updated In Bulk")
+    assert search("renamed") == []
+    assert search("bulk") == ["Updated In Bulk"]
+
+    user.delete()
+    assert search("bulk") == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_index_ignores_other_columns() -> None:
+    create_users("Steady")
+    User.objects.filter(name="Steady").update(command_count=3)
+    assert search("stead") == ["Steady"]
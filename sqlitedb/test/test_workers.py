@@ -0,0 +1,146 @@
+"""Tests of the worker pool's bookkeeping of forwarded updates."""
+
+import asyncio
+import threading
+import time
+from typing import Any, Self
+
+from scripts.fakes import FakeClient, FakeEvent, make_user
+from telegram.gate import StatusGate
+from telegram.outbound import Outbox
+from telegram.workers import WorkerPool, _Slot
+
+
+class FakeQueue:
+    """Records what the pool sends to a worker process."""
+
+    def __init__(self: Self) -> None:
+        self.items: list[Any] = []
+
+    def put(self: Self, item: Any) -> None:
+        self.items.append(item)
+
+    def cancel_join_thread(self: Self) -> None:
+        pass
+
+    def close(self: Self) -> None:
+        pass
+
+
+class FakeProcess:
+    """A worker process that is alive until it's told to die."""
+
+    def __init__(self: Self) -> None:
+        self.exitcode: int | None = None
+
+    def is_alive(self: Self) -> bool:
+        return self.exitcode is None
+
+
+def make_pool() -> tuple[WorkerPool, _Slot]:
+    """Return a pool of one worker that starts fake processes, and its slot."""
+    pool = WorkerPool(FakeClient(), Outbox(), StatusGate(), workers=2, check_interval=0.01)
+    pool._commands = frozenset({"start"})  # noqa: SLF001
+
+    def spawn(slot: _Slot) -> None:
+        slot.generation += 1
+        slot.inbound, slot.outbound = FakeQueue(), FakeQueue()  # type: ignore[assignment]
+        slot.process = FakeProcess()  # type: ignore[assignment]
+        slot.reader = None
+
+    pool._spawn = spawn  # type: ignore[method-assign]  # noqa: SLF001
+    pool._slots = pool._slots[:1]  # noqa: SLF001
+    return pool, pool._slots[0]  # noqa: SLF001
+
+
+def updates(queue: Any) -> list[int]:
+    """Return the IDs of the updates sent to a worker through ``queue``."""
+    return [item[1] for item in queue.items if item[0] == "update"]
+
+
+async def forward(pool: WorkerPool, count: int) -> None:
+    """Forward ``count`` /start messages."""
+    client = FakeClient()
+    for _ in range(count):
+        await pool.forward(FakeEvent(client, "/start", make_user(1)))
+
+
+def test_acknowledged_updates_leave_the_pool() -> None:
+    pool, slot = make_pool()
+
+    async def run() -> None:
+        await pool.start()
+        await forward(pool, 2)
+        pool._receive(slot, slot.generation, ("ack", 1))  # noqa: SLF001
+        pool._monitor.cancel()  # type: ignore[union-attr]  # noqa: SLF001
+
+    asyncio.run(run())
+    assert updates(slot.inbound) == [1, 2]
+    assert list(slot.in_flight) == [2]
+    assert (pool.stats.forwarded, pool.stats.acked, pool.stats.pending) == (2, 1, 1)
+
+
+def test_unfinished_updates_are_requeued_once_after_a_crash() -> None:
+    pool, slot = make_pool()
+
+    async def run() -> None:
+        await pool.start()
+        await forward(pool, 3)
+        loop, generation, process = asyncio.get_running_loop(), slot.generation, slot.process
+        assert isinstance(process, FakeProcess)
+        respawned, spawn = asyncio.Event(), pool._spawn  # noqa: SLF001
+
+        def respawn(slot: _Slot) -> None:
+            spawn(slot)
+            respawned.set()
+
+        pool._spawn = respawn  # noqa: SLF001
+
+        def read() -> None:
+            # The process acknowledged the first update before it died, the reader is still handing that over
+            time.sleep(0.05)
+            loop.call_soon_threadsafe(pool._receive, slot, generation, ("ack", 1))  # noqa: SLF001
+
+        slot.reader = threading.Thread(target=read)
+        slot.reader.start()
+        process.exitcode = 1
+        await respawned.wait()
+        pool._monitor.cancel()  # noqa: SLF001
+
+    asyncio.run(run())
+    assert updates(slot.inbound) == [2, 3]
+    assert (pool.stats.acked, pool.stats.requeued, pool.stats.pending) == (1, 2, 2)
+
+
+def test_late_acknowledgements_of_replaced_processes_count() -> None:
+    pool, slot = make_pool()
+
+    async def run() -> None:
+        await pool.start()
+        await forward(pool, 1)
+        old = slot.generation
+        pool._spawn(slot)  # noqa: SLF001
+        pool._receive(slot, old, ("ack", 1))  # noqa: SLF001
+        # Anything else the replaced process sent is ignored
+        pool._receive(slot, old, ("gate", 42, None))  # noqa: SLF001
+        pool._monitor.cancel()  # type: ignore[union-attr]  # noqa: SLF001
+
+    asyncio.run(run())
+    assert (pool.stats.acked, pool.stats.pending) == (1, 0)
+    assert not slot.in_flight
+    assert pool.gate is not None
+    assert not pool.gate.is_gated(42)
+
+
+def test_only_commands_are_forwarded() -> None:
+    pool, slot = make_pool()
+
+    async def run() -> None:
+        await pool.start()
+        client = FakeClient()
+        for text in ("/start", "hello", "/unknown", "/start@fake_bot"):
+            await pool.forward(FakeEvent(client, text, make_user(1)))
+        pool._monitor.cancel()  # type: ignore[union-attr]  # noqa: SLF001
+
+    asyncio.run(run())
+    assert [item[2].text for item in slot.inbound.items] == ["/start", "/start@fake_bot"]  # type: ignore[union-attr]
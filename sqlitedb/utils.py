@@ -9,6 +9,7 @@ class UserStatus(Enum):
     ACTIVE = "active"
     SUSPENDED = "suspended"
     TEMP_BANNED = "temporarily banned"
+    BLOCKED = "blocked"
 
 
 class ErrorCodes(Enum):
@@ -23,3 +24,19 @@ class UserType(Enum):
     USER = "user"
     CHANNEL = "channel"
     GROUP = "group"
+
+
+class BroadcastState(Enum):
+    """Broadcast state."""
+
+    RUNNING = "running"
+    DONE = "done"
+
+
+class JobState(Enum):
+    """Background job state."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
@@ -0,0 +1,179 @@
+"""Track user activity without writing to the database on every message."""
+
+import asyncio
+import contextlib
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Self
+
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.utils import timezone
+from environs import Env
+from loguru import logger
+
+# Adds to the stored count, so several processes can flush concurrently
+FLUSH_ACTIVITY = """
+    UPDATE "user" SET "last_seen" = %s, "command_count" = "command_count" + %s WHERE "telegram_id" = %s
+"""
+
+
+@dataclass
+class ActivityStats:
+    """Counters describing the activity tracker.
+
+    Attributes
+    ----------
+        recorded (int): Commands recorded.
+        dropped (int): Commands not recorded because too many users were pending.
+        flushes (int): Flushes that wrote to the database.
+        failed_flushes (int): Flushes that failed, their deltas are kept for the next one.
+        rows_written (int): User rows updated by the flushes.
+        last_flush_seconds (float): Duration of the last flush.
+        max_flush_seconds (float): Duration of the slowest flush.
+        total_flush_seconds (float): Time spent flushing.
+    """
+
+    recorded: int = 0
+    dropped: int = 0
+    flushes: int = 0
+    failed_flushes: int = 0
+    rows_written: int = 0
+    last_flush_seconds: float = 0.0
+    max_flush_seconds: float = 0.0
+    total_flush_seconds: float = 0.0
+
+
+@dataclass
+class _Delta:
+    """Activity of one user since the last flush."""
+
+    last_seen: datetime
+    count: int = 0
+
+
+class ActivityTracker:
+    """Write-behind buffer for ``User.last_seen`` and ``User.command_count``.
+
+    Commands are coalesced per user in memory and written every ``flush_interval`` seconds in one transaction,
+    so the database sees one write per interval instead of one per message. The flush runs a single prepared
+    ``UPDATE`` per user through ``executemany`` against the unique ``telegram_id`` index, which costs a fraction
+    of compiling ORM ``Case``/``When`` expressions for every row. At most ``max_pending`` users are buffered:
+    reaching the cap triggers a flush right away, and commands of new users are dropped until it's done.
+    """
+
+    def __init__(
+        self: Self,
+        flush_interval: float = 10,
+        max_pending: int = 50_000,
+    ) -> None:
+        """Create an empty tracker.
+
+        Args:
+            flush_interval: Seconds between flushes.
+            max_pending: Maximum number of users with pending activity.
+        """
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: dict[int, _Delta] = {}
+        self._lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self.stats = ActivityStats()
+
+    @classmethod
+    def from_env(cls, env: Env) -> "ActivityTracker":
+        """Create a tracker configured by ``ACTIVITY_FLUSH_INTERVAL`` and ``ACTIVITY_MAX_PENDING``.
+
+        Args:
+            env: Environment configuration object.
+
+        Returns
+        -------
+            The configured tracker
+        """
+        return cls(
+            flush_interval=env.float("ACTIVITY_FLUSH_INTERVAL", 10),
+            max_pending=env.int("ACTIVITY_MAX_PENDING", 50_000),
+        )
+
+    @property
+    def pending(self: Self) -> int:
+        """Return the number of users with activity waiting to be flushed."""
+        return len(self._pending)
+
+    def record(self: Self, telegram_id: int) -> None:
+        """Record that ``telegram_id`` ran a command now.
+
+        Args:
+            telegram_id: Telegram ID of the user.
+        """
+        delta = self._pending.get(telegram_id)
+        if delta is None:
+            if len(self._pending) >= self.max_pending:
+                self.stats.dropped += 1
+                self._full.set()
+                return
+            delta = self._pending[telegram_id] = _Delta(timezone.now())
+        else:
+            delta.last_seen = timezone.now()
+        delta.count += 1
+        self.stats.recorded += 1
+
+    async def flush(self: Self) -> int:
+        """Write the pending activity to the database.
+
+        Returns
+        -------
+            The number of user rows updated
+        """
+        async with self._lock:
+            self._full.clear()
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            started = time.perf_counter()
+            try:
+                rows = await sync_to_async(self._write)(pending)
+            except Exception:
+                self.stats.failed_flushes += 1
+                self._restore(pending)
+                raise
+            elapsed = time.perf_counter() - started
+            self.stats.flushes += 1
+            self.stats.rows_written += rows
+            self.stats.last_flush_seconds = elapsed
+            self.stats.max_flush_seconds = max(self.stats.max_flush_seconds, elapsed)
+            self.stats.total_flush_seconds += elapsed
+            logger.debug(f"Flushed activity of {len(pending)} users, {rows} rows written in {elapsed * 1000:.1f}ms")
+            return rows
+
+    def _write(self: Self, pending: dict[int, _Delta]) -> int:
+        """Update the users of ``pending`` in one transaction, with one prepared statement run per user."""
+        adapt = connection.ops.adapt_datetimefield_value
+        params = [(adapt(delta.last_seen), delta.count, telegram_id) for telegram_id, delta in pending.items()]
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(FLUSH_ACTIVITY, params)
+            rows: int = cursor.rowcount
+        return max(rows, 0)
+
+    def _restore(self: Self, pending: dict[int, _Delta]) -> None:
+        """Merge the deltas of a failed flush back into the buffer."""
+        for telegram_id, delta in pending.items():
+            current = self._pending.get(telegram_id)
+            if current is None:
+                self._pending[telegram_id] = delta
+            else:
+                current.count += delta.count
+
+    async def run(self: Self) -> None:
+        """Flush every ``flush_interval`` seconds, or as soon as the buffer is full, until cancelled."""
+        while True:
+            with contextlib.suppress(TimeoutError):
+                # Not wait_for, which can swallow a cancellation arriving as the event is set
+                async with asyncio.timeout(self.flush_interval):
+                    await self._full.wait()
+            try:
+                await self.flush()
+            except Exception:  # noqa: BLE001
+                logger.exception("Activity flush failed, retrying on the next interval")
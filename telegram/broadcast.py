@@ -0,0 +1,201 @@
+"""Stream a message to many users."""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Self
+
+from environs import Env
+from loguru import logger
+from telethon import TelegramClient
+from telethon.errors import (
+    ChannelPrivateError,
+    ChatWriteForbiddenError,
+    InputUserDeactivatedError,
+    PeerIdInvalidError,
+    UserDeactivatedError,
+    UserIsBlockedError,
+)
+from telethon.tl.types import PeerChannel, PeerUser
+
+from sqlitedb.models import Broadcast, User
+from sqlitedb.utils import BroadcastState, UserStatus, UserType
+from telegram.outbound import Outbox
+
+# Errors meaning the recipient can never be reached again
+BLOCKED_ERRORS = (
+    UserIsBlockedError,
+    UserDeactivatedError,
+    InputUserDeactivatedError,
+    ChatWriteForbiddenError,
+    ChannelPrivateError,
+    PeerIdInvalidError,
+)
+
+SENT, FAILED, BLOCKED = "sent", "failed", "blocked"
+
+# Broadcast fields updated by every checkpoint
+CHECKPOINT_FIELDS = ("last_user_id", "sent", "failed", "blocked", "elapsed")
+
+
+@dataclass
+class BroadcastReport:
+    """Summary of a broadcast.
+
+    Attributes
+    ----------
+        broadcast_id (int): ID of the broadcast.
+        sent (int): Messages delivered.
+        failed (int): Messages that could not be delivered.
+        blocked (int): Recipients marked as blocked.
+        elapsed (float): Seconds spent sending.
+    """
+
+    broadcast_id: int
+    sent: int
+    failed: int
+    blocked: int
+    elapsed: float
+
+    @property
+    def messages_per_second(self: Self) -> float:
+        """Return the delivery throughput."""
+        return self.sent / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self: Self) -> str:
+        """Return a human readable summary."""
+        return (
+            f"Broadcast #{self.broadcast_id}: {self.sent} sent, {self.failed} failed, {self.blocked} blocked "
+            f"in {self.elapsed:.1f}s ({self.messages_per_second:.1f} msgs/sec)"
+        )
+
+
+class BroadcastEngine:
+    """Send a :class:`~sqlitedb.models.Broadcast` to every matching user.
+
+    Recipients are streamed from the database in keyset-paginated chunks. The sends of a chunk run with
+    bounded concurrency through the :class:`~telegram.outbound.Outbox`, which takes care of flood limits.
+    After every chunk the broadcast is checkpointed, so an interrupted run resumes after the last completed
+    chunk. Recipients that blocked the bot or no longer exist are marked as blocked and skipped until they
+    message the bot again.
+    """
+
+    def __init__(
+        self: Self,
+        client: TelegramClient,
+        outbox: Outbox,
+        concurrency: int = 20,
+        chunk_size: int = 500,
+    ) -> None:
+        """Create the engine.
+
+        Args:
+            client: The client sending the messages.
+            outbox: Outbound queue the messages go through.
+            concurrency: Maximum number of sends in flight.
+            chunk_size: Number of recipients fetched and checkpointed at once.
+        """
+        self.client = client
+        self.outbox = outbox
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_env(cls, client: TelegramClient, outbox: Outbox, env: Env) -> "BroadcastEngine":
+        """Create an engine configured by ``BROADCAST_CONCURRENCY`` and ``BROADCAST_CHUNK_SIZE``.
+
+        Args:
+            client: The client sending the messages.
+            outbox: Outbound queue the messages go through.
+            env: Environment configuration object.
+
+        Returns
+        -------
+            The configured engine
+        """
+        return cls(
+            client,
+            outbox,
+            concurrency=env.int("BROADCAST_CONCURRENCY", 20),
+            chunk_size=env.int("BROADCAST_CHUNK_SIZE", 500),
+        )
+
+    @staticmethod
+    async def create(message: str, statuses: list[str] | None = None, user_types: list[str] | None = None) -> Broadcast:
+        """Create a new broadcast.
+
+        Args:
+            message: The text to send.
+            statuses: User statuses to send to, defaults to active users.
+            user_types: User types to send to, defaults to all of them.
+
+        Returns
+        -------
+            The new broadcast, ready to be run
+        """
+        broadcast: Broadcast = await Broadcast.objects.acreate(
+            message=message,
+            statuses=statuses or [UserStatus.ACTIVE.value],
+            user_types=user_types or [user_type.value for user_type in UserType],
+        )
+        return broadcast
+
+    async def run(self: Self, broadcast: Broadcast) -> BroadcastReport:
+        """Send ``broadcast`` to every recipient after its checkpoint.
+
+        Args:
+            broadcast: The broadcast to run or resume.
+
+        Returns
+        -------
+            Report covering the whole broadcast, including earlier runs
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        mark = time.perf_counter()
+        recipients = User.objects.iter_recipients(
+            broadcast.statuses,
+            broadcast.user_types,
+            after_id=broadcast.last_user_id,
+            chunk_size=self.chunk_size,
+        )
+        async for chunk in recipients:
+            sends = [self._send(semaphore, row[1], row[2], broadcast.message) for row in chunk]
+            results = await asyncio.gather(*sends)
+            blocked = [row[1] for row, result in zip(chunk, results, strict=True) if result == BLOCKED]
+            if blocked:
+                await User.objects.filter(telegram_id__in=blocked).aupdate(status=UserStatus.BLOCKED.value)
+
+            now = time.perf_counter()
+            broadcast.last_user_id = chunk[-1][0]
+            broadcast.sent += results.count(SENT)
+            broadcast.failed += results.count(FAILED)
+            broadcast.blocked += len(blocked)
+            broadcast.elapsed += now - mark
+            mark = now
+            await broadcast.asave(update_fields=[*CHECKPOINT_FIELDS, "last_updated"])
+            logger.debug(f"{broadcast} checkpointed after user {broadcast.last_user_id}")
+
+        broadcast.state = BroadcastState.DONE.value
+        broadcast.elapsed += time.perf_counter() - mark
+        await broadcast.asave(update_fields=["state", "elapsed", "last_updated"])
+        report = BroadcastReport(broadcast.id, broadcast.sent, broadcast.failed, broadcast.blocked, broadcast.elapsed)
+        logger.info(str(report))
+        return report
+
+    async def _send(
+        self: Self,
+        semaphore: asyncio.Semaphore,
+        telegram_id: int,
+        user_type: str,
+        message: str,
+    ) -> str:
+        """Deliver ``message`` to one recipient and classify the outcome."""
+        peer: Any = PeerUser(telegram_id) if user_type == UserType.USER.value else PeerChannel(telegram_id)
+        async with semaphore:
+            try:
+                await self.outbox.send(self.client, telegram_id, message, entity=peer)
+            except BLOCKED_ERRORS:
+                return BLOCKED
+            except Exception:  # noqa: BLE001
+                return FAILED
+            return SENT
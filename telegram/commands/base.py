@@ -1,17 +1,97 @@
 """Base command class for all bot commands."""
 
+import ast
+import asyncio
+import functools
+import importlib
+import sys
 from abc import ABC, abstractmethod
-from typing import Any, ClassVar
+from collections.abc import Coroutine
+from importlib.util import find_spec
+from pathlib import Path
+from typing import Any, ClassVar, NamedTuple
 
 from environs import Env
+from loguru import logger
 from telethon import TelegramClient, events
 
+from sqlitedb.models import Job
+from telegram.activity import ActivityTracker
+from telegram.commands.router import CommandRouter
+from telegram.dispatcher import UpdateDispatcher
+from telegram.jobs import JobWorker
+from telegram.metrics import instrument
+from telegram.outbound import Outbox
+from telegram.profiling import Profiler, stage
+from telegram.ratelimit import RateLimiter
+
+# Package whose modules are scanned for commands
+COMMANDS_PACKAGE = "telegram.commands"
+
+
+class CommandSpec(NamedTuple):
+    """A command found in the source of its module, before the module is imported.
+
+    Attributes
+    ----------
+        name (str): Name the command is registered under.
+        module (str): Module defining the command.
+        summary (str): First line of the docstring of the command class.
+        usage (str | None): What ``get_usage`` returns when it's a constant, None otherwise.
+    """
+
+    name: str
+    module: str
+    summary: str
+    usage: str | None
+
+
+def _registered_name(node: ast.ClassDef) -> str | None:
+    """Return the name a class is registered under with ``@CommandRegistry.register(...)``, if it is."""
+    for decorator in node.decorator_list:
+        if (
+            isinstance(decorator, ast.Call)
+            and isinstance(decorator.func, ast.Attribute)
+            and decorator.func.attr == "register"
+            and isinstance(decorator.func.value, ast.Name)
+            and decorator.func.value.id == "CommandRegistry"
+            and decorator.args
+            and isinstance(decorator.args[0], ast.Constant)
+            and isinstance(decorator.args[0].value, str)
+        ):
+            return decorator.args[0].value
+    return None
+
+
+def _constant_usage(node: ast.ClassDef) -> str | None:
+    """Return the string ``get_usage`` of a command class returns, if it's a constant."""
+    for item in node.body:
+        if isinstance(item, ast.FunctionDef) and item.name == "get_usage":
+            returns = [statement for statement in item.body if isinstance(statement, ast.Return)]
+            if len(returns) == 1 and returns[0].value is not None:
+                try:
+                    usage = ast.literal_eval(returns[0].value)
+                except ValueError:
+                    return None
+                return usage if isinstance(usage, str) else None
+    return None
+
 
 class CommandRegistry:
-    """Registry for automatic command registration."""
+    """Registry for automatic command registration.
+
+    Commands are discovered by reading the source of the modules of the commands package, so their names and
+    usage are known without importing them. A module is only imported once one of its commands is needed,
+    usually on its first message, which keeps the imports of the handlers out of the startup time.
+    """
 
     _commands: ClassVar[dict[str, type["BaseCommand"]]] = {}
 
+    _specs: ClassVar[dict[str, CommandSpec]] = {}
+
+    # Commands created by load, by name
+    _instances: ClassVar[dict[str, "BaseCommand"]] = {}
+
     @classmethod
     def register(cls, command_name: str) -> Any:
         """Decorator to register a command class.
@@ -25,24 +105,123 @@ class CommandRegistry:
         """
 
         def decorator(command_class: type["BaseCommand"]) -> type["BaseCommand"]:
+            command_class.name = command_name
             cls._commands[command_name] = command_class
             return command_class
 
         return decorator
 
+    @classmethod
+    def discover(cls, package: str = COMMANDS_PACKAGE) -> list[str]:
+        """Find the commands defined in the modules of ``package`` without importing them.
+
+        Args:
+            package: Name of the package holding the command modules.
+
+        Returns
+        -------
+            Names of the commands found, by module
+        """
+        module_spec = find_spec(package)
+        if module_spec is None or not module_spec.submodule_search_locations:
+            msg = f"{package} isn't a package"
+            raise ImportError(msg)
+        found: list[str] = []
+        for path in sorted(Path(next(iter(module_spec.submodule_search_locations))).glob("*.py")):
+            specs = cls._scan(path, f"{package}.{path.stem}")
+            cls._specs.update(specs)
+            found.extend(specs)
+        return found
+
+    @staticmethod
+    def _scan(path: Path, module: str) -> dict[str, CommandSpec]:
+        """Return the specs of the commands defined in the source of ``module``."""
+        specs = {}
+        for node in ast.parse(path.read_bytes(), str(path)).body:
+            if isinstance(node, ast.ClassDef) and (name := _registered_name(node)) is not None:
+                summary = (ast.get_docstring(node) or "").partition("\n")[0]
+                specs[name] = CommandSpec(name, module, summary, _constant_usage(node))
+        return specs
+
+    @classmethod
+    def reload(cls, module: str, env: Env, client: TelegramClient | None = None) -> list[str]:
+        """Re-import a command module changed on disk and replace its commands with the new code.
+
+        The commands are created again on their next message, routed on ``client`` if given. Commands the
+        module no longer defines are unrouted, all of them if the module was deleted. If the module fails to
+        import, its previous commands stay.
+
+        Args:
+            module: Name of the command module.
+            env: Environment configuration object
+            client: The Telegram client instance
+
+        Returns
+        -------
+            Names of the commands the module defines now
+        """
+        module_spec = find_spec(module)
+        origin = None if module_spec is None or module_spec.origin is None else Path(module_spec.origin)
+        if origin is not None and origin.exists():
+            if module in sys.modules:
+                importlib.reload(sys.modules[module])
+            specs = cls._scan(origin, module)
+        else:
+            # The module was deleted, the spec of its imported version is all that's left
+            sys.modules.pop(module, None)
+            specs = {}
+        previous = [name for name, spec in cls._specs.items() if spec.module == module]
+        for name in previous:
+            del cls._specs[name]
+            if name not in specs:
+                cls._commands.pop(name, None)
+        for name in {*previous, *specs}:
+            cls._instances.pop(name, None)
+            BaseCommand.router.remove(name)
+        cls._specs.update(specs)
+        if client is not None:
+            for name in specs:
+                BaseCommand.router.add_lazy(name, functools.partial(cls.load, name, env, client))
+        return list(specs)
+
+    @classmethod
+    def get_names(cls) -> list[str]:
+        """Get the names of every discovered or registered command, without importing any.
+
+        Returns
+        -------
+            Command names
+        """
+        return list(dict.fromkeys([*cls._specs, *cls._commands]))
+
+    @classmethod
+    def get_spec(cls, command_name: str) -> CommandSpec | None:
+        """Get what discovery found about a command.
+
+        Args:
+            command_name: The name of the command
+
+        Returns
+        -------
+            The command's spec or None if it wasn't discovered
+        """
+        return cls._specs.get(command_name)
+
     @classmethod
     def get_all_commands(cls) -> dict[str, type["BaseCommand"]]:
-        """Get all registered commands.
+        """Get all registered commands, importing the modules of the discovered ones.
 
         Returns
         -------
             Dictionary mapping command names to command classes
         """
+        for command_name in cls._specs:
+            cls.get_command(command_name)
         return cls._commands.copy()
 
     @classmethod
     def get_command(cls, command_name: str) -> type["BaseCommand"] | None:
-        """Get a specific command class.
+        """Get a specific command class, importing its module if it wasn't yet.
 
         Args:
             command_name: The name of the command
@@ -51,8 +230,53 @@ class CommandRegistry:
         -------
             The command class or None if not found
         """
+        if command_name not in cls._commands and command_name in cls._specs:
+            module = cls._specs[command_name].module
+            importlib.import_module(module)
+            logger.debug(f"Imported /{command_name} from {module}")
         return cls._commands.get(command_name)
 
+    @classmethod
+    def load(cls, command_name: str, env: Env, client: TelegramClient | None = None) -> "BaseCommand | None":
+        """Create a command once, routing its messages on ``client`` if given.
+
+        Args:
+            command_name: The name of the command
+            env: Environment configuration object
+            client: The Telegram client instance
+
+        Returns
+        -------
+            The command or None if not found
+        """
+        command = cls._instances.get(command_name)
+        if command is None:
+            command_class = cls.get_command(command_name)
+            if command_class is None:
+                return None
+            command = cls._instances[command_name] = command_class(env)
+        if client is not None:
+            command.add_handler(client)
+        return command
+
+    @classmethod
+    def route_lazily(cls, env: Env, client: TelegramClient) -> list[str]:
+        """Route the messages of every discovered command on ``client``, loading it on its first message.
+
+        Args:
+            env: Environment configuration object
+            client: The Telegram client instance
+
+        Returns
+        -------
+            Names of the routed commands
+        """
+        names = cls.discover()
+        for command_name in names:
+            BaseCommand.router.add_lazy(command_name, functools.partial(cls.load, command_name, env, client))
+        BaseCommand.router.attach(client)
+        return names
+
 
 class BaseCommand(ABC):
     """Abstract base class for all bot commands.
@@ -61,6 +285,33 @@ class BaseCommand(ABC):
     duplicate code across command implementations.
     """
 
+    # Name the command was registered under, set by CommandRegistry.register
+    name: ClassVar[str]
+
+    # Single handler routing every command message to its command
+    router: ClassVar[CommandRouter] = CommandRouter()
+
+    # Shared dispatcher running handlers concurrently across chats, set up by the bot on startup
+    dispatcher: ClassVar[UpdateDispatcher | None] = None
+
+    # Shared rate limited outbound queue, set up by the bot on startup
+    outbox: ClassVar[Outbox | None] = None
+
+    # Per-user command rate limiter, set up by the bot on startup
+    limiter: ClassVar[RateLimiter | None] = None
+
+    # Write-behind buffer of user activity, set up by the bot on startup
+    activity: ClassVar[ActivityTracker | None] = None
+
+    # Background job workers of this process, set up by the bot on startup
+    jobs: ClassVar[JobWorker | None] = None
+
+    # Samples updates for profiling when enabled, set up by the bot on startup
+    profiler: ClassVar[Profiler | None] = None
+
+    # Work the commands run past their handler, e.g. broadcasts, cancelled by the bot on shutdown
+    background: ClassVar[set[asyncio.Task[Any]]] = set()
+
     def __init__(self, env: Env) -> None:
         """Initialize the command with environment configuration.
 
@@ -68,6 +319,8 @@ class BaseCommand(ABC):
             env: Environment configuration object
         """
         self.env = env
+        # Checked on every message of every command, so parsed once
+        self.admin_ids: frozenset[int] = frozenset(env.list("ADMIN_IDS", [], subcast=int))
 
     @abstractmethod
     def get_pattern(self) -> str:
@@ -96,11 +349,98 @@ class BaseCommand(ABC):
         """
 
     def add_handler(self, client: TelegramClient) -> None:
-        """Add this command's event handler to the client.
+        """Route this command's messages on the client, recording metrics of every update it handles.
 
         Args:
             client: The Telegram client instance
         """
-        # Create a wrapper that applies the pattern decorator
-        handler = events.register(events.NewMessage(pattern=self.get_pattern()))(self.handle)
-        client.add_event_handler(handler)
+        if not hasattr(self.handle, "__wrapped__"):
+            handle = self.handle if self.profiler is None else self.profiler.wrap(self.name, self.handle)
+            self.handle = instrument(self.name, handle)  # type: ignore[assignment]
+        self.router.add(self)
+        self.router.attach(client)
+
+    async def dispatch(self, event: events.NewMessage.Event) -> None:
+        """Hand the event to the shared dispatcher, or handle it inline if there is none.
+
+        Commands of non-admin users beyond their rate limit are dropped here, the others are recorded as activity
+        of their sender.
+
+        Args:
+            event: The Telegram message event
+        """
+        limiter = self.limiter
+        if limiter is not None and not self.is_admin(event) and not await limiter.allow(event.sender_id, self.name):
+            return
+        if self.activity is not None:
+            self.activity.record(event.sender_id)
+        if self.dispatcher is None:
+            await self.handle(event)
+        else:
+            await self.dispatcher.submit(event.chat_id, self.handle, event)
+
+    def is_admin(self, event: events.NewMessage.Event) -> bool:
+        """Check whether the sender of the event is listed in ``ADMIN_IDS``.
+
+        Args:
+            event: The Telegram message event
+
+        Returns
+        -------
+            True if the sender is an admin
+        """
+        return event.sender_id in self.admin_ids
+
+    async def reply(self, event: events.NewMessage.Event, message: Any, **kwargs: Any) -> None:
+        """Reply to the event's message through the shared outbox.
+
+        The reply is queued and sent within the flood limits, so the handler doesn't wait for delivery.
+        Without an outbox the reply is sent right away.
+
+        Args:
+            event: The Telegram message event to reply to
+            message: The reply
+            **kwargs: Extra arguments passed to ``send_message``
+        """
+        if self.outbox is None:
+            with stage("reply"):
+                await event.reply(message, **kwargs)
+        else:
+            # Sent later by the outbox, outside the profile of this update
+            self.outbox.reply(event, message, **kwargs)
+
+    def spawn(self, coroutine: Coroutine[Any, Any, None]) -> asyncio.Task[None]:
+        """Run ``coroutine`` in the background, past the handler, until it's done or the bot shuts down.
+
+        Args:
+            coroutine: The background work.
+
+        Returns
+        -------
+            The task running the coroutine
+        """
+        task = asyncio.create_task(coroutine)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+        return task
+
+    async def enqueue(self, event: events.NewMessage.Event, name: str, payload: Any = None, **kwargs: Any) -> Job:
+        """Run a registered job in the background and send its result as a reply to the event's message.
+
+        Use this for slow work, such as generating a report or calling an external service, so the handler
+        returns right away.
+
+        Args:
+            event: The Telegram message event the result replies to
+            name: Name the job function was registered under with ``JobRegistry.register``
+            payload: JSON serializable arguments of the job function
+            **kwargs: Extra arguments passed to ``JobWorker.enqueue``, e.g. ``delay`` or ``max_attempts``
+
+        Returns
+        -------
+            The queued job
+        """
+        job = await JobWorker.enqueue(name, payload, chat_id=event.chat_id, reply_to=event.id, **kwargs)
+        if self.jobs is not None:
+            self.jobs.notify()
+        return job
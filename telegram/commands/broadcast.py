@@ -0,0 +1,104 @@
+"""Handle broadcast command."""
+
+import asyncio
+from typing import ClassVar
+
+from loguru import logger
+from telethon import events
+
+from sqlitedb.models import Broadcast
+from sqlitedb.utils import BroadcastState, UserType
+from telegram.broadcast import BroadcastEngine
+from telegram.commands.base import BaseCommand, CommandRegistry
+from telegram.outbound import Outbox
+from telegram.strings import (
+    admin_only,
+    broadcast_already_running,
+    broadcast_nothing_to_resume,
+    broadcast_started,
+    broadcast_unknown_user_types,
+)
+from telegram.utils import SupportedCommands
+
+
+@CommandRegistry.register("broadcast")
+class BroadcastCommand(BaseCommand):
+    """Handle /broadcast command."""
+
+    # Broadcasts currently running in this process, by ID
+    _running: ClassVar[dict[int, asyncio.Task[None]]] = {}
+
+    def get_pattern(self) -> str:
+        """Return the regex pattern for /broadcast command.
+
+        Returns
+        -------
+            Regex pattern string
+        """
+        return rf"(?s)^{SupportedCommands.BROADCAST.value}(.*)"
+
+    def get_usage(self) -> str:
+        """Return the usage documentation for /broadcast command.
+
+        Returns
+        -------
+            Usage documentation string
+        """
+        user_types = ",".join(user_type.value for user_type in UserType)
+        return (
+            "Send a message to every active user. Admins only.\n"
+            "`/broadcast <message>`: Send to everyone.\n"
+            f"`/broadcast to={user_types} <message>`: Send to the listed user types only.\n"
+            "`/broadcast resume`: Resume the last interrupted broadcast."
+        )
+
+    async def handle(self, event: events.NewMessage.Event) -> None:
+        """Handle /broadcast command.
+
+        Args:
+            event: A new message event.
+        """
+        if not self.is_admin(event):
+            await self.reply(event, admin_only)
+            return
+
+        data = event.pattern_match.group(1).strip()
+        if not data:
+            await self.reply(event, self.get_usage())
+            return
+
+        if data == "resume":
+            broadcast = await Broadcast.objects.filter(state=BroadcastState.RUNNING.value).order_by("-id").afirst()
+            if broadcast is None:
+                await self.reply(event, broadcast_nothing_to_resume)
+                return
+            if broadcast.id in self._running:
+                await self.reply(event, broadcast_already_running.format(id=broadcast.id))
+                return
+        else:
+            user_types = None
+            head, _, rest = data.partition(" ")
+            if head.startswith("to=") and rest.strip():
+                user_types = head.removeprefix("to=").split(",")
+                valid = [user_type.value for user_type in UserType]
+                if unknown := [user_type for user_type in user_types if user_type not in valid]:
+                    unknown_names = ", ".join(map(repr, unknown))
+                    reply = broadcast_unknown_user_types.format(unknown=unknown_names, valid=", ".join(valid))
+                    await self.reply(event, reply)
+                    return
+                data = rest.strip()
+            broadcast = await BroadcastEngine.create(data, user_types=user_types)
+
+        engine = BroadcastEngine.from_env(event.client, self.outbox or Outbox(), self.env)
+        self._running[broadcast.id] = self.spawn(self._run(engine, broadcast, event))
+        await self.reply(event, broadcast_started.format(id=broadcast.id))
+
+    async def _run(self, engine: BroadcastEngine, broadcast: Broadcast, event: events.NewMessage.Event) -> None:
+        """Run the broadcast in the background and report back to the admin who started it."""
+        try:
+            report = await engine.run(broadcast)
+            await self.reply(event, str(report))
+        except Exception:  # noqa: BLE001
+            logger.exception(f"{broadcast} was interrupted, resume it with /broadcast resume")
+        finally:
+            del self._running[broadcast.id]
@@ -36,10 +36,11 @@ class HelpCommand(BaseCommand):
         -------
             Formatted help message string
         """
-        commands = CommandRegistry.get_all_commands()
+        # Only the names are needed, listing them doesn't import the command modules
+        commands = CommandRegistry.get_names()
         command_list = []
 
-        for idx, (cmd_name, _) in enumerate(commands.items(), start=1):
+        for idx, cmd_name in enumerate(commands, start=1):
             command_list.append(f"{idx}. `/{cmd_name}`: Start using the bot (usage: `/{cmd_name}`).")
 
         command_lines = "\n".join(command_list)
@@ -70,6 +71,9 @@ If you have any questions or need assistance, feel free to ask. Happy botting!
         ------
             KeyError: If command is not found in registry
         """
+        spec = CommandRegistry.get_spec(command_name)
+        if spec is not None and spec.usage is not None:
+            return spec.usage
         command_class = CommandRegistry.get_command(command_name)
         if command_class is None:
             msg = f"Command '{command_name}' not found in registry"
@@ -89,14 +93,14 @@ If you have any questions or need assistance, feel free to ask. Happy botting!
 
         if not data:
             # Show general help message
-            await event.reply(self._get_help_message())
+            await self.reply(event, self._get_help_message())
         elif f"/{data}" not in SupportedCommands.get_values():
             # Command not supported
-            await event.reply(command_not_found)
+            await self.reply(event, command_not_found)
         else:
             # Show specific command usage
             try:
                 usage = self._get_command_usage(data)
-                await event.reply(usage)
+                await self.reply(event, usage)
             except KeyError:
-                await event.reply(docs_not_found)
+                await self.reply(event, docs_not_found)
@@ -0,0 +1,180 @@
+"""Route incoming commands through a single event handler."""
+
+import re
+from collections.abc import Callable
+from typing import TYPE_CHECKING, NamedTuple, Self
+
+from loguru import logger
+from telethon import TelegramClient, events
+
+if TYPE_CHECKING:
+    from telegram.commands.base import BaseCommand
+    from telegram.gate import StatusGate
+
+
+class ParsedCommand(NamedTuple):
+    """The leading ``/command`` token of a message.
+
+    Attributes
+    ----------
+        name (str): Command name without the leading slash or ``@botname`` suffix.
+        bot (str): The ``@botname`` suffix without the ``@``, empty if absent.
+        text (str): The message with the suffix stripped, e.g. ``/help start``.
+    """
+
+    name: str
+    bot: str
+    text: str
+
+
+class Route(NamedTuple):
+    """A registered command together with its compiled argument pattern."""
+
+    command: "BaseCommand"
+    pattern: re.Pattern[str]
+
+
+class CommandRouter:
+    """Dispatch messages to commands with one dictionary lookup.
+
+    A single ``NewMessage`` handler is registered per client. It extracts the leading ``/command`` token and
+    looks the command up by name, so the cost per message doesn't grow with the number of commands. The
+    command's own pattern only runs after the lookup matched, to parse its arguments. Commands routed with
+    :meth:`add_lazy` are created on their first message.
+    """
+
+    def __init__(self: Self) -> None:
+        self._routes: dict[str, Route] = {}
+        self._loaders: dict[str, Callable[[], object]] = {}
+        self._clients: list[TelegramClient] = []
+        self._usernames: dict[int, str] = {}
+        # Drops updates of suspended and banned users, set up by the bot on startup
+        self.gate: StatusGate | None = None
+
+    def add(self: Self, command: "BaseCommand") -> None:
+        """Route ``/<command.name>`` messages to ``command``.
+
+        Args:
+            command: The command instance to route to.
+        """
+        self._routes[command.name] = Route(command, re.compile(command.get_pattern()))
+
+    def add_lazy(self: Self, name: str, load: Callable[[], object]) -> None:
+        """Route ``/<name>`` messages to the command ``load`` adds with :meth:`add` on the first of them.
+
+        Args:
+            name: Name of the command.
+            load: Creates the command and adds it to the router.
+        """
+        if name not in self._routes:
+            self._loaders[name] = load
+
+    def remove(self: Self, name: str) -> None:
+        """Stop routing ``/<name>`` messages, e.g. before routing them to a reloaded command.
+
+        Args:
+            name: Name of the command.
+        """
+        self._routes.pop(name, None)
+        self._loaders.pop(name, None)
+
+    def _load(self: Self, name: str) -> Route | None:
+        """Create the lazily routed command ``name``, if there is one."""
+        load = self._loaders.pop(name, None)
+        if load is None:
+            return None
+        load()
+        return self._routes.get(name)
+
+    def load_all(self: Self) -> None:
+        """Create every lazily routed command now, e.g. before measuring the handlers."""
+        for name in list(self._loaders):
+            self._load(name)
+
+    def attach(self: Self, client: TelegramClient) -> None:
+        """Register the router's handler on ``client``, once.
+
+        Args:
+            client: The Telegram client instance
+        """
+        if any(attached is client for attached in self._clients):
+            return
+        client.add_event_handler(self.on_message, events.NewMessage(incoming=True))
+        self._clients.append(client)
+
+    @staticmethod
+    def parse(text: str) -> ParsedCommand | None:
+        """Split the leading ``/command[@botname]`` token off ``text``.
+
+        Args:
+            text: Raw message text.
+
+        Returns
+        -------
+            The parsed command, or None if the message doesn't start with a command
+        """
+        if not text.startswith("/"):
+            return None
+        token = text.split(maxsplit=1)[0]
+        name, _, bot = token[1:].partition("@")
+        if not name:
+            return None
+        return ParsedCommand(name, bot, f"/{name}{text[len(token) :]}" if bot else text)
+
+    def resolve(self: Self, text: str) -> tuple[Route, re.Match[str], str] | None:
+        """Find the command handling ``text`` and parse its arguments.
+
+        Args:
+            text: Raw message text.
+
+        Returns
+        -------
+            The route, the match of its pattern and the ``@botname`` suffix, or None if no command handles
+            the message
+        """
+        parsed = self.parse(text)
+        if parsed is None:
+            return None
+        route = self._routes.get(parsed.name) or self._load(parsed.name)
+        if route is None:
+            return None
+        match = route.pattern.match(parsed.text)
+        if match is None:
+            logger.debug(f"/{parsed.name} arguments didn't match {route.pattern.pattern}")
+            return None
+        return route, match, parsed.bot
+
+    async def _is_addressed_to(self: Self, client: TelegramClient, bot: str) -> bool:
+        """Check whether a ``@botname`` suffix names the bot logged in on ``client``."""
+        username = self._usernames.get(id(client))
+        if username is None:
+            me = await client.get_me()
+            username = self._usernames[id(client)] = (me.username or "").lower()
+        return bot.lower() == username
+
+    async def on_message(self: Self, event: events.NewMessage.Event) -> None:
+        """Route a new message to the command it invokes, if any.
+
+        Args:
+            event: A new message event.
+        """
+        if self.gate is not None and not self.gate.allows(event):
+            return
+        resolved = self.resolve(event.raw_text)
+        if resolved is None:
+            return
+        route, match, bot = resolved
+        if bot and not await self._is_addressed_to(event.client, bot):
+            # Commands like /start@other_bot in groups are meant for another bot
+            return
+        event.pattern_match = match
+        await route.command.dispatch(event)
+
+    def get_routes(self: Self) -> dict[str, "BaseCommand"]:
+        """Return the routed commands by name.
+
+        Returns
+        -------
+            Dictionary mapping command names to command instances
+        """
+        return {name: route.command for name, route in self._routes.items()}
@@ -3,7 +3,9 @@
 from telethon import events
 
 from telegram.commands.base import BaseCommand, CommandRegistry
-from telegram.utils import SupportedCommands, get_user
+from telegram.utils import MarkdownTemplate, SupportedCommands, get_user
+
+greeting = MarkdownTemplate("Hii👋, {name} {telegram_id}")
 
 
 @CommandRegistry.register("start")
@@ -36,5 +38,5 @@ class StartCommand(BaseCommand):
         """
         # Get the user associated with the message
         user = await get_user(event)
-        result = f"Hii👋, {user.name} {user.telegram_id}"
-        await event.reply(result)
+        result, entities = greeting.render(name=user.name, telegram_id=user.telegram_id)
+        await self.reply(event, result, formatting_entities=entities)
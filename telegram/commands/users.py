@@ -0,0 +1,60 @@
+"""Handle users command."""
+
+from environs import Env
+from telethon import events
+
+from sqlitedb.models import User
+from telegram.commands.base import BaseCommand, CommandRegistry
+from telegram.pagination import Paginator
+from telegram.strings import admin_only
+from telegram.utils import SupportedCommands, escape_markdown, get_user
+
+
+@CommandRegistry.register("users")
+class UsersCommand(BaseCommand):
+    """Handle /users command."""
+
+    def get_pattern(self) -> str:
+        """Return the regex pattern for /users command.
+
+        Returns
+        -------
+            Regex pattern string
+        """
+        return f"^{SupportedCommands.USERS.value}$"
+
+    def get_usage(self) -> str:
+        """Return the usage documentation for /users command.
+
+        Returns
+        -------
+            Usage documentation string
+        """
+        return "List the users of the bot, page by page. Admins only.\n"
+
+    def __init__(self, env: Env) -> None:
+        """Initialize the command and register the paginator handling its page buttons.
+
+        Args:
+            env: Environment configuration object
+        """
+        super().__init__(env)
+        self.paginator = Paginator(
+            "users",
+            User.objects.all,
+            lambda user: f"`{user.telegram_id}` {escape_markdown(user.name)} ({user.user_type}, {user.status})",
+            title="**Users**",
+            is_allowed=self.admin_ids.__contains__,
+        )
+
+    async def handle(self, event: events.NewMessage.Event) -> None:
+        """Handle /users command.
+
+        Args:
+            event: A new message event.
+        """
+        if not self.is_admin(event):
+            await self.reply(event, admin_only)
+            return
+        text, buttons = await self.paginator.first_page(await get_user(event))
+        await self.reply(event, text, buttons=buttons)
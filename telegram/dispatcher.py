@@ -0,0 +1,130 @@
+"""Concurrent, per-chat ordered dispatch of updates."""
+
+import asyncio
+import time
+from collections.abc import Awaitable, Callable, Hashable
+from dataclasses import dataclass
+from typing import Any, Self
+
+from environs import Env
+from loguru import logger
+
+Handler = Callable[[Any], Awaitable[None]]
+
+
+@dataclass
+class DispatcherStats:
+    """Counters describing the load on an :class:`UpdateDispatcher`.
+
+    Attributes
+    ----------
+        submitted (int): Updates accepted into a shard queue.
+        completed (int): Updates whose handler finished successfully.
+        failed (int): Updates whose handler raised.
+        backpressure_waits (int): Submissions that had to wait because their shard queue was full.
+        backpressure_seconds (float): Total time submitters spent waiting for queue space.
+        max_depth (int): Deepest any shard queue has been.
+    """
+
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    backpressure_waits: int = 0
+    backpressure_seconds: float = 0.0
+    max_depth: int = 0
+
+
+class UpdateDispatcher:
+    """Run update handlers on a bounded pool of workers, sharded by chat.
+
+    Every chat is hashed onto one shard. A shard is a bounded queue drained by a single worker, so the
+    updates of one chat are handled one after another in arrival order while different chats run in
+    parallel. When a shard queue is full, :meth:`submit` waits for space, which slows intake down instead
+    of letting memory grow without bound.
+    """
+
+    def __init__(self: Self, workers: int = 8, queue_size: int = 100) -> None:
+        """Create the dispatcher. Workers are started on the first submission.
+
+        Args:
+            workers: Number of shards, i.e. the maximum number of chats handled concurrently.
+            queue_size: Maximum number of pending updates per shard.
+        """
+        if workers < 1:
+            msg = "The dispatcher needs at least one worker"
+            raise ValueError(msg)
+        self.workers = workers
+        self.queue_size = queue_size
+        self.stats = DispatcherStats()
+        self._queues: list[asyncio.Queue[tuple[Handler, Any]]] = []
+        self._tasks: list[asyncio.Task[None]] = []
+
+    @classmethod
+    def from_env(cls, env: Env) -> "UpdateDispatcher":
+        """Create a dispatcher configured by ``DISPATCH_WORKERS`` and ``DISPATCH_QUEUE_SIZE``.
+
+        Args:
+            env: Environment configuration object.
+
+        Returns
+        -------
+            The configured dispatcher
+        """
+        return cls(
+            workers=env.int("DISPATCH_WORKERS", 8),
+            queue_size=env.int("DISPATCH_QUEUE_SIZE", 100),
+        )
+
+    def _start(self: Self) -> None:
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._work(queue), name=f"dispatch-{shard}") for shard, queue in enumerate(self._queues)
+        ]
+
+    async def submit(self: Self, key: Hashable, handler: Handler, event: Any) -> None:
+        """Queue ``handler(event)`` on the shard owning ``key``.
+
+        Args:
+            key: Ordering key, usually the chat ID of the update.
+            handler: Coroutine function handling the update.
+            event: The update passed to the handler.
+        """
+        if not self._tasks:
+            self._start()
+        queue = self._queues[hash(key) % self.workers]
+        if queue.full():
+            started = time.perf_counter()
+            await queue.put((handler, event))
+            self.stats.backpressure_waits += 1
+            self.stats.backpressure_seconds += time.perf_counter() - started
+        else:
+            queue.put_nowait((handler, event))
+        self.stats.submitted += 1
+        self.stats.max_depth = max(self.stats.max_depth, queue.qsize())
+
+    async def _work(self: Self, queue: "asyncio.Queue[tuple[Handler, Any]]") -> None:
+        while True:
+            handler, event = await queue.get()
+            try:
+                await handler(event)
+            except Exception:  # noqa: BLE001
+                self.stats.failed += 1
+                logger.exception(f"Unhandled error in {getattr(handler, '__qualname__', handler)}")
+            else:
+                self.stats.completed += 1
+            finally:
+                queue.task_done()
+
+    @property
+    def depth(self: Self) -> int:
+        """Return the number of updates waiting across all shards."""
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def close(self: Self) -> None:
+        """Wait for the queued updates to be handled, then stop the workers."""
+        for queue in self._queues:
+            await queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._queues, self._tasks = [], []
@@ -0,0 +1,183 @@
+"""Drop updates of suspended and banned users before any handler runs."""
+
+import asyncio
+import math
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Self
+
+from django.db.models import Max
+from django.utils import timezone
+from environs import Env
+from loguru import logger
+from telethon import utils
+
+from sqlitedb.models import User
+from sqlitedb.utils import UserStatus
+
+# Statuses whose updates are dropped
+GATED_STATUSES = (UserStatus.SUSPENDED.value, UserStatus.TEMP_BANNED.value)
+
+# Changes committed slightly out of last_updated order are still seen by re-reading this far behind the watermark
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+
+@dataclass
+class GateStats:
+    """Counters describing the status gate.
+
+    Attributes
+    ----------
+        dropped (int): Updates dropped because their user is gated.
+        refreshes (int): Incremental refreshes run.
+        changes (int): User rows read by the refreshes.
+        expired (int): Temporary bans ended in the database by the refreshes.
+    """
+
+    dropped: int = 0
+    refreshes: int = 0
+    changes: int = 0
+    expired: int = 0
+
+
+class StatusGate:
+    """In-memory set of the users whose updates must be dropped.
+
+    Gated users are loaded once at startup, then only rows whose ``last_updated`` moved past the watermark of
+    the previous refresh are read again, so keeping the set current costs one indexed query per interval no
+    matter how many users there are. Checking an update is a dictionary lookup, without any database or cache
+    access. Temporary bans end at their ``banned_until`` time: the gate stops dropping updates on the spot and
+    the next refresh sets the user back to active.
+    """
+
+    def __init__(
+        self: Self,
+        refresh_interval: float = 30,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        """Create an empty gate.
+
+        Args:
+            refresh_interval: Seconds between incremental refreshes.
+            clock: Source of the current time as a UNIX timestamp.
+        """
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        # Telegram ID -> UNIX time the gate opens again, infinity while the status doesn't end on its own
+        self._gated: dict[int, float] = {}
+        self._watermark: datetime | None = None
+        self.stats = GateStats()
+
+    @classmethod
+    def from_env(cls, env: Env) -> "StatusGate":
+        """Create a gate refreshed every ``STATUS_GATE_REFRESH`` seconds.
+
+        Args:
+            env: Environment configuration object.
+
+        Returns
+        -------
+            The configured gate
+        """
+        return cls(refresh_interval=env.float("STATUS_GATE_REFRESH", 30))
+
+    def __len__(self: Self) -> int:
+        """Return the number of gated users."""
+        return len(self._gated)
+
+    def is_gated(self: Self, telegram_id: int) -> bool:
+        """Check whether updates of ``telegram_id`` must be dropped.
+
+        Args:
+            telegram_id: Telegram ID of a user, group or channel.
+
+        Returns
+        -------
+            Whether the user is suspended or banned right now
+        """
+        until = self._gated.get(telegram_id)
+        if until is None:
+            return False
+        if until <= self.clock():
+            del self._gated[telegram_id]
+            return False
+        return True
+
+    def allows(self: Self, event: Any) -> bool:
+        """Check whether neither the sender nor the chat of ``event`` is gated, counting dropped updates.
+
+        Args:
+            event: A new message or callback query event.
+
+        Returns
+        -------
+            Whether the update may be handled
+        """
+        if not self._gated:
+            return True
+        chat_id = event.chat_id
+        if self.is_gated(event.sender_id) or (chat_id is not None and self.is_gated(utils.resolve_id(chat_id)[0])):
+            self.stats.dropped += 1
+            return False
+        return True
+
+    def gate(self: Self, telegram_id: int, until: datetime | None = None) -> None:
+        """Start dropping updates of ``telegram_id`` right away, without waiting for the next refresh.
+
+        Args:
+            telegram_id: Telegram ID of the user.
+            until: When the gate opens again, never by default.
+        """
+        self._gated[telegram_id] = until.timestamp() if until is not None else math.inf
+
+    def _apply(self: Self, telegram_id: int, status: str, banned_until: datetime | None) -> None:
+        """Update the gate entry of one user from their row."""
+        if status not in GATED_STATUSES:
+            self._gated.pop(telegram_id, None)
+        elif status == UserStatus.TEMP_BANNED.value and banned_until is not None:
+            self.gate(telegram_id, banned_until)
+        else:
+            self.gate(telegram_id)
+
+    async def load(self: Self) -> None:
+        """Load every gated user."""
+        watermark = (await User.objects.aaggregate(watermark=Max("last_updated")))["watermark"]
+        self._watermark = watermark or timezone.now()
+        rows = User.objects.filter(status__in=GATED_STATUSES).values_list("telegram_id", "status", "banned_until")
+        self._gated.clear()
+        async for telegram_id, status, banned_until in rows:
+            self._apply(telegram_id, status, banned_until)
+        logger.info(f"Status gate loaded with {len(self)} suspended or banned users")
+
+    async def refresh(self: Self) -> None:
+        """End the temporary bans that are over and apply the changes made since the last refresh."""
+        if self._watermark is None:
+            await self.load()
+            return
+        self.stats.expired += await User.objects.filter(
+            status=UserStatus.TEMP_BANNED.value,
+            banned_until__lte=timezone.now(),
+        ).aupdate(status=UserStatus.ACTIVE.value, banned_until=None)
+
+        changed = User.objects.filter(last_updated__gt=self._watermark - REFRESH_OVERLAP).values_list(
+            "telegram_id",
+            "status",
+            "banned_until",
+            "last_updated",
+        )
+        async for telegram_id, status, banned_until, last_updated in changed:
+            self._apply(telegram_id, status, banned_until)
+            self._watermark = max(self._watermark, last_updated)
+            self.stats.changes += 1
+        self.stats.refreshes += 1
+
+    async def run(self: Self) -> None:
+        """Refresh the gate every ``refresh_interval`` seconds until cancelled, loading it first if needed."""
+        while True:
+            try:
+                await self.refresh()
+            except Exception:  # noqa: BLE001
+                logger.exception("Status gate refresh failed, retrying on the next interval")
+            await asyncio.sleep(self.refresh_interval)
@@ -0,0 +1,306 @@
+"""Run slow work in the background, off the handler path."""
+
+import asyncio
+import contextlib
+import os
+import random
+import socket
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, ClassVar, Self
+
+from asgiref.sync import sync_to_async
+from django.utils import timezone
+from environs import Env
+from loguru import logger
+from telethon import TelegramClient
+
+from sqlitedb.models import Job
+from sqlitedb.utils import JobState
+from telegram.outbound import Outbox
+from telegram.strings import job_failed
+
+JobFunction = Callable[[dict[str, Any]], Awaitable[Any]]
+
+
+class JobRegistry:
+    """Registry of the functions jobs run, by name."""
+
+    _jobs: ClassVar[dict[str, JobFunction]] = {}
+
+    @classmethod
+    def register(cls, name: str) -> Callable[[JobFunction], JobFunction]:
+        """Decorator to register an async job function.
+
+        The function receives the job's payload. Unless it returns None, its result is stored on the job and
+        sent to the job's chat.
+
+        Args:
+            name: The name jobs are enqueued under.
+
+        Returns
+        -------
+            The decorator function
+        """
+
+        def decorator(function: JobFunction) -> JobFunction:
+            cls._jobs[name] = function
+            return function
+
+        return decorator
+
+    @classmethod
+    def get_job(cls, name: str) -> JobFunction | None:
+        """Get a registered job function.
+
+        Args:
+            name: The name of the job
+
+        Returns
+        -------
+            The job function or None if not found
+        """
+        return cls._jobs.get(name)
+
+
+@dataclass
+class JobStats:
+    """Counters describing the job workers.
+
+    Attributes
+    ----------
+        claimed (int): Jobs claimed.
+        succeeded (int): Jobs done.
+        retried (int): Failed attempts scheduled to run again.
+        failed (int): Jobs given up after their last attempt.
+        lost (int): Jobs reclaimed by another worker before this one finished them.
+        run_seconds (float): Time spent running jobs.
+    """
+
+    claimed: int = 0
+    succeeded: int = 0
+    retried: int = 0
+    failed: int = 0
+    lost: int = 0
+    run_seconds: float = 0.0
+
+
+class JobWorker:
+    """Pool of asyncio workers running the jobs of the ``job`` table.
+
+    At most ``concurrency`` jobs run at once. Jobs are claimed in batches as slots free up, right away when a
+    job is enqueued from this process and every ``poll_interval`` seconds otherwise. A claimed job is locked to
+    this worker for ``visibility_timeout`` seconds and cancelled if it runs longer, after which any worker may
+    claim it again, so a crashed process doesn't lose its jobs. Failed attempts are retried with exponential
+    backoff and jitter until ``max_attempts``. Results and final failures are sent to the job's chat.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: Self,
+        client: TelegramClient,
+        outbox: Outbox | None = None,
+        *,
+        concurrency: int = 4,
+        poll_interval: float = 1,
+        visibility_timeout: float = 300,
+        backoff: float = 5,
+        max_backoff: float = 3600,
+    ) -> None:
+        """Create the worker pool.
+
+        Args:
+            client: The client results are sent with.
+            outbox: Outbound queue results go through, sent directly without one.
+            concurrency: Maximum number of jobs running at once.
+            poll_interval: Seconds between looks for due jobs.
+            visibility_timeout: Seconds a claimed job may run before it can be claimed again.
+            backoff: Delay before the first retry, doubled for every further attempt.
+            max_backoff: Maximum delay before a retry.
+        """
+        self.client = client
+        self.outbox = outbox
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.visibility_timeout = visibility_timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+        self._wakeup = asyncio.Event()
+        self._running: set[asyncio.Task[None]] = set()
+        self.stats = JobStats()
+
+    @classmethod
+    def from_env(cls, client: TelegramClient, outbox: Outbox | None, env: Env) -> "JobWorker":
+        """Create a pool configured by ``JOB_CONCURRENCY`` and ``JOB_VISIBILITY_TIMEOUT``.
+
+        Args:
+            client: The client results are sent with.
+            outbox: Outbound queue results go through.
+            env: Environment configuration object.
+
+        Returns
+        -------
+            The configured worker pool
+        """
+        return cls(
+            client,
+            outbox,
+            concurrency=env.int("JOB_CONCURRENCY", 4),
+            visibility_timeout=env.float("JOB_VISIBILITY_TIMEOUT", 300),
+        )
+
+    @staticmethod
+    async def enqueue(  # noqa: PLR0913
+        name: str,
+        payload: dict[str, Any] | None = None,
+        *,
+        chat_id: int | None = None,
+        reply_to: int | None = None,
+        delay: float = 0,
+        max_attempts: int = 5,
+    ) -> Job:
+        """Add a job to the queue.
+
+        Args:
+            name: Name of the registered job function.
+            payload: JSON serializable arguments of the job function.
+            chat_id: Chat the result is sent to.
+            reply_to: Message the result replies to.
+            delay: Seconds before the job is due.
+            max_attempts: Number of attempts before the job is given up.
+
+        Returns
+        -------
+            The queued job
+        """
+        if JobRegistry.get_job(name) is None:
+            msg = f"No job registered as {name!r}"
+            raise ValueError(msg)
+        job: Job = await Job.objects.acreate(
+            name=name,
+            payload=payload or {},
+            chat_id=chat_id,
+            reply_to=reply_to,
+            run_at=timezone.now() + timedelta(seconds=delay),
+            max_attempts=max_attempts,
+        )
+        return job
+
+    def notify(self: Self) -> None:
+        """Look for due jobs right away instead of at the next poll."""
+        self._wakeup.set()
+
+    async def run(self: Self) -> None:
+        """Claim and run jobs until cancelled."""
+        logger.info(f"Job worker {self.name} running up to {self.concurrency} jobs at once")
+        while True:
+            self._wakeup.clear()
+            free = self.concurrency - len(self._running)
+            jobs = []
+            if free:
+                try:
+                    jobs = await sync_to_async(Job.objects.claim)(self.name, free, self.visibility_timeout)
+                except Exception:  # noqa: BLE001
+                    logger.exception("Claiming jobs failed, retrying on the next poll")
+            for job in jobs:
+                task = asyncio.create_task(self._run_job(job))
+                self._running.add(task)
+                task.add_done_callback(self._done)
+            self.stats.claimed += len(jobs)
+            if not free or len(jobs) < free:
+                # Every slot is busy or nothing else is due, wait for a poll, an enqueue or a free slot. Unlike
+                # wait_for on Python 3.11, timeout never swallows a cancellation arriving as the wait ends
+                with contextlib.suppress(TimeoutError):
+                    async with asyncio.timeout(self.poll_interval):
+                        await self._wakeup.wait()
+
+    def _done(self: Self, task: asyncio.Task[None]) -> None:
+        """Release the slot of a finished job."""
+        self._running.discard(task)
+        self._wakeup.set()
+
+    async def _run_job(self: Self, job: Job) -> None:
+        """Run one claimed job and record its outcome."""
+        function = JobRegistry.get_job(job.name)
+        started = time.perf_counter()
+        try:
+            if function is None:
+                msg = f"No job registered as {job.name!r}"
+                raise LookupError(msg)
+            # Finish before the lock lapses, so no other worker runs the job at the same time
+            async with asyncio.timeout(self.visibility_timeout):
+                result = await function(job.payload)
+        except Exception as e:  # noqa: BLE001
+            await self._fail(job, e)
+        else:
+            await self._succeed(job, result)
+        finally:
+            self.stats.run_seconds += time.perf_counter() - started
+
+    def _owned(self: Self, job: Job) -> Any:
+        """Return a queryset of ``job``, empty if another worker reclaimed it in the meantime."""
+        return Job.objects.filter(id=job.id, locked_by=self.name, attempts=job.attempts)
+
+    async def _succeed(self: Self, job: Job, result: Any) -> None:
+        """Store the result of a job and send it to its chat, failing the attempt if the result isn't JSON."""
+        try:
+            updated = await self._owned(job).aupdate(
+                state=JobState.DONE.value,
+                result=result,
+                locked_until=None,
+                error="",
+                last_updated=timezone.now(),
+            )
+        except (TypeError, ValueError) as e:
+            await self._fail(job, e)
+            return
+        if not updated:
+            self.stats.lost += 1
+            logger.warning(f"{job} finished after its visibility timeout, its result is dropped")
+            return
+        self.stats.succeeded += 1
+        if result is not None:
+            await self._deliver(job, str(result))
+
+    async def _fail(self: Self, job: Job, error: Exception) -> None:
+        """Schedule a retry of a failed job, or give it up after its last attempt."""
+        if job.attempts < job.max_attempts:
+            delay = min(self.max_backoff, self.backoff * 2 ** (job.attempts - 1))
+            # Jitter spreads retries of jobs that failed together
+            delay *= random.uniform(0.5, 1.5)  # noqa: S311
+            changes = {"state": JobState.QUEUED.value, "run_at": timezone.now() + timedelta(seconds=delay)}
+        else:
+            changes = {"state": JobState.FAILED.value}
+        updated = await self._owned(job).aupdate(
+            **changes,
+            locked_until=None,
+            error=repr(error),
+            last_updated=timezone.now(),
+        )
+        if not updated:
+            self.stats.lost += 1
+            return
+        if changes["state"] == JobState.QUEUED.value:
+            self.stats.retried += 1
+            logger.warning(f"{job} failed with {error!r}, retrying in {delay:.0f}s")
+        else:
+            self.stats.failed += 1
+            logger.error(f"{job} failed with {error!r}, giving up after {job.attempts} attempts")
+            await self._deliver(job, job_failed)
+
+    async def _deliver(self: Self, job: Job, message: str) -> None:
+        """Send a message to the chat of a job, if it has one."""
+        if job.chat_id is None:
+            return
+        if self.outbox is None:
+            await self.client.send_message(job.chat_id, message, reply_to=job.reply_to)
+        else:
+            self.outbox.send(self.client, job.chat_id, message, reply_to=job.reply_to)
+
+    async def close(self: Self) -> None:
+        """Cancel the running jobs, they are claimed again once their visibility timeout lapses."""
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
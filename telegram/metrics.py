@@ -0,0 +1,416 @@
+"""Expose the bot's internals as Prometheus metrics."""
+
+import asyncio
+import contextlib
+import functools
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable, Iterator
+from contextvars import ContextVar
+from dataclasses import dataclass, fields
+from typing import Any, ClassVar, Self
+
+from django.db.backends.signals import connection_created
+from environs import Env
+from loguru import logger
+
+# Seconds, from a cached lookup to a slow broadcast
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+# Stats fields with these words describe a current state rather than a running total
+GAUGE_WORDS = frozenset(("max", "last", "mean", "ratio", "depth", "pending"))
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, escaped, strict=True))
+    return f"{{{pairs}}}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """A metric family with one value per combination of label values."""
+
+    kind: ClassVar[str]
+
+    def __init__(self: Self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        """Create the family.
+
+        Args:
+            name: Name of the metric.
+            documentation: Help text of the metric.
+            labels: Names of the labels, their values are passed positionally when recording.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    @abstractmethod
+    def samples(self: Self) -> Iterator[tuple[str, str, float]]:
+        """Yield the ``(name, labels, value)`` samples of the family."""
+
+    def render(self: Self) -> str:
+        """Return the family in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """Monotonically increasing total."""
+
+    kind = "counter"
+
+    def __init__(self: Self, name: str, documentation: str, labels: tuple[str, ...] = ()) -> None:
+        """Create the counter, see :class:`Metric`."""
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self: Self, *values: str, amount: float = 1) -> None:
+        """Add ``amount`` to the total of the label ``values``."""
+        self._values[values] = self._values.get(values, 0) + amount
+
+    def samples(self: Self) -> Iterator[tuple[str, str, float]]:
+        """Yield the total of every label combination."""
+        for values, value in self._values.items():
+            yield self.name, _format_labels(self.labels, values), value
+
+
+class Gauge(Counter):
+    """Value that goes up and down."""
+
+    kind = "gauge"
+
+    def dec(self: Self, *values: str, amount: float = 1) -> None:
+        """Subtract ``amount`` from the value of the label ``values``."""
+        self.inc(*values, amount=-amount)
+
+    def set(self: Self, value: float, *values: str) -> None:
+        """Set the value of the label ``values``."""
+        self._values[values] = value
+
+
+class Histogram(Metric):
+    """Distribution of observations over fixed, cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self: Self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        """Create the histogram, see :class:`Metric`.
+
+        Args:
+            name: Name of the metric.
+            documentation: Help text of the metric.
+            labels: Names of the labels.
+            buckets: Sorted upper bounds of the buckets, ``+Inf`` is added.
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        # Label values -> (observations per bucket, the last one above every bound, sum)
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self: Self, value: float, *values: str) -> None:
+        """Record one observation of the label ``values``."""
+        entry = self._values.get(values)
+        if entry is None:
+            entry = self._values[values] = ([0] * (len(self.buckets) + 1), [0.0])
+        counts, total = entry
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self: Self) -> Iterator[tuple[str, str, float]]:
+        """Yield the cumulative buckets, sum and count of every label combination."""
+        for values, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts, strict=True):
+                cumulative += count
+                labels = _format_labels((*self.labels, "le"), (*values, _format_value(bound)))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = _format_labels(self.labels, values)
+            yield f"{self.name}_sum", labels, total[0]
+            yield f"{self.name}_count", labels, cumulative
+
+
+class StatsCollector(Metric):
+    """Metrics read from the fields of a stats dataclass when they are scraped.
+
+    Every numeric field ``<field>`` becomes ``<prefix>_<field>``: a gauge when the field describes a current
+    state, such as ``max_depth``, and a ``_total`` counter otherwise. Dictionary fields become one sample per key.
+    """
+
+    kind = "untyped"
+
+    def __init__(self: Self, prefix: str, stats: Any) -> None:
+        """Create the collector.
+
+        Args:
+            prefix: Prefix of the metric names.
+            stats: The stats dataclass, read on every scrape.
+        """
+        super().__init__(prefix, f"Stats of {type(stats).__name__}")
+        self.stats = stats
+
+    def _family(self: Self, field_name: str) -> tuple[str, str]:
+        """Return the metric name and type a field of the stats is exposed as."""
+        if GAUGE_WORDS.isdisjoint(field_name.split("_")):
+            return f"{self.name}_{field_name}_total", "counter"
+        return f"{self.name}_{field_name}", "gauge"
+
+    def samples(self: Self) -> Iterator[tuple[str, str, float]]:
+        """Yield the samples of every numeric or dictionary field of the stats."""
+        for field in fields(self.stats):
+            value = getattr(self.stats, field.name)
+            name, _ = self._family(field.name)
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    yield name, _format_labels(("key",), (str(key),)), item
+            elif isinstance(value, int | float):
+                yield name, "", value
+
+    def render(self: Self) -> str:
+        """Return one family per field of the stats."""
+        families: dict[str, list[str]] = {}
+        for field in fields(self.stats):
+            if isinstance(getattr(self.stats, field.name), dict | int | float):
+                name, kind = self._family(field.name)
+                families[name] = [f"# TYPE {name} {kind}"]
+        for name, labels, value in self.samples():
+            families[name].append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join("\n".join(lines) for lines in families.values())
+
+
+class CallbackGauge(Metric):
+    """Gauge whose value is computed when it's scraped."""
+
+    kind = "gauge"
+
+    def __init__(self: Self, name: str, documentation: str, callback: Callable[[], float]) -> None:
+        """Create the gauge.
+
+        Args:
+            name: Name of the metric.
+            documentation: Help text of the metric.
+            callback: Returns the current value.
+        """
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def samples(self: Self) -> Iterator[tuple[str, str, float]]:
+        """Yield the current value."""
+        yield self.name, "", self.callback()
+
+
+class MetricsRegistry:
+    """Collection of the metrics served by the :class:`MetricsServer`."""
+
+    def __init__(self: Self) -> None:
+        """Create an empty registry."""
+        self._metrics: dict[str, Metric] = {}
+
+    def register(self: Self, metric: Metric) -> Any:
+        """Add a metric, replacing any other with the same name.
+
+        Returns
+        -------
+            The metric
+        """
+        self._metrics[metric.name] = metric
+        return metric
+
+    def add_stats(self: Self, prefix: str, stats: Any) -> None:
+        """Expose the fields of a stats dataclass as ``tg_<prefix>_<field>``."""
+        self.register(StatsCollector(f"tg_{prefix}", stats))
+
+    def add_gauge(self: Self, name: str, documentation: str, callback: Callable[[], float]) -> None:
+        """Expose the value returned by ``callback`` as the gauge ``tg_<name>``."""
+        self.register(CallbackGauge(f"tg_{name}", documentation, callback))
+
+    def render(self: Self) -> str:
+        """Return every metric in the Prometheus text format."""
+        rendered = []
+        for metric in self._metrics.values():
+            try:
+                rendered.append(metric.render())
+            except Exception:  # noqa: BLE001
+                logger.exception(f"Rendering metric {metric.name} failed")
+        return "\n".join(rendered) + "\n"
+
+
+registry = MetricsRegistry()
+
+command_seconds: Histogram = registry.register(
+    Histogram("tg_command_duration_seconds", "Time spent handling a command.", ("command",)),
+)
+command_errors: Counter = registry.register(
+    Counter("tg_command_errors_total", "Commands whose handler raised.", ("command",)),
+)
+commands_in_flight: Gauge = registry.register(
+    Gauge("tg_commands_in_flight", "Commands being handled right now.", ("command",)),
+)
+command_queries: Histogram = registry.register(
+    Histogram("tg_command_db_queries", "Database queries run while handling a command.", ("command",), QUERY_BUCKETS),
+)
+command_query_seconds: Counter = registry.register(
+    Counter("tg_command_db_query_seconds_total", "Time spent in database queries by commands.", ("command",)),
+)
+
+
+@dataclass
+class QueryStats:
+    """Database queries run on behalf of one update.
+
+    Attributes
+    ----------
+        count (int): Queries run.
+        seconds (float): Time spent running them.
+    """
+
+    count: int = 0
+    seconds: float = 0.0
+
+
+# Queries of the update being handled, copied into the threads sync_to_async runs ORM calls on
+update_queries: ContextVar[QueryStats | None] = ContextVar("update_queries", default=None)
+
+# Queries of the whole process, background work included
+process_queries = QueryStats()
+
+
+def count_queries(execute: Callable[..., Any], sql: str, params: Any, many: bool, context: dict[str, Any]) -> Any:  # noqa: FBT001
+    """Database execute wrapper adding every query to the process and current update :class:`QueryStats`."""
+    stats = update_queries.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        process_queries.count += 1
+        process_queries.seconds += elapsed
+        if stats is not None:
+            stats.count += 1
+            stats.seconds += elapsed
+
+
+def install_query_counter(connection: Any, **_: Any) -> None:
+    """Add :func:`count_queries` to a new database connection."""
+    if count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_queries)
+
+
+connection_created.connect(install_query_counter, dispatch_uid="telegram.metrics.count_queries")
+
+
+def instrument(command: str, handle: Callable[[Any], Awaitable[None]]) -> Callable[[Any], Awaitable[None]]:
+    """Wrap the handler of ``command`` to record its latency, errors, concurrency and database queries.
+
+    Args:
+        command: Name of the command, used as the metrics label.
+        handle: The handler.
+
+    Returns
+    -------
+        The instrumented handler
+    """
+
+    @functools.wraps(handle)
+    async def instrumented(event: Any) -> None:
+        queries = QueryStats()
+        token = update_queries.set(queries)
+        commands_in_flight.inc(command)
+        started = time.perf_counter()
+        try:
+            await handle(event)
+        except BaseException:
+            command_errors.inc(command)
+            raise
+        finally:
+            command_seconds.observe(time.perf_counter() - started, command)
+            commands_in_flight.dec(command)
+            command_queries.observe(queries.count, command)
+            command_query_seconds.inc(command, amount=queries.seconds)
+            update_queries.reset(token)
+
+    return instrumented
+
+
+class MetricsServer:
+    """Minimal HTTP server answering ``GET /metrics`` on the bot's event loop.
+
+    Scrapes only read in-memory counters, so serving them next to the handlers costs nothing in between.
+    """
+
+    def __init__(self: Self, metrics: MetricsRegistry, host: str = "127.0.0.1", port: int = 9100) -> None:
+        """Create the server. It listens once started.
+
+        Args:
+            metrics: Registry of the metrics served.
+            host: Address to listen on.
+            port: Port to listen on.
+        """
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server: asyncio.Server | None = None
+
+    @classmethod
+    def from_env(cls, env: Env) -> "MetricsServer | None":
+        """Create a server listening on ``METRICS_HOST`` and ``METRICS_PORT``, None unless a port is set.
+
+        Args:
+            env: Environment configuration object.
+
+        Returns
+        -------
+            The configured server or None
+        """
+        port = env.int("METRICS_PORT", 0)
+        if not port:
+            return None
+        return cls(registry, env.str("METRICS_HOST", "127.0.0.1"), port)
+
+    async def start(self: Self) -> None:
+        """Start listening."""
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def _serve(self: Self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Answer one request and close the connection."""
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=5)
+            method, path, *_ = request.decode("latin-1").split(" ", 2)
+            if method == "GET" and path.split("?", 1)[0] == "/metrics":
+                status, body = "200 OK", self.metrics.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            headers = f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\n"
+            writer.write(f"{headers}Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (TimeoutError, ValueError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def close(self: Self) -> None:
+        """Stop listening."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
@@ -0,0 +1,266 @@
+"""Rate limited outbound message pipeline."""
+
+import asyncio
+import contextvars
+import time
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any, Self
+
+from environs import Env
+from loguru import logger
+from telethon import TelegramClient, events
+from telethon.errors import FloodWaitError
+
+
+class TokenBucket:
+    """Token bucket handing out reservations.
+
+    A reservation always succeeds and returns how long the caller has to wait before its token is available,
+    which keeps callers served in the order they asked.
+    """
+
+    def __init__(self: Self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic) -> None:
+        """Create a full bucket.
+
+        Args:
+            rate: Tokens added per second.
+            capacity: Maximum number of tokens, i.e. the allowed burst.
+            clock: Monotonic clock, replaceable for simulations.
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+
+    def reserve(self: Self) -> float:
+        """Take one token.
+
+        Returns
+        -------
+            Seconds until the token is actually available, 0 if it is available right away
+        """
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def is_full(self: Self) -> bool:
+        """Check whether the bucket refilled completely, in which case it no longer limits anything."""
+        return self._tokens + (self._clock() - self._updated) * self.rate >= self.capacity
+
+
+@dataclass
+class OutboxStats:
+    """Counters describing the outbound pipeline.
+
+    Attributes
+    ----------
+        queued (int): Messages accepted into the outbox.
+        sent (int): Messages delivered to Telegram.
+        failed (int): Messages that failed with an error other than FloodWait.
+        flood_waits (int): FloodWait errors received.
+        flood_wait_seconds (float): Total time chats were parked because of FloodWait.
+        latency_seconds (float): Total time messages spent queued before being sent.
+        max_latency_seconds (float): Longest time a message spent queued before being sent.
+    """
+
+    queued: int = 0
+    sent: int = 0
+    failed: int = 0
+    flood_waits: int = 0
+    flood_wait_seconds: float = 0.0
+    latency_seconds: float = 0.0
+    max_latency_seconds: float = 0.0
+
+    @property
+    def mean_latency_seconds(self: Self) -> float:
+        """Return the mean time messages spent queued before being sent."""
+        return self.latency_seconds / self.sent if self.sent else 0.0
+
+
+@dataclass
+class _Pending:
+    client: TelegramClient
+    entity: Any
+    message: Any
+    kwargs: dict[str, Any]
+    future: "asyncio.Future[Any]"
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class Outbox:
+    """Queue outgoing messages and send them within Telegram's flood limits.
+
+    Every chat has its own FIFO queue drained by a short-lived task, so messages to one chat keep their order.
+    Sends are paced by a global token bucket and a per-chat token bucket. When Telegram answers with
+    FloodWait, only the affected chat is parked for the requested time while every other chat keeps
+    flowing. Callers get a future for the sent message and don't have to wait for delivery.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: Self,
+        global_rate: float = 30,
+        global_burst: float = 30,
+        chat_rate: float = 1,
+        chat_burst: float = 3,
+        *,
+        max_idle_chats: int = 10_000,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[Any]] = asyncio.sleep,
+    ) -> None:
+        """Create the outbox.
+
+        Args:
+            global_rate: Messages per second allowed across all chats.
+            global_burst: Messages that may be sent at once across all chats.
+            chat_rate: Messages per second allowed in a single chat.
+            chat_burst: Messages that may be sent at once in a single chat.
+            max_idle_chats: Number of per-chat limits kept before idle ones are pruned.
+            clock: Monotonic clock, replaceable for simulations.
+            sleep: Coroutine function used to wait, replaceable for simulations.
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_idle_chats = max_idle_chats
+        self._clock = clock
+        self._sleep = sleep
+        self._global = TokenBucket(global_rate, global_burst, clock)
+        self._buckets: dict[int, TokenBucket] = {}
+        self._queues: dict[int, deque[_Pending]] = {}
+        self._parked_until: dict[int, float] = {}
+        self._tasks: dict[int, asyncio.Task[None]] = {}
+        self.stats = OutboxStats()
+
+    @classmethod
+    def from_env(cls, env: Env) -> "Outbox":
+        """Create an outbox configured by the ``OUTBOX_*`` variables.
+
+        Args:
+            env: Environment configuration object.
+
+        Returns
+        -------
+            The configured outbox
+        """
+        return cls(
+            global_rate=env.float("OUTBOX_GLOBAL_RATE", 30),
+            global_burst=env.float("OUTBOX_GLOBAL_BURST", 30),
+            chat_rate=env.float("OUTBOX_CHAT_RATE", 1),
+            chat_burst=env.float("OUTBOX_CHAT_BURST", 3),
+        )
+
+    def send(
+        self: Self,
+        client: TelegramClient,
+        chat_id: int,
+        message: Any,
+        entity: Any = None,
+        **kwargs: Any,
+    ) -> "asyncio.Future[Any]":
+        """Queue a message for ``chat_id``.
+
+        Args:
+            client: The client sending the message.
+            chat_id: ID of the chat, used for ordering and per-chat limits.
+            message: The message passed to ``client.send_message``.
+            entity: Entity to send to, defaults to ``chat_id``.
+            **kwargs: Extra arguments passed to ``client.send_message``.
+
+        Returns
+        -------
+            Future resolved with the sent message, or with the error that prevented sending it
+        """
+        future: asyncio.Future[Any] = asyncio.get_running_loop().create_future()
+        pending = _Pending(client, chat_id if entity is None else entity, message, kwargs, future, self._clock())
+        self._queues.setdefault(chat_id, deque()).append(pending)
+        self.stats.queued += 1
+        if chat_id not in self._tasks:
+            # The drain outlives the update that started it and sends the messages of later ones, so it must not
+            # inherit that update's context, such as its profile
+            self._tasks[chat_id] = asyncio.create_task(
+                self._drain(chat_id),
+                name=f"outbox-{chat_id}",
+                context=contextvars.Context(),
+            )
+        return future
+
+    def reply(self: Self, event: events.NewMessage.Event, message: Any, **kwargs: Any) -> "asyncio.Future[Any]":
+        """Queue a reply to the message of ``event``.
+
+        Args:
+            event: The message event to reply to.
+            message: The reply.
+            **kwargs: Extra arguments passed to ``client.send_message``.
+
+        Returns
+        -------
+            Future resolved with the sent message, or with the error that prevented sending it
+        """
+        kwargs.setdefault("reply_to", event.id)
+        return self.send(event.client, event.chat_id, message, entity=event.input_chat, **kwargs)
+
+    async def _drain(self: Self, chat_id: int) -> None:
+        queue = self._queues[chat_id]
+        bucket = self._buckets.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst, self._clock))
+        try:
+            while queue:
+                pending = queue[0]
+                parked = self._parked_until.get(chat_id, 0) - self._clock()
+                if parked > 0:
+                    await self._sleep(parked)
+                delay = max(bucket.reserve(), self._global.reserve())
+                if delay > 0:
+                    await self._sleep(delay)
+                try:
+                    result = await pending.client.send_message(pending.entity, pending.message, **pending.kwargs)
+                except FloodWaitError as e:
+                    # Park this chat only and retry the same message once the wait is over
+                    self.stats.flood_waits += 1
+                    self.stats.flood_wait_seconds += e.seconds
+                    self._parked_until[chat_id] = self._clock() + e.seconds
+                    logger.warning(f"FloodWait of {e.seconds}s in chat {chat_id}, {len(queue)} messages parked")
+                    continue
+                except Exception as e:  # noqa: BLE001
+                    self.stats.failed += 1
+                    logger.warning(f"Couldn't send message to chat {chat_id}: {e!r}")
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                        # Already logged, don't let asyncio complain about it again if nobody awaits the future
+                        pending.future.exception()
+                else:
+                    latency = self._clock() - pending.enqueued_at
+                    self.stats.sent += 1
+                    self.stats.latency_seconds += latency
+                    self.stats.max_latency_seconds = max(self.stats.max_latency_seconds, latency)
+                    if not pending.future.done():
+                        pending.future.set_result(result)
+                queue.popleft()
+        finally:
+            del self._tasks[chat_id], self._queues[chat_id]
+            if len(self._buckets) > self.max_idle_chats:
+                self._prune()
+
+    def _prune(self: Self) -> None:
+        """Forget the limits of idle chats whose bucket refilled and that aren't parked anymore."""
+        now = self._clock()
+        for chat_id in [
+            chat_id
+            for chat_id, bucket in self._buckets.items()
+            if chat_id not in self._tasks and bucket.is_full() and self._parked_until.get(chat_id, 0) <= now
+        ]:
+            del self._buckets[chat_id]
+            self._parked_until.pop(chat_id, None)
+
+    @property
+    def pending(self: Self) -> int:
+        """Return the number of messages waiting to be sent."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def close(self: Self) -> None:
+        """Wait until every queued message was sent or failed."""
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
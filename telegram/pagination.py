@@ -0,0 +1,255 @@
+"""Keyset pagination for commands listing records."""
+
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any, ClassVar, Self
+
+from django.db.models import Model, QuerySet
+from loguru import logger
+from telethon import Button, TelegramClient, events
+
+from sqlitedb.models import UserSnapshot
+from telegram.gate import StatusGate
+from telegram.utils import PAGE_SIZE, UserSettings, get_user
+
+# Prefix of the callback data of every pagination button
+CALLBACK_PREFIX = "pg"
+
+# Telegram rejects inline buttons carrying more callback data than this
+MAX_CALLBACK_DATA = 64
+
+# Upper bound for the user's page size setting, so a page always fits in one message
+MAX_PAGE_SIZE = 50
+
+FORWARD, BACKWARD = ">", "<"
+
+
+def encode_cursor(name: str, direction: str, key: int) -> bytes:
+    """Encode a page request into inline button callback data.
+
+    The key is written in base 36, so even 64-bit keys take at most 13 bytes, e.g. ``pg:users:>2n9c``.
+
+    Args:
+        name: Name of the paginator.
+        direction: ``FORWARD`` for the page after ``key``, ``BACKWARD`` for the page before it.
+        key: Key of the record the page starts after (or ends before).
+
+    Returns
+    -------
+        The callback data
+    """
+    digits = []
+    value = abs(key)
+    while True:
+        value, digit = divmod(value, 36)
+        digits.append("0123456789abcdefghijklmnopqrstuvwxyz"[digit])
+        if not value:
+            break
+    sign = "-" if key < 0 else ""
+    data = f"{CALLBACK_PREFIX}:{name}:{direction}{sign}{''.join(reversed(digits))}".encode()
+    if len(data) > MAX_CALLBACK_DATA:
+        msg = f"Callback data {data!r} exceeds {MAX_CALLBACK_DATA} bytes"
+        raise ValueError(msg)
+    return data
+
+
+def decode_cursor(data: bytes) -> tuple[str, str, int]:
+    """Decode callback data produced by :func:`encode_cursor`.
+
+    Args:
+        data: The callback data.
+
+    Returns
+    -------
+        The paginator name, the direction and the key
+
+    Raises
+    ------
+        ValueError: If the data wasn't produced by :func:`encode_cursor`.
+    """
+    prefix, name, cursor = data.decode().split(":")
+    if prefix != CALLBACK_PREFIX or cursor[:1] not in {FORWARD, BACKWARD}:
+        msg = f"Not a pagination cursor: {data!r}"
+        raise ValueError(msg)
+    return name, cursor[0], int(cursor[1:], 36)
+
+
+def page_size_for(user: UserSnapshot) -> int:
+    """Return the page size chosen by the user in their settings, or the default.
+
+    Args:
+        user: The user viewing the list.
+
+    Returns
+    -------
+        The number of records per page
+    """
+    try:
+        page_size = int(user.settings.get(UserSettings.PAGE_SIZE.value, PAGE_SIZE))
+    except (TypeError, ValueError):
+        page_size = PAGE_SIZE
+    return max(1, min(page_size, MAX_PAGE_SIZE))
+
+
+@dataclass
+class Page:
+    """One page of records.
+
+    Attributes
+    ----------
+        items (list): The records, in key order.
+        has_previous (bool): Whether records exist before the first one.
+        has_next (bool): Whether records exist after the last one.
+    """
+
+    items: list[Any]
+    has_previous: bool
+    has_next: bool
+
+
+class Paginator:
+    """Page through a queryset with keyset (seek) pagination.
+
+    Pages are fetched with ``key > last key seen`` (or ``key < first key seen`` going back) on an indexed
+    column instead of ``OFFSET``, so deep pages cost the same as the first one. Page buttons carry the cursor
+    in their callback data and clicking one edits the message in place.
+    """
+
+    _paginators: ClassVar[dict[str, "Paginator"]] = {}
+
+    # Drops button clicks of suspended and banned users, set up by the bot on startup
+    gate: ClassVar[StatusGate | None] = None
+
+    # Creates the command of a paginator, named after it, that wasn't created yet, set up by the bot on startup
+    loader: ClassVar[Callable[[str], object] | None] = None
+
+    def __init__(  # noqa: PLR0913
+        self: Self,
+        name: str,
+        queryset: Callable[[], QuerySet[Any]],
+        render_item: Callable[[Any], str],
+        key: str = "id",
+        title: str = "",
+        *,
+        is_allowed: Callable[[int | None], bool] | None = None,
+    ) -> None:
+        """Create and register the paginator.
+
+        Args:
+            name: Unique short name, part of the callback data of every button, the name of the command.
+            queryset: Returns the records to page through, without ordering.
+            render_item: Renders one record as a line of the message.
+            key: Unique, indexed integer column pages are sought on.
+            title: Line shown above every page.
+            is_allowed: Decides from their Telegram ID whether the user clicking a button may see the list,
+                everyone by default.
+        """
+        self.name = name
+        self.queryset = queryset
+        self.render_item = render_item
+        self.key = key
+        self.title = title
+        self.is_allowed = is_allowed or (lambda _: True)
+        self._paginators[name] = self
+
+    async def fetch(self: Self, page_size: int, after: int | None = None, before: int | None = None) -> Page:
+        """Fetch the page after ``after``, the page before ``before``, or the first page.
+
+        Args:
+            page_size: Number of records per page.
+            after: Key the page starts after.
+            before: Key the page ends before.
+
+        Returns
+        -------
+            The page
+        """
+        queryset = self.queryset()
+        if before is not None:
+            rows = queryset.filter(**{f"{self.key}__lt": before}).order_by(f"-{self.key}")
+            items = [item async for item in rows[: page_size + 1]]
+            has_more = len(items) > page_size
+            return Page(list(reversed(items[:page_size])), has_previous=has_more, has_next=True)
+
+        if after is not None:
+            queryset = queryset.filter(**{f"{self.key}__gt": after})
+        items = [item async for item in queryset.order_by(self.key)[: page_size + 1]]
+        has_more = len(items) > page_size
+        return Page(items[:page_size], has_previous=after is not None, has_next=has_more)
+
+    def render(self: Self, page: Page) -> tuple[str, list[list[Button]] | None]:
+        """Render a page as message text and navigation buttons.
+
+        Args:
+            page: The page to render.
+
+        Returns
+        -------
+            The text and the buttons of the message
+        """
+        lines = [self.render_item(item) for item in page.items] or ["Nothing here yet."]
+        text = "\n".join([self.title, "", *lines]) if self.title else "\n".join(lines)
+        row = []
+        if page.items and page.has_previous:
+            first: Model = page.items[0]
+            row.append(Button.inline("« Previous", encode_cursor(self.name, BACKWARD, getattr(first, self.key))))
+        if page.items and page.has_next:
+            last: Model = page.items[-1]
+            row.append(Button.inline("Next »", encode_cursor(self.name, FORWARD, getattr(last, self.key))))
+        return text, [row] if row else None
+
+    async def first_page(self: Self, user: UserSnapshot) -> tuple[str, list[list[Button]] | None]:
+        """Render the first page for ``user``.
+
+        Args:
+            user: The user viewing the list, whose settings pick the page size.
+
+        Returns
+        -------
+            The text and the buttons of the message
+        """
+        return self.render(await self.fetch(page_size_for(user)))
+
+    @classmethod
+    async def on_callback(cls, event: events.CallbackQuery.Event) -> None:
+        """Replace a listed page with the one requested by the clicked button.
+
+        Args:
+            event: The callback query of the clicked button.
+        """
+        if cls.gate is not None and not cls.gate.allows(event):
+            await event.answer()
+            return
+        try:
+            name, direction, key = decode_cursor(event.data)
+        except ValueError:
+            logger.debug(f"Ignoring malformed pagination data {event.data!r}")
+            await event.answer()
+            return
+        paginator = cls._paginators.get(name)
+        if paginator is None and cls.loader is not None:
+            # Commands are created on their first message, which may have been before a restart
+            cls.loader(name)
+            paginator = cls._paginators.get(name)
+        # The clicking user, in groups the chat is shared by everyone in it
+        if paginator is None or not paginator.is_allowed(event.sender_id):
+            await event.answer()
+            return
+
+        page_size = page_size_for(await get_user(event))
+        if direction == FORWARD:
+            page = await paginator.fetch(page_size, after=key)
+        else:
+            page = await paginator.fetch(page_size, before=key)
+        text, buttons = paginator.render(page)
+        await event.edit(text, buttons=buttons)
+        await event.answer()
+
+    @classmethod
+    def attach(cls, client: TelegramClient) -> None:
+        """Handle the pagination buttons of every paginator on ``client``.
+
+        Args:
+            client: The Telegram client instance
+        """
+        client.add_event_handler(cls.on_callback, events.CallbackQuery(pattern=f"^{CALLBACK_PREFIX}:".encode()))
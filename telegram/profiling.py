@@ -0,0 +1,226 @@
+"""Opt-in profiling of a sample of the updates, to find where slow handlers spend their time."""
+
+import contextlib
+import cProfile
+import functools
+import json
+import random
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Self
+
+from environs import Env
+from loguru import logger
+
+from telegram.metrics import update_queries
+
+# File the stage breakdowns of the sampled updates are appended to, rotated once it reaches max_bytes
+STAGES_FILE = "stages.jsonl"
+
+
+@dataclass
+class UpdateProfile:
+    """Timings of one sampled update.
+
+    Attributes
+    ----------
+        command (str): Name of the command handling the update.
+        started (float): UNIX time the handler started.
+        stages (dict): Seconds spent in every stage, e.g. ``get_user`` or ``reply``.
+        calls (dict): Number of times every stage ran.
+    """
+
+    command: str
+    started: float = field(default_factory=time.time)
+    stages: dict[str, float] = field(default_factory=dict)
+    calls: dict[str, int] = field(default_factory=dict)
+
+    def add(self: Self, name: str, seconds: float) -> None:
+        """Add ``seconds`` to the stage ``name``."""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+
+# Profile of the sampled update being handled, None for the updates that aren't sampled
+current_profile: ContextVar[UpdateProfile | None] = ContextVar("current_profile", default=None)
+
+
+# Returned by stage() outside sampled updates, so the hot path only pays for a context variable lookup
+_NOT_SAMPLED = contextlib.nullcontext()
+
+
+class _Stage:
+    """Adds the time spent in its block to a stage of an :class:`UpdateProfile`."""
+
+    __slots__ = ("name", "profile", "started")
+
+    def __init__(self: Self, profile: UpdateProfile, name: str) -> None:
+        self.profile = profile
+        self.name = name
+        self.started = 0.0
+
+    def __enter__(self: Self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self: Self, *_: object) -> None:
+        self.profile.add(self.name, time.perf_counter() - self.started)
+
+
+def stage(name: str) -> contextlib.AbstractContextManager[None]:
+    """Time the block as the stage ``name`` of the sampled update being handled, if any.
+
+    Args:
+        name: Name of the stage.
+
+    Returns
+    -------
+        The context manager timing the block
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return _NOT_SAMPLED
+    return _Stage(profile, name)
+
+
+class Profiler:
+    """Record a stage breakdown of a fraction of the updates, and a cProfile dump of the slow ones.
+
+    A sampled update is profiled with cProfile while its handler runs. Only one profile can run at a time, so
+    updates sampled while another one is profiled only get their stage breakdown. cProfile sees every frame
+    the event loop runs, so the dump of a handler that awaited also holds the work of other tasks meanwhile;
+    its own frames are the ones below the handler's coroutine. ORM calls run on ``sync_to_async`` threads that
+    cProfile doesn't see, their time shows in the ``get_user`` stage and the query timings instead. Dumps over
+    ``max_dumps`` are deleted, oldest first, and the stage breakdowns are rotated once they reach ``max_bytes``.
+    """
+
+    def __init__(
+        self: Self,
+        directory: Path,
+        sample_rate: float = 0.01,
+        slow_seconds: float = 1.0,
+        max_dumps: int = 100,
+        max_bytes: int = 10_000_000,
+    ) -> None:
+        """Create the profiler.
+
+        Args:
+            directory: Where the breakdowns and dumps are written.
+            sample_rate: Fraction of the updates profiled.
+            slow_seconds: Handler duration from which the cProfile of a sampled update is dumped.
+            max_dumps: Maximum number of dumps kept.
+            max_bytes: Size of the breakdowns file at which it's rotated.
+        """
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.max_dumps = max_dumps
+        self.max_bytes = max_bytes
+        self._profiling = False
+
+    @classmethod
+    def from_env(cls, env: Env) -> "Profiler | None":
+        """Create a profiler configured by the ``PROFILE_*`` variables, None unless ``PROFILE_SAMPLE_RATE`` is set.
+
+        Args:
+            env: Environment configuration object.
+
+        Returns
+        -------
+            The configured profiler or None
+        """
+        sample_rate = env.float("PROFILE_SAMPLE_RATE", 0)
+        if sample_rate <= 0:
+            return None
+        profiler = cls(
+            Path(env.str("PROFILE_DIR", "profiles")),
+            sample_rate=sample_rate,
+            slow_seconds=env.float("PROFILE_SLOW_SECONDS", 1.0),
+            max_dumps=env.int("PROFILE_MAX_DUMPS", 100),
+        )
+        logger.info(
+            f"Profiling {sample_rate:.1%} of the updates into {profiler.directory}, "
+            f"dumping handlers slower than {profiler.slow_seconds}s",
+        )
+        return profiler
+
+    def wrap(self: Self, command: str, handle: Callable[[Any], Awaitable[None]]) -> Callable[[Any], Awaitable[None]]:
+        """Wrap the handler of ``command`` to profile a sample of its updates.
+
+        Args:
+            command: Name of the command.
+            handle: The handler.
+
+        Returns
+        -------
+            The wrapped handler
+        """
+
+        @functools.wraps(handle)
+        async def profiled(event: Any) -> None:
+            if random.random() >= self.sample_rate:  # noqa: S311
+                await handle(event)
+                return
+            await self._profile(command, handle, event)
+
+        return profiled
+
+    async def _profile(self: Self, command: str, handle: Callable[[Any], Awaitable[None]], event: Any) -> None:
+        """Run the handler of one sampled update under the profilers."""
+        profile = UpdateProfile(command)
+        token = current_profile.set(profile)
+        # Python allows a single profiler per thread, the updates sampled meanwhile are only timed
+        profiler = None
+        if not self._profiling and sys.getprofile() is None:
+            profiler = cProfile.Profile()
+            self._profiling = True
+            profiler.enable()
+        started = time.perf_counter()
+        try:
+            await handle(event)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            current_profile.reset(token)
+            try:
+                self._record(profile, elapsed, profiler if elapsed >= self.slow_seconds else None)
+            except OSError:
+                logger.exception("Writing the profile failed")
+
+    def _record(self: Self, profile: UpdateProfile, elapsed: float, profiler: cProfile.Profile | None) -> None:
+        """Append the breakdown of a sampled update and dump its profile if there is one."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        queries = update_queries.get()
+        record: dict[str, Any] = {
+            "command": profile.command,
+            "started": profile.started,
+            "seconds": elapsed,
+            "stages": profile.stages,
+            "calls": profile.calls,
+            "queries": queries.count if queries is not None else None,
+            "query_seconds": queries.seconds if queries is not None else None,
+            "dump": None,
+        }
+        if profiler is not None:
+            stamp = datetime.fromtimestamp(profile.started, UTC).strftime("%Y%m%dT%H%M%S.%f")
+            dump = self.directory / f"{stamp}-{profile.command}-{elapsed * 1000:.0f}ms.prof"
+            profiler.dump_stats(dump)
+            record["dump"] = dump.name
+            self._rotate_dumps()
+        stages = self.directory / STAGES_FILE
+        if stages.exists() and stages.stat().st_size >= self.max_bytes:
+            stages.replace(stages.with_suffix(".jsonl.1"))
+        with stages.open("a") as file:
+            file.write(json.dumps(record) + "\n")
+
+    def _rotate_dumps(self: Self) -> None:
+        """Delete the oldest dumps beyond ``max_dumps``."""
+        dumps = sorted(self.directory.glob("*.prof"))
+        for dump in dumps[: max(len(dumps) - self.max_dumps, 0)]:
+            dump.unlink(missing_ok=True)
@@ -0,0 +1,221 @@
+"""Limit how often each user may run commands."""
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import NamedTuple, Self
+
+from django.utils import timezone
+from environs import Env
+from loguru import logger
+
+from sqlitedb.models import User
+from sqlitedb.utils import UserStatus
+from telegram.gate import StatusGate
+from telegram.metrics import Gauge, MetricsRegistry
+
+# Key of the thresholds applying to commands without their own
+DEFAULT = "default"
+
+
+class RateLimit(NamedTuple):
+    """At most ``limit`` commands per ``window`` seconds."""
+
+    limit: int
+    window: float
+
+    @classmethod
+    def parse(cls, value: str) -> "RateLimit":
+        """Parse ``<limit>/<window seconds>``, e.g. ``20/60``."""
+        limit, _, window = value.partition("/")
+        return cls(int(limit), float(window or 60))
+
+
+@dataclass
+class RateLimiterStats:
+    """Counters describing the rate limiter.
+
+    Attributes
+    ----------
+        allowed (int): Commands let through.
+        limited (int): Commands dropped for exceeding their threshold.
+        banned (int): Users moved to TEMP_BANNED.
+        evicted (int): Idle windows evicted.
+        limited_by_command (dict): Commands dropped, by command name.
+    """
+
+    allowed: int = 0
+    limited: int = 0
+    banned: int = 0
+    evicted: int = 0
+    limited_by_command: dict[str, int] = field(default_factory=dict)
+
+
+class _Window:
+    """Sliding window counter of one user and command: two fixed windows weighted by their overlap."""
+
+    __slots__ = ("current", "previous", "start")
+
+    def __init__(self: Self, start: float) -> None:
+        self.start = start
+        self.current = 0
+        self.previous = 0
+
+    def hit(self: Self, now: float, window: float) -> float:
+        """Count a command at ``now`` and return the estimated number of commands in the last ``window``."""
+        elapsed = now - self.start
+        if elapsed >= window:
+            # Roll over, the previous window only counts when it's the one right before
+            self.previous = self.current if elapsed < 2 * window else 0
+            self.current = 0
+            self.start = now - elapsed % window
+            elapsed %= window
+        self.current += 1
+        return self.previous * (1 - elapsed / window) + self.current
+
+
+class RateLimiter:
+    """Sliding-window rate limiter keyed by sender and command.
+
+    Every user and command pair keeps two counters, so memory stays constant per active user however fast they
+    send. Commands over the threshold of their command are dropped. A user who keeps sending until
+    ``ban_factor`` times the threshold is moved to ``TEMP_BANNED`` for ``ban_duration`` and gated right away.
+    Windows idle for longer than the largest window are evicted, and at most ``max_keys`` are kept.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: Self,
+        limits: dict[str, RateLimit] | None = None,
+        *,
+        ban_factor: float = 2,
+        ban_duration: timedelta = timedelta(hours=1),
+        gate: StatusGate | None = None,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        """Create the limiter.
+
+        Args:
+            limits: Thresholds by command name, ``DEFAULT`` applying to the others.
+            ban_factor: Multiple of the threshold at which the user is banned.
+            ban_duration: How long a ban lasts.
+            gate: Gate told about bans, so they apply before the next refresh.
+            max_keys: Maximum number of windows kept.
+            clock: Monotonic clock in seconds.
+        """
+        self.limits = {DEFAULT: RateLimit(20, 60), **(limits or {})}
+        self.ban_factor = ban_factor
+        self.ban_duration = ban_duration
+        self.gate = gate
+        self.max_keys = max_keys
+        self.clock = clock
+        self.idle_after = max(limit.window for limit in self.limits.values()) * 2
+        self._windows: OrderedDict[tuple[int, str], _Window] = OrderedDict()
+        self.stats = RateLimiterStats()
+
+    @classmethod
+    def from_env(cls, env: Env, gate: StatusGate | None = None) -> "RateLimiter":
+        """Create a limiter configured by ``RATE_LIMITS``, ``RATE_LIMIT_BAN_FACTOR`` and ``RATE_LIMIT_BAN_SECONDS``.
+
+        ``RATE_LIMITS`` lists thresholds by command, e.g. ``default=20/60,broadcast=2/60``.
+
+        Args:
+            env: Environment configuration object.
+            gate: Gate told about bans.
+
+        Returns
+        -------
+            The configured limiter
+        """
+        thresholds: dict[str, str] = env.dict("RATE_LIMITS", {})
+        limits = {name: RateLimit.parse(value) for name, value in thresholds.items()}
+        return cls(
+            limits,
+            ban_factor=env.float("RATE_LIMIT_BAN_FACTOR", 2),
+            ban_duration=timedelta(seconds=env.int("RATE_LIMIT_BAN_SECONDS", 3600)),
+            gate=gate,
+        )
+
+    def export(self: Self, metrics: MetricsRegistry) -> None:
+        """Expose the configured thresholds in ``metrics``, next to the counters of :attr:`stats`."""
+        threshold = Gauge("tg_rate_limiter_threshold", "Commands allowed per window.", ("command",))
+        window = Gauge("tg_rate_limiter_window_seconds", "Length of the rate limit window.", ("command",))
+        for command, limit in self.limits.items():
+            threshold.set(limit.limit, command)
+            window.set(limit.window, command)
+        ban_factor = Gauge("tg_rate_limiter_ban_factor", "Multiple of the threshold at which users are banned.")
+        ban_factor.set(self.ban_factor)
+        ban_seconds = Gauge("tg_rate_limiter_ban_seconds", "How long a ban for flooding lasts.")
+        ban_seconds.set(self.ban_duration.total_seconds())
+        for metric in (threshold, window, ban_factor, ban_seconds):
+            metrics.register(metric)
+
+    def __len__(self: Self) -> int:
+        """Return the number of windows kept."""
+        return len(self._windows)
+
+    async def allow(self: Self, sender_id: int | None, command: str) -> bool:
+        """Count a command of ``sender_id`` and check whether it may run, banning flooding users.
+
+        Commands without a sender, posted in channels or by anonymous group admins, aren't limited: they'd all
+        share one window and a ban would apply to none of them.
+
+        Args:
+            sender_id: Telegram ID of the sender, None when the sender is hidden.
+            command: Name of the command.
+
+        Returns
+        -------
+            Whether the command may run
+        """
+        if sender_id is None:
+            self.stats.allowed += 1
+            return True
+        now = self.clock()
+        limit = self.limits.get(command) or self.limits[DEFAULT]
+        key = (sender_id, command)
+        window = self._windows.get(key)
+        if window is None:
+            window = self._windows[key] = _Window(now)
+            self._evict(now)
+        else:
+            self._windows.move_to_end(key)
+        rate = window.hit(now, limit.window)
+
+        if rate <= limit.limit:
+            self.stats.allowed += 1
+            return True
+        self.stats.limited += 1
+        self.stats.limited_by_command[command] = self.stats.limited_by_command.get(command, 0) + 1
+        if rate >= limit.limit * self.ban_factor:
+            await self.ban(sender_id)
+            # Start over once the ban is lifted
+            del self._windows[key]
+        return False
+
+    async def ban(self: Self, telegram_id: int) -> None:
+        """Move ``telegram_id`` to ``TEMP_BANNED`` for ``ban_duration``.
+
+        Args:
+            telegram_id: Telegram ID of the user.
+        """
+        until = timezone.now() + self.ban_duration
+        if self.gate is not None:
+            self.gate.gate(telegram_id, until)
+        await User.objects.filter(telegram_id=telegram_id).aupdate(
+            status=UserStatus.TEMP_BANNED.value,
+            banned_until=until,
+        )
+        self.stats.banned += 1
+        logger.info(f"User {telegram_id} flooded commands and is banned until {until:%Y-%m-%d %H:%M:%S}")
+
+    def _evict(self: Self, now: float) -> None:
+        """Drop the windows idle for too long, oldest first, and the oldest ones beyond ``max_keys``."""
+        while self._windows:
+            key, window = next(iter(self._windows.items()))
+            if len(self._windows) <= self.max_keys and now - window.start < self.idle_after:
+                break
+            del self._windows[key]
+            self.stats.evicted += 1
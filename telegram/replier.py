@@ -1,38 +1,82 @@
 """Reply to messages."""
 
+import asyncio
+import functools
+import signal
 import sys
+import threading
 
 from environs import Env
 from loguru import logger
 from telethon import TelegramClient
 
-# Import command modules to trigger registration
-# These imports trigger the @CommandRegistry.register decorators
-import telegram.commands.help
-import telegram.commands.start  # noqa: F401
-from telegram.commands.base import CommandRegistry
-from telegram.utils import CustomMarkdown
+from sqlitedb.models import User, user_cache
+from sqlitedb.sqlite import SQLiteDatabase
+from telegram.activity import ActivityTracker
+from telegram.commands.base import BaseCommand, CommandRegistry
+from telegram.dispatcher import UpdateDispatcher
+from telegram.gate import StatusGate
+from telegram.jobs import JobWorker
+from telegram.metrics import MetricsServer, process_queries, registry
+from telegram.outbound import Outbox
+from telegram.pagination import Paginator
+from telegram.profiling import Profiler
+from telegram.ratelimit import RateLimiter
+from telegram.utils import CustomMarkdown, entity_stats
+from telegram.workers import WorkerPool
 
 
 class Telegram(object):
     """A class representing a Telegram bot."""
 
-    def __init__(self, session_file: str, env: Env) -> None:
+    def __init__(self, session_file: str, env: Env, client: TelegramClient | None = None) -> None:
         """Create a new Telegram object and connect to the Telegram API using the given session file.
 
         Args:
             session_file: The path to the session file to use for connecting to the Telegram API.
             env: Environment configuration object.
+            client: An already connected client, e.g. a local stand-in for load tests, used instead of connecting.
         """
         self.env = env
+        self._tasks: list[asyncio.Task[None]] = []
+        self._drained = False
+
+        # Hot user queries run on a native async driver when ASYNC_DB is set
+        self.database = SQLiteDatabase()
+
+        # Updates are ordered per chat by the dispatcher, so the client can hand them over concurrently
+        BaseCommand.dispatcher = UpdateDispatcher.from_env(env)
+        # Replies are queued and paced to stay within Telegram's flood limits
+        BaseCommand.outbox = Outbox.from_env(env)
+        # Updates of suspended and banned users are dropped before any handler runs
+        self.gate = StatusGate.from_env(env)
+        BaseCommand.router.gate = self.gate
+        Paginator.gate = self.gate
+        # Users flooding commands are throttled, then banned through the gate
+        BaseCommand.limiter = RateLimiter.from_env(env, self.gate)
+        # Activity is buffered in memory and written in batches
+        self.activity = ActivityTracker.from_env(env)
+        BaseCommand.activity = self.activity
 
         # Create a new TelegramClient instance with the given session file and API credentials
-        self.client: TelegramClient = TelegramClient(
+        self.client: TelegramClient = client or TelegramClient(
             session_file,
             env.int("API_ID"),
             env.str("API_HASH"),
-            sequential_updates=True,
+            sequential_updates=False,
         )
+        # Slow work enqueued by the commands runs in background workers
+        self.jobs = JobWorker.from_env(self.client, BaseCommand.outbox, env)
+        BaseCommand.jobs = self.jobs
+        # A sample of the updates is profiled when PROFILE_SAMPLE_RATE is set
+        BaseCommand.profiler = Profiler.from_env(env)
+        # Commands are handled in WORKERS processes when it's set, this process only receives and sends
+        self.pool = WorkerPool.from_env(self.client, BaseCommand.outbox, self.gate, env)
+        # Counters of every component, served on METRICS_PORT when it's set
+        self.metrics = MetricsServer.from_env(env)
+        self.register_metrics()
+        if client is not None:
+            return
         # Connect to the Telegram API using bot authentication
         logger.debug("Trying to connect using bot token")
         self.client.start(bot_token=env.str("BOT_TOKEN"))
@@ -45,20 +89,153 @@ class Telegram(object):
             logger.info("Unable to connect with Telegram exiting.")
             sys.exit(1)
 
+    def register_metrics(self) -> None:
+        """Expose the stats of the bot's components in the metrics registry."""
+        components = {
+            "dispatcher": BaseCommand.dispatcher,
+            "outbox": BaseCommand.outbox,
+            "gate": self.gate,
+            "rate_limiter": BaseCommand.limiter,
+            "activity": self.activity,
+            "jobs": self.jobs,
+            "workers": self.pool,
+        }
+        for prefix, component in components.items():
+            if component is not None:
+                registry.add_stats(prefix, component.stats)
+        if BaseCommand.limiter is not None:
+            BaseCommand.limiter.export(registry)
+        registry.add_stats("user_cache", user_cache.stats)
+        registry.add_stats("user_cache_local", user_cache.local.stats)
+        registry.add_stats("user_loads", User.objects.user_flight.stats)
+        registry.add_stats("entities", entity_stats)
+        registry.add_stats("db_queries", process_queries)
+        registry.add_gauge("gated_users", "Users whose updates are dropped.", lambda: len(self.gate))
+        registry.add_gauge("activity_pending", "Users with unflushed activity.", lambda: self.activity.pending)
+
+    def register_handlers(self) -> None:
+        """Register the handlers of every command in the registry on the client.
+
+        Command modules are only imported when their command is first used.
+        """
+        if self.pool is None:
+            commands = CommandRegistry.route_lazily(self.env, self.client)
+            Paginator.loader = functools.partial(CommandRegistry.load, env=self.env, client=self.client)
+        else:
+            # The workers run the handlers, commands are only created here for the page buttons of their lists
+            commands = CommandRegistry.discover()
+            self.pool.attach(self.client)
+            Paginator.loader = functools.partial(CommandRegistry.load, env=self.env)
+        logger.info(f"Registering {len(commands)} commands: {commands}")
+
+        # Page buttons of listing commands edit their message in place
+        Paginator.attach(self.client)
+
+    async def start(self) -> None:
+        """Start the background services the handlers rely on."""
+        if self.metrics is not None:
+            await self.metrics.start()
+        # Load the gated users before the first update is handled, then keep them current
+        await self.gate.load()
+        self._tasks.append(asyncio.create_task(self.gate.run()))
+        # Flush buffered activity in the background
+        self._tasks.append(asyncio.create_task(self.activity.run()))
+        # Run slow work enqueued by the commands
+        self._tasks.append(asyncio.create_task(self.jobs.run()))
+        if self.pool is not None:
+            await self.pool.start()
+        # Changed command modules are reloaded in place when run by watcher.py
+        if self.env.bool("HOT_RELOAD", False):
+            self.watch_reloads()
+
+    def watch_reloads(self) -> None:
+        """Reload the command modules named on standard input, one batch of names per line."""
+        loop = asyncio.get_running_loop()
+
+        def read() -> None:
+            for line in sys.stdin:
+                if modules := line.split():
+                    loop.call_soon_threadsafe(self.reload_commands, modules)
+
+        threading.Thread(target=read, name="reloads", daemon=True).start()
+        logger.info("Reloading command modules named on standard input")
+
+    def reload_commands(self, modules: list[str]) -> None:
+        """Re-import changed command modules and route their messages to the new code.
+
+        Args:
+            modules: Names of the changed command modules.
+        """
+        for module in modules:
+            try:
+                # In worker mode the commands only serve the page buttons here
+                names = CommandRegistry.reload(module, self.env, self.client if self.pool is None else None)
+            except Exception:  # noqa: BLE001
+                logger.exception(f"Reloading {module} failed, its previous commands stay")
+                continue
+            logger.info(f"Reloaded {module}: {', '.join(f'/{name}' for name in names) or 'no commands'}")
+        if self.pool is not None:
+            # The workers import the new code when they're replaced
+            self.pool.recycle()
+
+    async def drain(self) -> None:
+        """Finish the updates already received and send every queued message, once.
+
+        Run while the client is still connected, otherwise the replies are lost.
+        """
+        if self._drained:
+            return
+        self._drained = True
+        # Interrupted broadcasts resume after their last checkpoint
+        for task in BaseCommand.background:
+            task.cancel()
+        await asyncio.gather(*BaseCommand.background, return_exceptions=True)
+        # Let the workers finish their updates and write their activity
+        if self.pool is not None:
+            await self.pool.close()
+        # Handle the updates still queued in the shards
+        if BaseCommand.dispatcher is not None:
+            await BaseCommand.dispatcher.close()
+        # Running jobs are picked up again once their visibility timeout lapses
+        await self.jobs.close()
+        # Send the replies and results queued by all of the above
+        if BaseCommand.outbox is not None:
+            await BaseCommand.outbox.close()
+
+    async def shutdown(self) -> None:
+        """Drain the bot, then disconnect, which ends :meth:`bot_listener`."""
+        logger.info("Shutting down, finishing the updates received and sending the queued messages")
+        await self.drain()
+        await self.client.disconnect()
+
+    async def stop(self) -> None:
+        """Stop the background services, writing what they still buffer."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+        # Already done by shutdown unless the connection was lost
+        await self.drain()
+        # Write the activity still buffered
+        await self.activity.flush()
+        await self.database.close()
+        if self.metrics is not None:
+            await self.metrics.close()
+
     def bot_listener(self) -> None:
         """Listen for incoming bot messages and handle them based on the command."""
-        # Automatically register all commands from the registry
-        commands = CommandRegistry.get_all_commands()
-        logger.info(f"Registering {len(commands)} commands: {list(commands.keys())}")
-
-        for command_name, command_class in commands.items():
-            # Instantiate each command with env and register its handler
-            command_instance = command_class(self.env)
-            command_instance.add_handler(self.client)
-            logger.debug(f"Registered handler for /{command_name}")
+        self.register_handlers()
+        loop = self.client.loop
+        loop.run_until_complete(self.start())
+        # Drain before disconnecting, Telethon would disconnect right away
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, lambda: self._tasks.append(loop.create_task(self.shutdown())))
 
         # Start listening for incoming bot messages
-        self.client.run_until_disconnected()
+        try:
+            self.client.run_until_disconnected()
+        finally:
+            self.client.loop.run_until_complete(self.stop())
 
         # Log a message when the bot stops running
         logger.info("Stopped!")
@@ -2,3 +2,9 @@
 
 command_not_found = "Command not found. Must've gone on vacation! 🏖️ Try another one!"
 docs_not_found = "Docs not found. Must've gone on vacation! 🏖️ Try another one!"
+admin_only = "Nice try! 🕵️ This command is for admins only."
+broadcast_started = "Broadcast #{id} started. I'll report back once it's done. 📣"
+broadcast_nothing_to_resume = "No interrupted broadcast to resume. All caught up! ✅"
+broadcast_already_running = "Broadcast #{id} is already running. Patience, young padawan. ⏳"
+broadcast_unknown_user_types = "Unknown user type {unknown}. Pick from {valid}. 🤔"
+job_failed = "Sorry, something went wrong while working on that. Gremlins in the machine! 🔧"
@@ -1,37 +1,91 @@
 """Utility functions."""
 
+import re
+from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
+from itertools import chain, zip_longest
+from string import Formatter
 from typing import Any, Self
 
 from loguru import logger
-from telethon import events, types
+from telethon import events, helpers, types
 from telethon.extensions import markdown
+from telethon.tl.types import TypeMessageEntity
 from telethon.tl.types import User as TelegramUser
 
-from sqlitedb.models import User
+from sqlitedb.cache import LRUCache
+from sqlitedb.models import User, UserSnapshot
+from telegram.profiling import stage
 
 # Number of records per page
 PAGE_SIZE = 10
 
+# Number of chat entities kept by get_telegram_user, and for how many seconds
+ENTITY_CACHE_SIZE = 10_000
+ENTITY_CACHE_TTL = 600
+
+
+# Splits markdown delimiters in text that must show as is, see escape_markdown
+_ZERO_WIDTH_SPACE = "\u200b"
+_DELIMITER_RUNS = re.compile(r"([*_~])(?=\1)")
+
+# Number of distinct texts whose parsed form is kept by CustomMarkdown.parse
+PARSE_CACHE_SIZE = 1024
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_markdown(text: str) -> tuple[str, tuple[TypeMessageEntity, ...]]:
+    """Parse markdown, then turn spoiler and custom emoji links into their own entities."""
+    text, entities = markdown.parse(text)
+    for i, e in enumerate(entities):
+        if isinstance(e, types.MessageEntityTextUrl):
+            if e.url == "spoiler":
+                entities[i] = types.MessageEntitySpoiler(e.offset, e.length)
+            elif e.url.startswith("emoji/"):
+                entities[i] = types.MessageEntityCustomEmoji(
+                    e.offset,
+                    e.length,
+                    int(e.url.split("/")[1]),
+                )
+    return text, tuple(entities)
+
+
+def escape_markdown(text: str) -> str:
+    """Keep ``text``, e.g. a user's name, from being parsed as markdown once formatted into a message.
+
+    Telethon's markdown has no escape character: a zero-width space splits repeated delimiter characters and
+    link brackets from their URL, and backticks are replaced by a look-alike.
+    """
+    text = _DELIMITER_RUNS.sub(f"\\1{_ZERO_WIDTH_SPACE}", text)
+    return text.replace("]", f"]{_ZERO_WIDTH_SPACE}").replace("`", "\u02cb")
+
+
+def _copy_entity(entity: TypeMessageEntity) -> TypeMessageEntity:
+    """Shallow copy an entity, several times faster than ``copy.copy`` for these plain TL objects."""
+    clone = object.__new__(entity.__class__)
+    clone.__dict__.update(entity.__dict__)
+    return clone
+
+
+def _utf16_len(text: str) -> int:
+    """Return the length of ``text`` in UTF-16 code units, the unit of entity offsets."""
+    return len(text.encode("utf-16-le")) // 2
+
 
 class CustomMarkdown:
     """Custom Markdown parser."""
 
     @staticmethod
     def parse(text: str) -> Any:
-        """Parse."""
-        text, entities = markdown.parse(text)
-        for i, e in enumerate(entities):
-            if isinstance(e, types.MessageEntityTextUrl):
-                if e.url == "spoiler":
-                    entities[i] = types.MessageEntitySpoiler(e.offset, e.length)
-                elif e.url.startswith("emoji/"):
-                    entities[i] = types.MessageEntityCustomEmoji(
-                        e.offset,
-                        e.length,
-                        int(e.url.split("/")[1]),
-                    )
-        return text, entities
+        """Parse.
+
+        Most replies are the same few texts, so parsed texts are memoized. Callers get their own copies of the
+        entities because Telethon adjusts them in place while sending.
+        """
+        with stage("markdown"):
+            text, entities = _parse_markdown(text)
+            return text, [_copy_entity(e) for e in entities]
 
     @staticmethod
     def unparse(text: str, entities: Any) -> Any:
@@ -48,12 +102,81 @@ class CustomMarkdown:
         return markdown.unparse(text, entities)
 
 
+# First private use code point, the fields of a MarkdownTemplate are parsed as U+E000, U+E001, ...
+_PLACEHOLDER = 0xE000
+
+
+class MarkdownTemplate:
+    """Markdown template parsed once and rendered by only shifting entity offsets.
+
+    The template uses ``str.format`` fields, e.g. ``"Hii👋, **{name}**"``. Every field is parsed as a
+    placeholder character, so rendering only has to splice the values into the text and move the entities
+    behind (or around) each field. Values are inserted as plain text and are never interpreted as markdown.
+    """
+
+    def __init__(self, template: str) -> None:
+        """Parse the static parts of the template.
+
+        Args:
+            template: Markdown text with ``{field}`` placeholders.
+        """
+        literals: list[str] = []
+        self.fields: list[str] = []
+        for literal, field_name, _, _ in Formatter().parse(template):
+            literals.append(literal)
+            if field_name is not None:
+                self.fields.append(field_name)
+        placeholders = [chr(_PLACEHOLDER + i) for i in range(len(self.fields))]
+        marked = "".join(chain.from_iterable(zip_longest(literals, placeholders, fillvalue="")))
+        text, self._entities = _parse_markdown(marked)
+        # Split the parsed text at the placeholders and record their UTF-16 offsets, which entities use
+        self._parts = re.split(f"[{''.join(placeholders)}]", text) if placeholders else [text]
+        self._offsets: list[int] = []
+        offset = 0
+        for part in self._parts[:-1]:
+            offset += _utf16_len(part)
+            self._offsets.append(offset)
+            offset += 1
+
+    def render(self, **values: Any) -> tuple[str, list[TypeMessageEntity]]:
+        """Fill in the fields.
+
+        Args:
+            **values: Value of every field.
+
+        Returns
+        -------
+            The text and its entities, to be sent with ``formatting_entities``
+        """
+        with stage("markdown"):
+            rendered = [str(values[name]) for name in self.fields]
+            text = "".join(chain.from_iterable(zip_longest(self._parts, rendered, fillvalue="")))
+            # Each field grows from one placeholder unit to the UTF-16 length of its value
+            growth = [_utf16_len(value) - 1 for value in rendered]
+            entities = []
+            shifts = list(zip(self._offsets, growth, strict=True))
+            for e in self._entities:
+                end = e.offset + e.length
+                entity = _copy_entity(e)
+                entity.offset += sum(g for offset, g in shifts if offset < e.offset)
+                entity.length += sum(g for offset, g in shifts if e.offset <= offset < end)
+                # An entity wrapping nothing but empty values would be rejected by Telegram
+                if entity.length:
+                    entities.append(entity)
+            if text[:1].isspace() or text[-1:].isspace():
+                # Values at the ends of the text can add whitespace, which parsing strips as well
+                text = helpers.del_surrogate(helpers.strip_text(helpers.add_surrogate(text), entities))
+            return text, entities
+
+
 # Define a list of supported commands
 class SupportedCommands(Enum):
     """Enum for supported commands."""
 
     START = "/start"
     HELP = "/help"
+    BROADCAST = "/broadcast"
+    USERS = "/users"
 
     @classmethod
     def get_values(cls) -> list[str]:
@@ -75,9 +198,33 @@ class SupportedCommands(Enum):
         return self.value
 
 
+@dataclass
+class EntityResolutionStats:
+    """Counters describing where :func:`get_telegram_user` found entities.
+
+    Attributes
+    ----------
+        from_update (int): Entities carried by the update itself.
+        cache_hits (int): Entities served from the shared entity cache.
+        rpc_calls (int): Entities that needed a request to Telegram.
+    """
+
+    from_update: int = 0
+    cache_hits: int = 0
+    rpc_calls: int = 0
+
+
+# Entities of recently seen chats, shared by all handlers so updates without entities don't cost a request
+entity_cache: LRUCache[int, Any] = LRUCache(maxsize=ENTITY_CACHE_SIZE, ttl=ENTITY_CACHE_TTL)
+entity_stats = EntityResolutionStats()
+
+
 async def get_telegram_user(event: events.NewMessage.Event) -> TelegramUser:
     """Get the user associated with a message event in Telegram.
 
+    The entity is taken from the update when Telegram included it, then from the shared entity cache, and
+    only requested from Telegram on a true miss.
+
     Args:
         event (events.NewMessage.Event): The message event.
 
@@ -85,12 +232,24 @@ async def get_telegram_user(event: events.NewMessage.Event) -> TelegramUser:
     -------
         User: The User entity associated with the message event.
     """
-    try:
-        # Get the user entity from the peer ID of the message event, Uses cache
-        user: TelegramUser = await event.client.get_entity(event.peer_id)
-    except (ValueError, AttributeError):
-        logger.debug("Couldn't get user from cache. Invalid Peer ID")
-        user = await event.get_sender()
+    chat_id: int = event.chat_id
+    user: TelegramUser | None = event.chat
+    if user is not None:
+        entity_stats.from_update += 1
+    else:
+        user = entity_cache.get(chat_id)
+        if user is not None:
+            entity_stats.cache_hits += 1
+            return user
+        entity_stats.rpc_calls += 1
+        with stage("get_entity"):
+            try:
+                # Get the user entity from the peer ID of the message event
+                user = await event.client.get_entity(event.peer_id)
+            except (ValueError, AttributeError):
+                logger.debug("Couldn't get user from cache. Invalid Peer ID")
+                user = await event.get_sender()
+    entity_cache.set(chat_id, user)
     return user
 
 
@@ -133,7 +292,8 @@ class UserSettings(Enum):
         return self._description_
 
 
-async def get_user(event: events.NewMessage.Event) -> User:
+async def get_user(event: events.NewMessage.Event) -> UserSnapshot:
     """Get out user from telegram user."""
     telegram_user: TelegramUser = await get_telegram_user(event)
-    return await User.objects.get_user(telegram_user=telegram_user)
+    with stage("get_user"):
+        return await User.objects.get_user(telegram_user=telegram_user)
@@ -0,0 +1,626 @@
+"""Run the command handlers in worker processes behind the single process receiving the updates."""
+
+import asyncio
+import contextlib
+import itertools
+import multiprocessing
+import pickle
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Self
+
+from environs import Env
+from loguru import logger
+from telethon import TelegramClient, events
+
+from sqlitedb.sqlite import SQLiteDatabase
+from telegram.activity import ActivityTracker
+from telegram.commands.base import BaseCommand, CommandRegistry
+from telegram.commands.router import CommandRouter
+from telegram.dispatcher import UpdateDispatcher
+from telegram.gate import StatusGate
+from telegram.outbound import Outbox
+from telegram.profiling import Profiler
+from telegram.ratelimit import RateLimiter
+
+if TYPE_CHECKING:
+    from multiprocessing.context import SpawnProcess
+    from multiprocessing.queues import Queue
+
+# Client methods the workers may call on the receiver's client
+REMOTE_METHODS = frozenset(("send_message", "get_entity", "get_input_entity", "get_me"))
+
+
+@dataclass
+class ForwardedUpdate:
+    """The parts of a new message the handlers use, small enough to send to a worker.
+
+    Attributes
+    ----------
+        id (int): ID of the message.
+        chat_id (int): Marked ID of the chat.
+        sender_id (int): ID of the sender.
+        text (str): Raw text of the message.
+        chat (Any): Entity of the chat, if Telegram included it.
+        sender (Any): Entity of the sender, if Telegram included it.
+        input_chat (Any): Input peer of the chat, used to reply.
+        peer_id (Any): Peer of the chat.
+    """
+
+    id: int
+    chat_id: int
+    sender_id: int
+    text: str
+    chat: Any = None
+    sender: Any = None
+    input_chat: Any = None
+    peer_id: Any = None
+
+    @classmethod
+    def from_event(cls, event: events.NewMessage.Event) -> "ForwardedUpdate":
+        """Extract the update from a new message event."""
+        return cls(
+            event.id,
+            event.chat_id,
+            event.sender_id,
+            event.raw_text,
+            event.chat,
+            event.sender,
+            event.input_chat,
+            event.peer_id,
+        )
+
+
+@dataclass
+class WorkerPoolStats:
+    """Counters describing the worker pool.
+
+    Attributes
+    ----------
+        forwarded (int): Updates sent to a worker.
+        acked (int): Updates whose worker finished with them.
+        requeued (int): Updates sent again after their worker died.
+        restarts (int): Workers restarted after dying.
+        remote_calls (int): Client calls run on behalf of the workers.
+        pending (int): Updates sent to a worker and not acknowledged yet.
+    """
+
+    forwarded: int = 0
+    acked: int = 0
+    requeued: int = 0
+    restarts: int = 0
+    remote_calls: int = 0
+    pending: int = 0
+
+
+def _portable(value: Any) -> Any:
+    """Return ``value`` in a form that can be sent back to a worker."""
+    # Sent messages hold the client, the workers only need to know which message it was
+    return value.id if hasattr(value, "_client") else value
+
+
+def _portable_error(error: BaseException) -> BaseException:
+    """Return ``error``, or a plain copy of it if it can't be pickled."""
+    try:
+        pickle.dumps(error)
+    except Exception:  # noqa: BLE001
+        return RuntimeError(repr(error))
+    return error
+
+
+class _Slot:
+    """One worker process, its queues and the updates it hasn't acknowledged."""
+
+    def __init__(self: Self, index: int, max_in_flight: int) -> None:
+        self.index = index
+        self.generation = 0
+        self.process: SpawnProcess | None = None
+        self.inbound: Queue[Any] | None = None
+        self.outbound: Queue[Any] | None = None
+        self.reader: threading.Thread | None = None
+        self.in_flight: dict[int, ForwardedUpdate] = {}
+        self.capacity = asyncio.Semaphore(max_in_flight)
+
+
+class WorkerPool:
+    """Forward command messages to ``workers`` processes running the handlers, by chat.
+
+    The process owning the Telegram connection only decodes updates, drops the ones of gated users and
+    non-commands, and sends the rest to the worker chosen by hashing their chat, so the messages of a chat
+    are handled in order by one worker. Workers call the client through the receiver: replies go through the
+    receiver's outbox, which keeps the flood limits of the whole bot. A worker acknowledges every update once
+    it's done with it. When a worker dies it's restarted and its unacknowledged updates are sent to the new
+    process in their original order, so none is lost, though one that was being handled may run twice.
+    Callback queries and background jobs stay in the receiver. Every worker has its own rate limiter and
+    activity buffer, and tells the receiver's gate about the users it bans.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self: Self,
+        client: TelegramClient,
+        outbox: Outbox,
+        gate: StatusGate | None = None,
+        workers: int = 2,
+        max_in_flight: int = 1000,
+        *,
+        check_interval: float = 1,
+        stop_seconds: float = 10,
+    ) -> None:
+        """Create the pool. The processes are spawned by :meth:`start`.
+
+        Args:
+            client: The connected client receiving the updates.
+            outbox: Outbound queue the replies of the workers go through.
+            gate: Drops updates of suspended and banned users before they're forwarded.
+            workers: Number of worker processes.
+            max_in_flight: Unacknowledged updates per worker before forwarding waits.
+            check_interval: Seconds between checks for dead workers.
+            stop_seconds: Seconds the workers get to finish their updates when the pool is closed.
+        """
+        self.client = client
+        self.outbox = outbox
+        self.gate = gate
+        self.check_interval = check_interval
+        self.stop_seconds = stop_seconds
+        self._context = multiprocessing.get_context("spawn")
+        self._slots = [_Slot(index, max_in_flight) for index in range(workers)]
+        self._ids = itertools.count(1)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._monitor: asyncio.Task[None] | None = None
+        self._commands: frozenset[str] = frozenset()
+        # Set while every forwarded update was acknowledged
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.stats = WorkerPoolStats()
+
+    @classmethod
+    def from_env(
+        cls,
+        client: TelegramClient,
+        outbox: Outbox,
+        gate: StatusGate | None,
+        env: Env,
+    ) -> "WorkerPool | None":
+        """Create a pool of ``WORKERS`` processes, None unless there are at least two.
+
+        Args:
+            client: The connected client receiving the updates.
+            outbox: Outbound queue the replies of the workers go through.
+            gate: Drops updates of suspended and banned users.
+            env: Environment configuration object.
+
+        Returns
+        -------
+            The configured pool or None
+        """
+        workers = env.int("WORKERS", 1)
+        if workers < 2:  # noqa: PLR2004
+            return None
+        return cls(client, outbox, gate, workers, max_in_flight=env.int("WORKER_MAX_IN_FLIGHT", 1000))
+
+    def __len__(self: Self) -> int:
+        """Return the number of worker processes."""
+        return len(self._slots)
+
+    def attach(self: Self, client: TelegramClient) -> None:
+        """Forward the command messages of ``client`` to the workers.
+
+        Args:
+            client: The Telegram client instance
+        """
+        self._commands = frozenset(CommandRegistry.get_names())
+        client.add_event_handler(self.forward, events.NewMessage(incoming=True))
+
+    async def start(self: Self) -> None:
+        """Spawn the workers and start watching them."""
+        self._loop = asyncio.get_running_loop()
+        for slot in self._slots:
+            self._spawn(slot)
+        self._monitor = asyncio.create_task(self._watch())
+        logger.info(f"Handling commands in {len(self)} worker processes")
+
+    def _spawn(self: Self, slot: _Slot) -> None:
+        """Start the process of ``slot`` with fresh queues, a dead process may have left them unusable."""
+        slot.generation += 1
+        slot.inbound, slot.outbound = self._context.Queue(), self._context.Queue()
+        slot.process = self._context.Process(
+            target=run_worker,
+            args=(slot.index, slot.inbound, slot.outbound),
+            name=f"worker-{slot.index}",
+            daemon=True,
+        )
+        slot.process.start()
+        slot.reader = threading.Thread(
+            target=self._read,
+            args=(slot, slot.generation, slot.outbound),
+            name=f"worker-{slot.index}-reader",
+            daemon=True,
+        )
+        slot.reader.start()
+
+    def _read(self: Self, slot: _Slot, generation: int, outbound: "Queue[Any]") -> None:
+        """Hand the messages of one worker process to the event loop, until it's replaced or stopped."""
+        while True:
+            try:
+                message = outbound.get()
+            except (EOFError, OSError):
+                return
+            if message is None or self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._receive, slot, generation, message)
+
+    async def forward(self: Self, event: events.NewMessage.Event) -> None:
+        """Send a command message to the worker of its chat.
+
+        Args:
+            event: A new message event.
+        """
+        if self.gate is not None and not self.gate.allows(event):
+            return
+        parsed = CommandRouter.parse(event.raw_text)
+        if parsed is None or parsed.name not in self._commands:
+            return
+        slot = self._slots[hash(event.chat_id) % len(self._slots)]
+        await slot.capacity.acquire()
+        update_id = next(self._ids)
+        update = ForwardedUpdate.from_event(event)
+        slot.in_flight[update_id] = update
+        self.stats.forwarded += 1
+        self.stats.pending += 1
+        self._idle.clear()
+        if slot.inbound is not None:
+            slot.inbound.put(("update", update_id, update))
+
+    def _receive(self: Self, slot: _Slot, generation: int, message: tuple[Any, ...]) -> None:
+        """Handle an acknowledgement or a client call of a worker."""
+        kind, *payload = message
+        if generation != slot.generation and kind != "ack":
+            # Sent by a process that was replaced since, update IDs are unique so its acknowledgements still count
+            return
+        if kind == "ack":
+            (update_id,) = payload
+            if slot.in_flight.pop(update_id, None) is not None:
+                slot.capacity.release()
+                self.stats.acked += 1
+                self.stats.pending -= 1
+                if not self.stats.pending:
+                    self._idle.set()
+        elif kind == "gate":
+            telegram_id, until = payload
+            if self.gate is not None:
+                self.gate.gate(telegram_id, until)
+        elif kind == "ready":
+            logger.debug(f"Worker {slot.index} ready")
+        elif kind == "call":
+            call_id, method, args, kwargs = payload
+            self.stats.remote_calls += 1
+            task = asyncio.create_task(self._call(method, args, kwargs))
+            task.add_done_callback(lambda done: self._answer(slot, generation, call_id, done))
+        elif kind == "send":
+            call_id, chat_id, text, kwargs = payload
+            self.stats.remote_calls += 1
+            future = self.outbox.send(self.client, chat_id, text, **kwargs)
+            future.add_done_callback(lambda done: self._answer(slot, generation, call_id, done))
+
+    async def _call(self: Self, method: str, args: tuple[Any, ...], kwargs: dict[str, Any]) -> Any:
+        """Run a client method on behalf of a worker."""
+        if method not in REMOTE_METHODS:
+            msg = f"Workers can't call {method}"
+            raise AttributeError(msg)
+        return await getattr(self.client, method)(*args, **kwargs)
+
+    def _answer(self: Self, slot: _Slot, generation: int, call_id: int, done: "asyncio.Future[Any]") -> None:
+        """Send the outcome of a client call back to the worker that made it, if it's still alive."""
+        if generation != slot.generation or slot.inbound is None:
+            return
+        answer: tuple[str, int, bool, Any]
+        if done.cancelled():
+            answer = ("result", call_id, False, RuntimeError("Cancelled"))
+        elif (error := done.exception()) is not None:
+            answer = ("result", call_id, False, _portable_error(error))
+        else:
+            answer = ("result", call_id, True, _portable(done.result()))
+        slot.inbound.put(answer)
+
+    async def _watch(self: Self) -> None:
+        """Restart dead workers and send them the updates their previous process didn't finish."""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            for slot in self._slots:
+                if slot.process is None or slot.process.is_alive():
+                    continue
+                if slot.process.exitcode:
+                    logger.error(
+                        f"Worker {slot.index} died with exit code {slot.process.exitcode}, restarting it with "
+                        f"{len(slot.in_flight)} unfinished updates",
+                    )
+                else:
+                    logger.info(f"Worker {slot.index} stopped, restarting it")
+                if slot.outbound is not None:
+                    # Stop the reader of the old process once it handed over what the process sent
+                    slot.outbound.put(None)
+                if slot.reader is not None:
+                    # The acknowledgements handed over run first, so the updates they finished aren't sent again
+                    await asyncio.to_thread(slot.reader.join, self.stop_seconds)
+                    await asyncio.sleep(0)
+                if slot.inbound is not None:
+                    # Nothing reads the updates left in its queue, don't wait for them to be flushed on exit
+                    slot.inbound.cancel_join_thread()
+                    slot.inbound.close()
+                self._spawn(slot)
+                self.stats.restarts += 1
+                for update_id, update in slot.in_flight.items():
+                    slot.inbound.put(("update", update_id, update))  # type: ignore[union-attr]
+                self.stats.requeued += len(slot.in_flight)
+
+    def recycle(self: Self) -> None:
+        """Replace every worker once it finished the updates it was sent, e.g. to run code changed on disk.
+
+        Updates forwarded meanwhile are sent to the new processes.
+        """
+        for slot in self._slots:
+            if slot.inbound is not None:
+                slot.inbound.put(None)
+
+    async def close(self: Self) -> None:
+        """Let the workers finish their updates for up to ``stop_seconds``, then stop them."""
+        if self._monitor is not None:
+            self._monitor.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._monitor
+        deadline = time.monotonic() + self.stop_seconds
+        try:
+            await asyncio.wait_for(self._idle.wait(), self.stop_seconds)
+        except TimeoutError:
+            logger.warning(f"Stopping the workers with {self.stats.pending} updates unfinished")
+        for slot in self._slots:
+            if slot.inbound is not None:
+                slot.inbound.put(None)
+        for slot in self._slots:
+            if slot.process is not None:
+                await asyncio.to_thread(slot.process.join, max(deadline - time.monotonic(), 1))
+                if slot.process.is_alive():
+                    slot.process.terminate()
+                    slot.inbound.cancel_join_thread()  # type: ignore[union-attr]
+            if slot.outbound is not None:
+                slot.outbound.put(None)
+
+
+class _Channel:
+    """Worker side of the queues to the receiver: client calls and their results."""
+
+    def __init__(self: Self, index: int, inbound: "Queue[Any]", outbound: "Queue[Any]") -> None:
+        self.index = index
+        self.inbound = inbound
+        self.outbound = outbound
+        self.updates: asyncio.Queue[tuple[int, ForwardedUpdate] | None] = asyncio.Queue()
+        self._calls: dict[int, asyncio.Future[Any]] = {}
+        self._ids = itertools.count(1)
+        self._loop = asyncio.get_running_loop()
+
+    def start(self: Self) -> None:
+        """Start reading the messages of the receiver."""
+        threading.Thread(target=self._read, name="receiver-reader", daemon=True).start()
+
+    def _read(self: Self) -> None:
+        # Keeps reading after the stop message, the results of the last sends still have to come in
+        while True:
+            self._loop.call_soon_threadsafe(self._receive, self.inbound.get())
+
+    def _receive(self: Self, message: tuple[Any, ...] | None) -> None:
+        if message is None:
+            self.updates.put_nowait(None)
+            return
+        kind, *payload = message
+        if kind == "update":
+            update_id, update = payload
+            self.updates.put_nowait((update_id, update))
+        elif kind == "result":
+            call_id, ok, value = payload
+            future = self._calls.pop(call_id, None)
+            if future is None or future.done():
+                return
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def request(self: Self, kind: str, *payload: Any) -> "asyncio.Future[Any]":
+        """Send a request to the receiver and return the future of its result."""
+        call_id = next(self._ids)
+        future = self._loop.create_future()
+        self._calls[call_id] = future
+        self.outbound.put((kind, call_id, *payload))
+        return future
+
+    def notify(self: Self, kind: str, *payload: Any) -> None:
+        """Send a message to the receiver that expects no answer, e.g. ``ack`` once done with an update."""
+        self.outbound.put((kind, *payload))
+
+
+class RemoteGate:
+    """Stand-in for the gate in a worker, telling the receiver's gate about bans."""
+
+    def __init__(self: Self, channel: _Channel) -> None:
+        self._channel = channel
+
+    def gate(self: Self, telegram_id: int, until: datetime | None = None) -> None:
+        """Drop the updates of ``telegram_id`` in the receiver, see :meth:`StatusGate.gate`."""
+        self._channel.notify("gate", telegram_id, until)
+
+
+class RemoteClient:
+    """Stand-in for the client in a worker, running its calls on the receiver's client."""
+
+    def __init__(self: Self, channel: _Channel) -> None:
+        self._channel = channel
+
+    async def call(self: Self, method: str, *args: Any, **kwargs: Any) -> Any:
+        """Run ``method`` of the receiver's client and return its result."""
+        return await self._channel.request("call", method, args, kwargs)
+
+    async def send_message(self: Self, entity: Any, message: Any = "", **kwargs: Any) -> Any:
+        """Send a message right away, returning its ID."""
+        return await self.call("send_message", entity, message, **kwargs)
+
+    async def get_entity(self: Self, entity: Any) -> Any:
+        """Return the entity of a peer."""
+        return await self.call("get_entity", entity)
+
+    async def get_input_entity(self: Self, entity: Any) -> Any:
+        """Return the input entity of a peer."""
+        return await self.call("get_input_entity", entity)
+
+    async def get_me(self: Self) -> Any:
+        """Return the bot's own user."""
+        return await self.call("get_me")
+
+    def add_event_handler(self: Self, callback: Callable[..., Any], event: Any = None) -> None:
+        """Ignore handler registrations, the worker feeds its updates to the router itself."""
+
+
+class RemoteOutbox(Outbox):
+    """Outbox of a worker, queueing its messages in the receiver's outbox."""
+
+    def __init__(self: Self, channel: _Channel) -> None:
+        """Create the outbox.
+
+        Args:
+            channel: Queues to the receiver.
+        """
+        super().__init__()
+        self._channel = channel
+        self._sending: set[asyncio.Future[Any]] = set()
+
+    def send(
+        self: Self,
+        client: Any,
+        chat_id: int,
+        message: Any,
+        entity: Any = None,
+        **kwargs: Any,
+    ) -> "asyncio.Future[Any]":
+        """Queue a message in the receiver's outbox, see :meth:`Outbox.send`."""
+        future = self._channel.request("send", chat_id, message, {"entity": entity, **kwargs})
+        self.stats.queued += 1
+        self._sending.add(future)
+        future.add_done_callback(self._sending.discard)
+        return future
+
+    @property
+    def pending(self: Self) -> int:
+        """Return the number of messages not sent yet."""
+        return len(self._sending)
+
+    async def close(self: Self) -> None:
+        """Wait until every queued message was sent or failed."""
+        await asyncio.gather(*self._sending, return_exceptions=True)
+
+
+class RemoteEvent:
+    """New message event rebuilt in a worker from a :class:`ForwardedUpdate`."""
+
+    def __init__(self: Self, client: RemoteClient, update: ForwardedUpdate) -> None:
+        self.client = client
+        self.id = update.id
+        self.chat_id = update.chat_id
+        self.sender_id = update.sender_id
+        self.raw_text = self.text = update.text
+        self.chat = update.chat
+        self.sender = update.sender
+        self.input_chat = update.input_chat
+        self.peer_id = update.peer_id
+        self.pattern_match: Any = None
+
+    async def get_sender(self: Self) -> Any:
+        """Return the sender, from the receiver if the update didn't include it."""
+        if self.sender is None:
+            self.sender = await self.client.get_entity(self.sender_id)
+        return self.sender
+
+    async def get_chat(self: Self) -> Any:
+        """Return the chat, from the receiver if the update didn't include it."""
+        if self.chat is None:
+            self.chat = await self.client.get_entity(self.peer_id)
+        return self.chat
+
+    async def reply(self: Self, message: Any, **kwargs: Any) -> Any:
+        """Reply to the message right away."""
+        return await self.client.send_message(self.input_chat or self.chat_id, message, reply_to=self.id, **kwargs)
+
+
+class Worker:
+    """The handlers of one worker process, fed by the receiver."""
+
+    def __init__(self: Self, index: int, channel: _Channel, env: Env) -> None:
+        """Set up the handlers and the services they use.
+
+        Args:
+            index: Number of the worker.
+            channel: Queues to the receiver.
+            env: Environment configuration object.
+        """
+        self.index = index
+        self.channel = channel
+        self.client = RemoteClient(channel)
+        # Hot user queries run on a native async driver when ASYNC_DB is set, like in the receiver
+        self.database = SQLiteDatabase()
+        # Updates are ordered per chat here, each one is handled inline and acknowledged once done
+        self.dispatcher = UpdateDispatcher.from_env(env)
+        BaseCommand.dispatcher = None
+        BaseCommand.outbox = RemoteOutbox(channel)
+        BaseCommand.limiter = RateLimiter.from_env(env, RemoteGate(channel))  # type: ignore[arg-type]
+        self.activity = ActivityTracker.from_env(env)
+        BaseCommand.activity = self.activity
+        BaseCommand.profiler = Profiler.from_env(env)
+        CommandRegistry.route_lazily(env, self.client)
+
+    async def _handle(self: Self, item: tuple[int, RemoteEvent]) -> None:
+        """Handle one update and acknowledge it, whatever happened."""
+        update_id, event = item
+        try:
+            await BaseCommand.router.on_message(event)
+        finally:
+            self.channel.notify("ack", update_id)
+
+    async def run(self: Self) -> None:
+        """Handle updates until the receiver says to stop."""
+        flusher = asyncio.create_task(self.activity.run())
+        self.channel.notify("ready")
+        try:
+            while (item := await self.channel.updates.get()) is not None:
+                update_id, update = item
+                await self.dispatcher.submit(
+                    update.chat_id,
+                    self._handle,
+                    (update_id, RemoteEvent(self.client, update)),
+                )
+            await self.dispatcher.close()
+            await BaseCommand.outbox.close()  # type: ignore[union-attr]
+        finally:
+            flusher.cancel()
+            await self.activity.flush()
+            await self.database.close()
+
+
+def run_worker(index: int, inbound: "Queue[Any]", outbound: "Queue[Any]") -> None:
+    """Entry point of a worker process.
+
+    Args:
+        index: Number of the worker.
+        inbound: Queue of the updates and call results sent by the receiver.
+        outbound: Queue of the acknowledgements and calls sent to the receiver.
+    """
+    env = Env()
+    env.read_env()
+
+    async def main() -> None:
+        channel = _Channel(index, inbound, outbound)
+        channel.start()
+        await Worker(index, channel, env).run()
+
+    logger.info(f"Worker {index} started")
+    asyncio.run(main())
@@ -1,43 +1,152 @@
-"""Restart on code changes."""
+"""Restart on code changes, or reload the changed commands in the running bot."""
 
+import argparse
 import os
 import subprocess
 import sys
+import threading
 import time
+from pathlib import Path
 from typing import Any
 
 from watchdog.events import FileSystemEvent, FileSystemEventHandler
 from watchdog.observers import Observer
 
+# Directory of the command modules, reloaded in place instead of restarting the bot
+COMMANDS_DIR = Path("telegram", "commands")
 
-class MyHandler(FileSystemEventHandler):  # type: ignore[misc]
-    def __init__(self, excluded_dir: list[str]) -> None:
+# Modules of the commands directory the rest of the bot is built on, changing them restarts it
+CORE_COMMAND_MODULES = frozenset({"__init__.py", "base.py", "router.py"})
+
+
+def command_module(path: Path) -> str | None:
+    """Return the name of the command module at ``path``, None if it isn't one.
+
+    Args:
+        path: Path of a changed file.
+
+    Returns
+    -------
+        The module name, e.g. ``telegram.commands.start``, or None
+    """
+    relative = Path(os.path.relpath(path))
+    if relative.parent != COMMANDS_DIR or relative.name in CORE_COMMAND_MODULES:
+        return None
+    return ".".join(relative.with_suffix("").parts)
+
+
+class MyHandler(FileSystemEventHandler):
+    def __init__(self, excluded_dir: list[str], debounce: float = 0.5, *, reload: bool = True) -> None:
         """Initialize the handler and start the main script process.
 
         Args:
             excluded_dir: A list of excluded directory names.
+            debounce: Seconds without further changes to wait before acting on the changes.
+            reload: Reload changed command modules in the running bot instead of restarting it.
         """
         self.process: subprocess.Popen[Any] | None = None
         self.excluded_directories = excluded_dir
+        self.debounce = debounce
+        self.reload = reload
+        self._changed: set[Path] = set()
+        self._timer: threading.Timer | None = None
+        # Guards the changes collected by the observer thread, and the process against overlapping batches
+        self._lock = threading.Lock()
+        self._process_lock = threading.Lock()
         self.start_process()
 
     def on_modified(self, event: FileSystemEvent) -> None:
         """Called when a file is modified in the watched directory.
 
+        Editors emit several events per save, so changes are batched until none came for ``debounce`` seconds.
+
+        Args:
+            event: An event object representing the file system event.
+        """
+        self.collect(event.src_path)
+
+    def on_created(self, event: FileSystemEvent) -> None:
+        """Called when a file is created in the watched directory.
+
+        Args:
+            event: An event object representing the file system event.
+        """
+        self.collect(event.src_path)
+
+    def on_deleted(self, event: FileSystemEvent) -> None:
+        """Called when a file is deleted in the watched directory, the commands of a deleted module are unrouted.
+
+        Args:
+            event: An event object representing the file system event.
+        """
+        self.collect(event.src_path)
+
+    def on_moved(self, event: FileSystemEvent) -> None:
+        """Called when a file is moved in the watched directory, as editors saving atomically do.
+
         Args:
             event: An event object representing the file system event.
         """
-        path_components = os.path.normpath(event.src_path).split(os.path.sep)
+        self.collect(event.dest_path)
+
+    def collect(self, src_path: str | bytes) -> None:
+        """Add a changed file to the batch and restart the debounce timer.
+
+        Args:
+            src_path: Path of the changed file.
+        """
+        path = os.fsdecode(src_path)
+        path_components = os.path.normpath(path).split(os.path.sep)
 
         # Check if the modified file is not in the excluded directories and has a .py extension
-        if all(directory not in path_components for directory in self.excluded_directories) and event.src_path.endswith(
-            ".py",
-        ):
-            self.restart_process()
+        if any(directory in path_components for directory in self.excluded_directories) or not path.endswith(".py"):
+            return
+        with self._lock:
+            self._changed.add(Path(path))
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self) -> None:
+        """Act on the batch of changes: reload them if they're all command modules, restart otherwise."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            self._timer = None
+        if not changed:
+            return
+        modules = [command_module(path) for path in changed]
+        with self._process_lock:
+            if self.reload and all(modules) and self.process is not None and self.process.poll() is None:
+                self.reload_modules(sorted(filter(None, modules)))
+            else:
+                self.restart_process()
 
     def start_process(self) -> None:
         """Start the main script process."""
-        self.process = subprocess.Popen([sys.executable, "main.py"])
+        if self.reload:
+            # The bot reads the names of the command modules to reload on its standard input
+            self.process = subprocess.Popen(
+                [sys.executable, "main.py"],
+                stdin=subprocess.PIPE,
+                text=True,
+                env={**os.environ, "HOT_RELOAD": "true"},
+            )
+        else:
+            self.process = subprocess.Popen([sys.executable, "main.py"])
+
+    def reload_modules(self, modules: list[str]) -> None:
+        """Ask the running bot to reload command modules, restarting it if it can't be reached.
+
+        Args:
+            modules: Names of the changed command modules.
+        """
+        try:
+            self.process.stdin.write(" ".join(modules) + "\n")  # type: ignore[union-attr]
+            self.process.stdin.flush()  # type: ignore[union-attr]
+        except (BrokenPipeError, OSError):
+            self.restart_process()
 
     def restart_process(self) -> None:
         """Terminate the main script process and start it again."""
@@ -48,11 +157,16 @@ class MyHandler(FileSystemEventHandler):  # type: ignore[misc]
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--debounce", type=float, default=0.5, help="seconds without changes before acting")
+    parser.add_argument("--restart-only", action="store_true", help="restart on every change, never reload")
+    args = parser.parse_args()
+
     included_directories: str = "."
     excluded_directories = ["migrations"]
 
     # Initialize the event handler with the excluded_directories list
-    event_handler = MyHandler(excluded_directories)
+    event_handler = MyHandler(excluded_directories, args.debounce, reload=not args.restart_only)
 
     # Start the Observer to watch for changes in the included_directories
     observer = Observer()